@@ -1,12 +1,18 @@
-from shared.db import engine, Base, SessionLocal
+import os
+
+from shared.db import SessionLocal, sync_schema
 from shared.models.user import User
 from shared.models.transaction import Transaction
 from shared.models.ml_model import MLModel
 from shared.models.prediction import Prediction
+from shared.models.task import Task
+from shared.models.user_summary import UserSummary
+from shared.summary import ensure_summaries
 from app.services.auth_service import get_password_hash
 
-# Создаём таблицы
-Base.metadata.create_all(bind=engine)
+# Создаём таблицы и сводки по уже накопленной истории
+sync_schema()
+ensure_summaries()
 
 # Инициализируем демо-данные
 db = SessionLocal()
@@ -20,7 +26,9 @@ if not admin:
 # Проверим, есть ли тестовая ML-модель
 model = db.query(MLModel).filter(MLModel.name == "Heart Failure Model").first()
 if not model:
-    model = MLModel(name="Heart Failure Model", description="Predict heart failure risk", price=10)
+    # лес скорится скомпилированным движком за доли миллисекунды — сразу в быстрый путь /predict
+    model = MLModel(name="Heart Failure Model", description="Predict heart failure risk", price=10,
+                    artifact_path=os.getenv("MODEL_PATH", "shared/ml_model/heart_failure.pkl"), is_cheap=True)
     db.add(model)
 
 db.commit()
@@ -1,35 +1,71 @@
-import os
-from datetime import timedelta
-from typing import List
+from datetime import datetime, timedelta
+from typing import Optional
 
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 
-from shared.db import get_db, Base, engine
-from shared.models.user import User
-from shared.models.transaction import Transaction
-from shared.models.ml_model import MLModel
+from shared.db import get_db, sync_schema
 from shared.models.prediction import Prediction
+from shared.models.task import TASK_DONE
+from shared.models.user import User
+from shared.ledger import InsufficientFunds
+from shared.summary import ensure_summaries
+from shared.queues import lane_for_rows
+from shared.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, registry as metrics_registry
+from shared.log import setup_logging
 
 from app.schemas.user import UserCreate, UserResponse
-from app.schemas.auth import Token
-from app.schemas.transaction import TransactionCreate, TransactionResponse
-from app.schemas.ml_task import PredictionRequest, PredictionResponse, PredictionRecord
-from app.services.user_service import create_user as create_user_row
-from app.services.transaction_service import create_transaction, get_transactions
+from app.schemas.auth import Token, AuthIdentity
+from app.schemas.task import TaskResponse
+from app.schemas.transaction import TransactionCreate, TransactionResponse, TransactionPage
+from app.schemas.ml_task import (
+    PredictionRequest,
+    PredictionResponse,
+    PredictionRecord,
+    PredictionPage,
+    BatchPredictionRequest,
+    BatchPredictionResponse,
+)
+from app.services.user_service import create_user_with_hash
+from app.services.transaction_service import create_transaction, get_transactions_page
+from app.services.prediction_service import get_predictions_page
+from app.services.export_service import MEDIA_TYPES, export_filename, export_history
+from app.services.task_service import get_task, find_task_id
+from app.services.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 from app.services.auth_service import (
     authenticate_user,
     create_access_token,
     get_current_user,
-    get_password_hash,
+    get_current_identity,
 )
-from app.services.ml_task_service import send_task_to_queue
+from app.services.ml_task_service import (
+    send_task_to_queue,
+    send_batch_task_to_queue,
+    split_valid_rows,
+    complete_task_inline,
+    transport_stats,
+    lane_stats,
+)
+from app.services.publisher import PublisherOverloaded
+from app.services.transport import close_transport, get_transport
+from app.services.admission import AdmissionRejected, admit, admission_stats
+from app.services.model_service import ModelInfo, get_model
+from app.services.fast_path import fast_path
+from app.services.password_service import PasswordPoolBusy, hash_password_async, hasher_pool, password_pool_stats
+from app.services.notifications import hub
+from app.services.metrics import MetricsMiddleware
 from app.routes.web_routes import web_router
 
+# логи — JSON в stdout из фонового потока (LOG_FORMAT, LOG_TASK_SAMPLE_RATE)
+setup_logging()
+
 # Создание таблиц (на случай, если init не был вызван)
-Base.metadata.create_all(bind=engine)
+sync_schema()
+ensure_summaries()
 
 app = FastAPI(title="ML Service")
 
@@ -42,20 +78,74 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# снаружи CORS: время запроса считается вместе со всеми middleware
+app.add_middleware(MetricsMiddleware)
+
+
+@app.on_event("shutdown")
+def shutdown_transport():
+    close_transport()
+
+
+@app.on_event("startup")
+def warm_fast_path():
+    fast_path.warm()
+
+
+@app.on_event("shutdown")
+def shutdown_fast_path():
+    fast_path.shutdown()
+
+
+@app.on_event("shutdown")
+def shutdown_password_pool():
+    hasher_pool.shutdown()
+
+
+@app.on_event("shutdown")
+def shutdown_notifications():
+    hub.close()
+
+
+@app.exception_handler(PublisherOverloaded)
+def publisher_overloaded_handler(request: Request, exc: PublisherOverloaded):
+    return JSONResponse({"detail": "Task queue is overloaded, try again later"}, status_code=503, headers={"Retry-After": "1"})
+
+
+@app.exception_handler(AdmissionRejected)
+def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return JSONResponse({"detail": exc.reason}, status_code=429, headers={"Retry-After": exc.retry_after_header})
+
+
+@app.exception_handler(InsufficientFunds)
+def insufficient_funds_handler(request: Request, exc: InsufficientFunds):
+    # резерв не взят: параллельные задачи уже заняли доступные средства
+    return JSONResponse({"detail": "Insufficient balance"}, status_code=400)
+
+
+@app.exception_handler(PasswordPoolBusy)
+def password_pool_busy_handler(request: Request, exc: PasswordPoolBusy):
+    return JSONResponse({"detail": "Too many login attempts in progress, try again later"}, status_code=503, headers={"Retry-After": "1"})
+
 
 # --------- AUTH ---------
 @app.post("/register", response_model=UserResponse)
-def register(user: UserCreate, db: Session = Depends(get_db)):
-    existing = db.query(User).filter((User.username == user.username) | (User.email == user.email)).first()
+async def register(user: UserCreate, db: Session = Depends(get_db)):
+    existing = await run_in_threadpool(
+        lambda: db.query(User.id).filter((User.username == user.username) | (User.email == user.email)).first()
+    )
     if existing:
         raise HTTPException(status_code=400, detail="User already exists")
-    row = create_user_row(db=db, username=user.username, email=user.email, password=user.password)
+    password_hash = await hash_password_async(user.password)
+    row = await run_in_threadpool(
+        create_user_with_hash, db, username=user.username, email=user.email, password_hash=password_hash
+    )
     return UserResponse.from_orm(row)
 
 
 @app.post("/token", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = authenticate_user(db, form_data.username, form_data.password)
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
     access = create_access_token(data={"sub": user.username}, expires_delta=timedelta(minutes=60))
@@ -68,7 +158,7 @@ def me(current_user: User = Depends(get_current_user)):
 
 # --------- TRANSACTIONS ---------
 @app.post("/transactions/deposit", response_model=TransactionResponse)
-def deposit(tx: TransactionCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def deposit(tx: TransactionCreate, db: Session = Depends(get_db), current_user: AuthIdentity = Depends(get_current_identity)):
     if tx.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Forbidden")
     if tx.amount <= 0:
@@ -79,68 +169,203 @@ def deposit(tx: TransactionCreate, db: Session = Depends(get_db), current_user:
     return TransactionResponse.from_orm(tr)
 
 
-@app.get("/transactions/{user_id}", response_model=List[TransactionResponse])
+@app.get("/transactions/{user_id}", response_model=TransactionPage)
 def list_transactions(
     user_id: int,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    before_id: Optional[int] = None,
+    after_created_at: Optional[datetime] = None,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: AuthIdentity = Depends(get_current_identity),
 ):
     if user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Forbidden")
-    rows = get_transactions(db, user_id)
-    return [TransactionResponse.from_orm(r) for r in rows]
+    rows, cursor = get_transactions_page(db, user_id, limit, before_id, after_created_at)
+    return TransactionPage(items=[TransactionResponse.from_orm(r) for r in rows], next_cursor=cursor)
+
+
+def _export(kind: str, user_id: int, format: str, gzip: bool, current_user: AuthIdentity) -> StreamingResponse:
+    if user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    filename = export_filename(kind, user_id, format, gzip)
+    return StreamingResponse(
+        export_history(kind, user_id, format, gzip),
+        media_type="application/gzip" if gzip else MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.get("/transactions/{user_id}/export")
+def export_transactions(
+    user_id: int,
+    format: str = Query("csv", regex="^(csv|ndjson)$"),
+    gzip: bool = False,
+    current_user: AuthIdentity = Depends(get_current_identity),
+):
+    """Вся история транзакций потоком (CSV или NDJSON, по желанию в gzip), от новых к старым."""
+    return _export("transactions", user_id, format, gzip, current_user)
 
 # --------- PREDICTIONS ---------
-def _get_model_price(db: Session, model_id: int) -> float:
-    model = db.query(MLModel).filter(MLModel.id == model_id).first()
+def _get_model_or_404(db: Session, model_id: int) -> ModelInfo:
+    model = get_model(db, model_id)
     if not model:
         raise HTTPException(status_code=404, detail="Model not found")
-    return float(model.price or 0.0)
+    return model
+
+
+def _completed_or_400(db: Session, task_id: str, user_id: int) -> Optional[str]:
+    """Транспорт inline уже выполнил задачу: её предсказание или 400 с ошибкой задачи."""
+    db.expire_all()
+    task = get_task(db, task_id, user_id)
+    if task is None or task.status != TASK_DONE:
+        error = (task.error if task is not None else None) or "Prediction failed"
+        raise HTTPException(status_code=400, detail=error)
+    prediction = db.get(Prediction, task.prediction_id) if task.prediction_id else None
+    return prediction.prediction if prediction is not None else None
 
 
 @app.post("/predict", response_model=PredictionResponse)
-def predict(req: PredictionRequest, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def predict(
+    req: PredictionRequest,
+    current_user: AuthIdentity = Depends(get_current_identity),
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+):
     if req.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Forbidden")
+    admit(current_user.id)
 
-    price = _get_model_price(db, req.model_id)
+    model = _get_model_or_404(db, req.model_id)
+    price = model.price
 
-    # Проверка баланса перед постановкой задачи
-    user = db.query(User).filter(User.id == req.user_id).with_for_update(read=False).first()
-    if not user:
+    # Быстрая проверка без блокировки; атомарно средства резервируются при постановке (_enqueue).
+    # Параллельный повтор с тем же ключом отсекает уникальный индекс tasks
+    balance = db.query(User.balance - User.reserved).filter(User.id == req.user_id).scalar()
+    if balance is None:
         raise HTTPException(status_code=404, detail="User not found")
-    if user.balance < price:
+    existing = find_task_id(db, req.user_id, idempotency_key)
+    if existing:
+        return PredictionResponse(message="Task already accepted", task_id=existing)
+    if balance < price:
         raise HTTPException(status_code=400, detail="Insufficient balance")
 
-    # TEST_MODE: имитируем мгновенный предикт и списание
-    if os.getenv("TEST_MODE", "0") == "1":
-        pred = Prediction(user_id=req.user_id, model_id=req.model_id, prediction="0.42", cost=price)
-        db.add(pred)
+    # дешёвая модель считается прямо в запросе (в пределах бюджета), остальное — через очередь
+    value = fast_path.score(model, req.input_data)
+    if value is not None:
+        done = complete_task_inline(
+            db,
+            user_id=req.user_id,
+            model_id=req.model_id,
+            input_data=req.input_data,
+            price=price,
+            value=value,
+            idempotency_key=idempotency_key,
+        )
+        if done is not None:
+            task_id, prediction = done
+            message = "Prediction completed" if prediction is not None else "Task already accepted"
+            return PredictionResponse(message=message, task_id=task_id, prediction=prediction)
 
-        # списание
-        user.balance -= price
-        tx = Transaction(user_id=req.user_id, amount=price, type="withdraw")
-        db.add(tx)
+    # задача уходит в транспорт (TASK_TRANSPORT); inline выполняет её прямо здесь
+    task_id = send_task_to_queue(
+        db,
+        user_id=req.user_id,
+        model_id=req.model_id,
+        input_data=req.input_data,
+        price=price,
+        idempotency_key=idempotency_key,
+    )
+    if get_transport().synchronous:
+        prediction = _completed_or_400(db, task_id, req.user_id)
+        return PredictionResponse(message="Prediction completed", task_id=task_id, prediction=prediction)
+    return PredictionResponse(message="Task accepted", task_id=task_id)
 
-        db.commit()
-        return PredictionResponse(message="Prediction completed (TEST_MODE)")
+@app.post("/predict/batch", response_model=BatchPredictionResponse)
+def predict_batch(
+    req: BatchPredictionRequest,
+    current_user: AuthIdentity = Depends(get_current_identity),
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+):
+    if req.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    admit(current_user.id, lane_for_rows(len(req.rows)))
 
-    # боевой путь — отправляем задачу в очередь
-    send_task_to_queue(user_id=req.user_id, model_id=req.model_id, input_data=req.input_data, price=price)
-    return PredictionResponse(message="Task accepted")
+    price = _get_model_or_404(db, req.model_id).price
+    rows, rejected = split_valid_rows(req.rows)
+    if not rows:
+        raise HTTPException(status_code=400, detail="No valid rows")
+    cost = price * len(rows)
+
+    # Баланс проверяется на весь пакет сразу: либо оплачиваются все строки, либо ни одной
+    balance = db.query(User.balance - User.reserved).filter(User.id == req.user_id).scalar()
+    if balance is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    existing = find_task_id(db, req.user_id, idempotency_key)
+    if existing:
+        return BatchPredictionResponse(
+            message="Batch already accepted", accepted=len(rows), rejected=rejected, cost=cost, task_id=existing
+        )
+    if balance < cost:
+        raise HTTPException(status_code=400, detail="Insufficient balance")
 
-@app.get("/predictions/{user_id}", response_model=List[PredictionRecord])
+    task_id = send_batch_task_to_queue(
+        db, user_id=req.user_id, model_id=req.model_id, rows=rows, price=price, idempotency_key=idempotency_key
+    )
+    message = "Batch accepted"
+    if get_transport().synchronous:
+        _completed_or_400(db, task_id, req.user_id)
+        message = "Batch completed"
+    return BatchPredictionResponse(message=message, accepted=len(rows), rejected=rejected, cost=cost, task_id=task_id)
+
+
+@app.get("/tasks/{task_id}", response_model=TaskResponse)
+def task_status(task_id: str, db: Session = Depends(get_db), current_user: AuthIdentity = Depends(get_current_identity)):
+    # чужие задачи неотличимы от несуществующих
+    task = get_task(db, task_id, current_user.id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return TaskResponse.from_orm(task)
+
+
+@app.get("/predictions/{user_id}", response_model=PredictionPage)
 def predictions(
     user_id: int,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    before_id: Optional[int] = None,
+    after_created_at: Optional[datetime] = None,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: AuthIdentity = Depends(get_current_identity),
 ):
     if user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Forbidden")
-    rows = (
-        db.query(Prediction)
-        .filter(Prediction.user_id == user_id)
-        .order_by(Prediction.created_at.desc())
-        .all()
-    )
-    return [PredictionRecord.from_orm(r) for r in rows]
+    rows, cursor = get_predictions_page(db, user_id, limit, before_id, after_created_at)
+    return PredictionPage(items=[PredictionRecord.from_orm(r) for r in rows], next_cursor=cursor)
+
+
+@app.get("/predictions/{user_id}/export")
+def export_predictions(
+    user_id: int,
+    format: str = Query("csv", regex="^(csv|ndjson)$"),
+    gzip: bool = False,
+    current_user: AuthIdentity = Depends(get_current_identity),
+):
+    """Вся история предсказаний потоком (CSV или NDJSON, по желанию в gzip), от новых к старым."""
+    return _export("predictions", user_id, format, gzip, current_user)
+
+
+# --------- QUEUE ---------
+@app.get("/queue/stats")
+def queue_stats(current_user: AuthIdentity = Depends(get_current_identity)):
+    return {**transport_stats(), "lanes": lane_stats(), "admission": admission_stats(), "fast_path": fast_path.stats()}
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Метрики процесса API в текстовом формате Prometheus (без авторизации — для scrape)."""
+    return Response(metrics_registry.render(), headers={"Content-Type": METRICS_CONTENT_TYPE})
+
+
+@app.get("/auth/stats")
+def auth_stats(current_user: AuthIdentity = Depends(get_current_identity)):
+    return password_pool_stats()
@@ -1,51 +1,78 @@
-from typing import Dict, Tuple
+from typing import Dict, Optional, Tuple
+import asyncio
+import json
 import os
 
-from fastapi import APIRouter, Request, Depends, Form, status
-from fastapi.responses import RedirectResponse, JSONResponse
+from fastapi import APIRouter, Request, Depends, Form, Header, Query, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse, JSONResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 
-from app.services.auth_service import get_db, authenticate_user, create_access_token
-from app.services.user_service import create_user as create_user_row
-from app.services.transaction_service import get_transactions, create_transaction
-from app.services.ml_task_service import send_task_to_queue
+from app.schemas.auth import AuthIdentity
+from app.services.auth_service import get_db, authenticate_user, create_access_token, resolve_identity, invalidate_token
+from app.services.user_service import create_user_with_hash
+from app.services.password_service import hash_password_async
+from app.services.transaction_service import create_transaction, get_transactions_page
+from app.services.prediction_service import get_predictions_page
+from app.services.model_service import get_model, list_models
+from app.services.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.services.ml_task_service import complete_task_inline, send_task_to_queue
+from app.services.fast_path import fast_path
+from app.services.notifications import hub
+from app.services.admission import AdmissionRejected, admit
+from app.services.task_service import find_task_id, get_task
+from app.services.transport import get_transport
+from shared.db import SessionLocal
+from shared.ledger import InsufficientFunds
+from shared.summary import get_summary
 from shared.models.user import User
 from shared.models.prediction import Prediction
 from shared.models.transaction import Transaction
-from shared.models.ml_model import MLModel
 
 templates = Jinja2Templates(directory="app/templates")
 web_router = APIRouter()
 
+# SSE: комментарий-пинг раз в N секунд держит соединение живым через прокси
+SSE_HEARTBEAT = float(os.getenv("SSE_HEARTBEAT", "15"))
+SSE_RETRY_MS = int(os.getenv("SSE_RETRY_MS", "3000"))
+# сколько последних транзакций/предсказаний рендерится сразу
+DASHBOARD_RECENT = int(os.getenv("DASHBOARD_RECENT", "20"))
+
 # ---------------- helpers ----------------
 
-def current_user_by_cookie(db: Session, request: Request) -> User | None:
+def current_identity_by_cookie(db: Session, request: Request) -> AuthIdentity | None:
     token = request.cookies.get("access_token")
     if not token:
         return None
-    from jose import jwt, JWTError
-    from app.services.auth_service import SECRET_KEY, ALGORITHM
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        if not username:
-            return None
-        return db.query(User).filter(User.username == username).first()
-    except JWTError:
+    return resolve_identity(db, token)
+
+
+def current_user_by_cookie(db: Session, request: Request) -> User | None:
+    identity = current_identity_by_cookie(db, request)
+    if identity is None:
         return None
+    return db.query(User).filter(User.id == identity.id).first()
 
 
 def _render_dashboard(request: Request, db: Session, user: User, **extra):
-    txs = get_transactions(db, user.id)
-    preds = (
-        db.query(Prediction)
-        .filter(Prediction.user_id == user.id)
-        .order_by(Prediction.created_at.desc())
-        .all()
-    )
-    models = db.query(MLModel).all()
-    ctx = {"request": request, "user": user, "transactions": txs, "predictions": preds, "models": models}
+    """
+    Сводка (счётчики и суммы) — одна строка user_summaries, история — только
+    последние DASHBOARD_RECENT записей; более старые страницы JS подгружает
+    через /web/history/* по курсору.
+    """
+    txs, tx_cursor = get_transactions_page(db, user.id, DASHBOARD_RECENT)
+    preds, pred_cursor = get_predictions_page(db, user.id, DASHBOARD_RECENT)
+    ctx = {
+        "request": request,
+        "user": user,
+        "summary": get_summary(db, user.id),
+        "transactions": txs,
+        "transactions_cursor": tx_cursor,
+        "predictions": preds,
+        "predictions_cursor": pred_cursor,
+        "models": list_models(db),
+    }
     ctx.update(extra)
     return templates.TemplateResponse("dashboard.html", ctx)
 
@@ -59,25 +86,6 @@ def _split_valid_invalid(records: Dict):
             invalid[k] = v
     return valid, invalid
 
-# локальная линейная «модель» для TEST_MODE=1
-FEATURE_ORDER = [s.strip() for s in os.getenv("FEATURE_ORDER", "feature1,feature2,feature3").split(",") if s.strip()]
-try:
-    WEIGHTS = [float(s.strip()) for s in os.getenv("WEIGHTS", "0.7,0.2,0.1").split(",") if s.strip()]
-except ValueError:
-    WEIGHTS = [0.7, 0.2, 0.1]
-BIAS = float(os.getenv("BIAS", "0.0"))
-if len(WEIGHTS) < len(FEATURE_ORDER):
-    WEIGHTS = WEIGHTS + [0.0] * (len(FEATURE_ORDER) - len(WEIGHTS))
-elif len(WEIGHTS) > len(FEATURE_ORDER):
-    WEIGHTS = WEIGHTS[: len(FEATURE_ORDER)]
-
-
-def _linear_predict(valid_input: Dict[str, float]) -> float:
-    total = BIAS
-    for name, w in zip(FEATURE_ORDER, WEIGHTS):
-        total += float(valid_input.get(name, 0.0)) * w
-    return total
-
 # ---------------- routes ----------------
 
 @web_router.get("/")
@@ -89,8 +97,9 @@ def register_form(request: Request):
     return templates.TemplateResponse("register.html", {"request": request})
 
 @web_router.post("/register")
-def register(request: Request, username: str = Form(...), email: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
-    create_user_row(db, username=username, email=email, password=password)
+async def register(request: Request, username: str = Form(...), email: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
+    password_hash = await hash_password_async(password)
+    await run_in_threadpool(create_user_with_hash, db, username=username, email=email, password_hash=password_hash)
     return RedirectResponse(url="/web/login", status_code=status.HTTP_302_FOUND)
 
 @web_router.get("/login")
@@ -98,8 +107,8 @@ def login_form(request: Request):
     return templates.TemplateResponse("login.html", {"request": request})
 
 @web_router.post("/login")
-def login(request: Request, username: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
-    user = authenticate_user(db, username, password)
+async def login(request: Request, username: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
+    user = await authenticate_user(db, username, password)
     if not user:
         return templates.TemplateResponse("login.html", {"request": request, "error_message": "Неверные логин или пароль"}, status_code=400)
     token = create_access_token({"sub": user.username})
@@ -108,8 +117,11 @@ def login(request: Request, username: str = Form(...), password: str = Form(...)
     return resp
 
 @web_router.get("/logout")
-def logout():
+def logout(request: Request):
     """Удаляем cookie авторизации и отправляем на форму входа."""
+    token = request.cookies.get("access_token")
+    if token:
+        invalidate_token(token)
     resp = RedirectResponse(url="/web/login", status_code=status.HTTP_302_FOUND)
     resp.delete_cookie("access_token")
     return resp
@@ -132,7 +144,8 @@ def deposit(request: Request, amount: float = Form(...), db: Session = Depends(g
     return _render_dashboard(request, db, user, info_message="Баланс успешно пополнен")
 
 @web_router.post("/predict")
-def predict_from_form(request: Request, model_id: int = Form(...), feature1: float = Form(...), feature2: float = Form(...), feature3: float = Form(...), db: Session = Depends(get_db)):
+def predict_from_form(request: Request, model_id: int = Form(...), feature1: float = Form(...), feature2: float = Form(...), feature3: float = Form(...), db: Session = Depends(get_db),
+                      idempotency_key: str | None = Header(None, alias="Idempotency-Key", max_length=255)):
     """
     Если запрос пришёл из JS (Accept: application/json или ?ajax=1) — возвращаем JSON.
     Иначе ведём себя как раньше: рендерим дашборд.
@@ -143,14 +156,28 @@ def predict_from_form(request: Request, model_id: int = Form(...), feature1: flo
             return JSONResponse({"detail": "Unauthorized"}, status_code=401)
         return RedirectResponse("/web/login", status_code=status.HTTP_302_FOUND)
 
-    model = db.query(MLModel).filter(MLModel.id == model_id).first()
+    try:
+        admit(user.id)
+    except AdmissionRejected as e:
+        if request.headers.get("accept") == "application/json" or request.query_params.get("ajax") == "1":
+            return JSONResponse({"detail": "Слишком много запросов, попробуйте позже"}, status_code=429, headers={"Retry-After": e.retry_after_header})
+        return _render_dashboard(request, db, user, error_message="Слишком много запросов, попробуйте позже")
+
+    model = get_model(db, model_id)
     if not model:
         if request.headers.get("accept") == "application/json" or request.query_params.get("ajax") == "1":
             return JSONResponse({"detail": "Модель не найдена"}, status_code=404)
         return _render_dashboard(request, db, user, error_message="Модель не найдена")
 
-    price = float(model.price or 0.0)
-    if user.balance < price:
+    existing = find_task_id(db, user.id, idempotency_key)
+    if existing:
+        # повторная отправка той же формы (JS повторяет запрос с тем же ключом)
+        if request.headers.get("accept") == "application/json" or request.query_params.get("ajax") == "1":
+            return JSONResponse({"status": "duplicate", "task_id": existing})
+        return _render_dashboard(request, db, user, info_message="Этот запрос уже принят")
+
+    price = model.price
+    if user.balance - (user.reserved or 0.0) < price:
         if request.headers.get("accept") == "application/json" or request.query_params.get("ajax") == "1":
             return JSONResponse({"detail": "Недостаточно кредитов для предсказания"}, status_code=400)
         return _render_dashboard(request, db, user, error_message="Недостаточно кредитов для предсказания")
@@ -158,50 +185,71 @@ def predict_from_form(request: Request, model_id: int = Form(...), feature1: flo
     input_data = {"feature1": float(feature1), "feature2": float(feature2), "feature3": float(feature3)}
     valid, invalid = _split_valid_invalid(input_data)
 
-    test_mode = os.getenv("TEST_MODE", "0") == "1"
     is_ajax = request.headers.get("accept") == "application/json" or request.query_params.get("ajax") == "1"
 
-    if test_mode:
-        # синхронный расчёт — вернём результат сразу
-        y = _linear_predict(valid)
-        prediction_value = f"{y:.4f}"
-        user.balance -= price
-        db.add(Transaction(user_id=user.id, amount=price, type="withdraw"))
-        db.add(Prediction(user_id=user.id, model_id=model_id, prediction=prediction_value, cost=price))
-        db.commit()
+    # дешёвая модель считается прямо в запросе; остальное уходит в транспорт (TASK_TRANSPORT),
+    # а inline выполняет задачу прямо здесь
+    try:
+        value = fast_path.score(model, valid)
+        done = None
+        if value is not None:
+            done = complete_task_inline(db, user_id=user.id, model_id=model_id, input_data=valid, price=price, value=value, idempotency_key=idempotency_key)
+        if done is not None:
+            task_id = done[0]
+        else:
+            task_id = send_task_to_queue(db, user_id=user.id, model_id=model_id, input_data=valid, price=price, idempotency_key=idempotency_key)
+    except InsufficientFunds:
+        # средства уже зарезервированы под задачи в очереди
         if is_ajax:
-            return JSONResponse({"status": "ok", "mode": "test", "prediction": prediction_value, "invalid": invalid or None, "balance": float(user.balance)})
-        return _render_dashboard(request, db, user, info_message="Предсказание выполнено (TEST_MODE)", result={"prediction": prediction_value}, invalid_records=invalid or None)
+            return JSONResponse({"detail": "Недостаточно кредитов для предсказания"}, status_code=400)
+        return _render_dashboard(request, db, user, error_message="Недостаточно кредитов для предсказания")
+
+    if done is not None or get_transport().synchronous:
+        # результат уже в БД — вернём его сразу
+        task = get_task(db, task_id, user.id)
+        prediction = db.get(Prediction, task.prediction_id) if task is not None and task.prediction_id else None
+        if prediction is None:
+            error = (task.error if task is not None else None) or "Не удалось выполнить предсказание"
+            if is_ajax:
+                return JSONResponse({"detail": error}, status_code=400)
+            return _render_dashboard(request, db, user, error_message=error)
+        db.refresh(user)
+        if is_ajax:
+            return JSONResponse({"status": "ok", "mode": "inline", "prediction": prediction.prediction, "invalid": invalid or None, "balance": user.balance})
+        return _render_dashboard(request, db, user, info_message="Предсказание выполнено", result={"prediction": prediction.prediction}, invalid_records=invalid or None)
 
-    # асинхронно — ставим задачу в очередь и отвечаем, что приняли
-    send_task_to_queue(user_id=user.id, model_id=model_id, input_data=valid, price=price)
     if is_ajax:
-        return JSONResponse({"status": "accepted", "mode": "async"})
+        return JSONResponse({"status": "accepted", "mode": "async", "task_id": task_id})
     return _render_dashboard(request, db, user, info_message="Задача отправлена на обработку. Результат появится в истории предсказаний.", invalid_records=invalid or None)
 
-# -------- polling endpoint used ТОЛЬКО после отправки формы --------
-@web_router.get("/poll")
-def poll(request: Request, db: Session = Depends(get_db)):
-    user = current_user_by_cookie(db, request)
-    if not user:
-        return JSONResponse({"authenticated": False}, status_code=401)
+def _run_with_session(fn, *args):
+    """Для долгоживущих (SSE) запросов: сессия берётся только на время одного обращения к БД."""
+    db = SessionLocal()
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+
+
+def _poll_snapshot(db: Session, user_id: int) -> dict:
+    balance = db.query(User.balance).filter(User.id == user_id).scalar()
 
     last_pred = (
         db.query(Prediction)
-        .filter(Prediction.user_id == user.id)
+        .filter(Prediction.user_id == user_id)
         .order_by(Prediction.id.desc())
         .first()
     )
     last_tx = (
         db.query(Transaction)
-        .filter(Transaction.user_id == user.id)
+        .filter(Transaction.user_id == user_id)
         .order_by(Transaction.id.desc())
         .first()
     )
     # отдадим короткое резюме и данные для «без‑reload» вставки новой строки
-    return JSONResponse({
+    return {
         "authenticated": True,
-        "balance": float(user.balance or 0.0),
+        "balance": float(balance or 0.0),
         "last_prediction": {
             "id": int(last_pred.id) if last_pred else 0,
             "model_id": int(last_pred.model_id) if last_pred else None,
@@ -215,4 +263,85 @@ def poll(request: Request, db: Session = Depends(get_db)):
             "amount": float(last_tx.amount) if last_tx else None,
             "created_at": str(last_tx.created_at) if last_tx else None,
         } if last_tx else None,
-    })
+    }
+
+
+# -------- push-доставка результатов (Server-Sent Events) --------
+@web_router.get("/events")
+async def events(request: Request):
+    """
+    Поток событий update со снимком как у /web/poll. Событие отправляется,
+    когда воркер закоммитил предсказание (pg_notify); в простое — только пинги.
+    204, если push недоступен (не Postgres) — JS тогда опрашивает /web/poll.
+    """
+    if not hub.available:
+        return Response(status_code=204)
+    identity = await run_in_threadpool(_run_with_session, current_identity_by_cookie, request)
+    if not identity:
+        return JSONResponse({"authenticated": False}, status_code=401)
+
+    async def stream():
+        queue = hub.subscribe(identity.id)
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            while True:
+                try:
+                    await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                while not queue.empty():
+                    queue.get_nowait()  # несколько коммитов подряд — один снимок
+                snapshot = await run_in_threadpool(_run_with_session, _poll_snapshot, identity.id)
+                yield f"event: update\ndata: {json.dumps(snapshot)}\n\n"
+        finally:
+            hub.unsubscribe(identity.id, queue)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(stream(), media_type="text/event-stream", headers=headers)
+
+
+# -------- polling endpoint: запасной вариант, если EventSource недоступен --------
+@web_router.get("/poll")
+def poll(request: Request, db: Session = Depends(get_db)):
+    user = current_identity_by_cookie(db, request)
+    if not user:
+        return JSONResponse({"authenticated": False}, status_code=401)
+    return JSONResponse(_poll_snapshot(db, user.id))
+
+
+# -------- старые страницы истории для дашборда (по курсору, как /predictions и /transactions) --------
+def _history_page(request: Request, db: Session, fetch, serialize, before_id: Optional[int], limit: int):
+    user = current_identity_by_cookie(db, request)
+    if not user:
+        return JSONResponse({"authenticated": False}, status_code=401)
+    rows, cursor = fetch(db, user.id, limit, before_id)
+    return JSONResponse({"items": [serialize(r) for r in rows], "next_cursor": cursor})
+
+
+@web_router.get("/history/predictions")
+def history_predictions(
+    request: Request,
+    before_id: Optional[int] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+):
+    return _history_page(
+        request, db, get_predictions_page,
+        lambda p: {"id": p.id, "model_id": p.model_id, "prediction": p.prediction, "cost": float(p.cost or 0.0), "created_at": str(p.created_at)},
+        before_id, limit,
+    )
+
+
+@web_router.get("/history/transactions")
+def history_transactions(
+    request: Request,
+    before_id: Optional[int] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+):
+    return _history_page(
+        request, db, get_transactions_page,
+        lambda t: {"id": t.id, "type": t.type, "amount": float(t.amount or 0.0), "created_at": str(t.created_at)},
+        before_id, limit,
+    )
@@ -7,6 +7,11 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     username: str | None = None
 
+class AuthIdentity(BaseModel):
+    """Кто делает запрос — без баланса, его читают только эндпоинты, которым он нужен."""
+    id: int
+    username: str
+
 class LoginRequest(BaseModel):
     username: str
     password: str
@@ -1,5 +1,10 @@
+import os
 from datetime import datetime
-from pydantic import BaseModel
+from typing import List, Optional
+
+from pydantic import BaseModel, conlist
+
+BATCH_MAX_ROWS = int(os.getenv("BATCH_MAX_ROWS", "10000"))
 
 class PredictionRequest(BaseModel):
     user_id: int
@@ -8,6 +13,20 @@ class PredictionRequest(BaseModel):
 
 class PredictionResponse(BaseModel):
     message: str
+    task_id: Optional[str] = None  # статус — GET /tasks/{task_id}
+    prediction: Optional[str] = None  # результат, если модель посчитана прямо в запросе
+
+class BatchPredictionRequest(BaseModel):
+    user_id: int
+    model_id: int
+    rows: conlist(dict, min_items=1, max_items=BATCH_MAX_ROWS)
+
+class BatchPredictionResponse(BaseModel):
+    message: str
+    accepted: int
+    rejected: int
+    cost: float
+    task_id: Optional[str] = None
 
 class PredictionRecord(BaseModel):
     id: int
@@ -18,3 +37,7 @@ class PredictionRecord(BaseModel):
 
     class Config:
         orm_mode = True
+
+class PredictionPage(BaseModel):
+    items: List[PredictionRecord]
+    next_cursor: Optional[int] = None  # before_id следующей страницы
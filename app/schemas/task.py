@@ -0,0 +1,19 @@
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel
+
+class TaskResponse(BaseModel):
+    id: str
+    user_id: int
+    model_id: int
+    status: str  # queued / running / done / failed
+    n_rows: int
+    prediction_id: Optional[int] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
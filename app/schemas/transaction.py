@@ -1,4 +1,6 @@
 from datetime import datetime
+from typing import List, Optional
+
 from pydantic import BaseModel
 
 class TransactionBase(BaseModel):
@@ -15,3 +17,7 @@ class TransactionResponse(TransactionBase):
 
     class Config:
         orm_mode = True
+
+class TransactionPage(BaseModel):
+    items: List[TransactionResponse]
+    next_cursor: Optional[int] = None  # before_id следующей страницы
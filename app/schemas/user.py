@@ -10,6 +10,7 @@ class UserCreate(UserBase):
 class UserResponse(UserBase):
     id: int
     balance: float
+    reserved: float = 0.0  # под задачи в очереди
 
     class Config:
         orm_mode = True
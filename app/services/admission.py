@@ -0,0 +1,109 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+from app.services.ml_task_service import queue_pressure
+from shared.queues import LANE_INTERACTIVE
+
+# токенов в секунду на пользователя и размер «запаса»; RATE_LIMIT_PER_SEC=0 — без ограничения
+RATE_LIMIT_PER_SEC = float(os.getenv("RATE_LIMIT_PER_SEC", "5"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "20"))
+RATE_LIMIT_MAX_USERS = int(os.getenv("RATE_LIMIT_MAX_USERS", "100000"))
+# глубина очереди полосы, после которой новые задачи в неё не принимаются; 0 — не проверять
+QUEUE_MAX_DEPTH = int(os.getenv("QUEUE_MAX_DEPTH", "100000"))
+QUEUE_FULL_RETRY_AFTER = float(os.getenv("QUEUE_FULL_RETRY_AFTER", "5"))
+
+
+class AdmissionRejected(Exception):
+    """Запрос не принят: превышен лимит пользователя или очередь переполнена (429)."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class RateLimiter:
+    """Token bucket на пользователя в памяти процесса; давно неактивные вытесняются (LRU)."""
+
+    def __init__(self, rate: float, burst: float, max_users: int = RATE_LIMIT_MAX_USERS):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_users = max(1, max_users)
+        self._buckets: "OrderedDict[int, Tuple[float, float]]" = OrderedDict()  # user_id -> (tokens, updated_at)
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def acquire(self, user_id: int, cost: float = 1.0) -> Optional[float]:
+        """None — токен выдан, иначе через сколько секунд их станет достаточно."""
+        if self.rate <= 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(user_id, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= cost:
+                self._buckets[user_id] = (tokens - cost, now)
+                wait = None
+            else:
+                self._buckets[user_id] = (tokens, now)
+                self.rejected += 1
+                wait = (cost - tokens) / self.rate
+            self._buckets.move_to_end(user_id)
+            while len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class AdmissionController:
+    """
+    Глобальный предохранитель: не принимать задачи, если очередь полосы уже глубже
+    max_depth или брокер заблокировал публикацию (memory/disk alarm).
+    Глубину и флаг блокировки сообщает паблишер (пассивный queue_declare раз в интервал).
+    Полосы проверяются отдельно: очередь batch-бэкфилла не отказывает интерактивным запросам.
+    """
+
+    def __init__(self, probe: Callable[[str], Tuple[Optional[int], bool]], max_depth: int = QUEUE_MAX_DEPTH):
+        self._probe = probe
+        self.max_depth = max_depth
+        self.rejected = 0
+
+    def check(self, lane: str = LANE_INTERACTIVE) -> None:
+        depth, blocked = self._probe(lane)
+        if blocked:
+            reason = "message broker is blocking publishers"
+        elif self.max_depth > 0 and depth is not None and depth >= self.max_depth:
+            reason = f"{lane} task queue is full ({depth} messages)"
+        else:
+            return
+        self.rejected += 1
+        raise AdmissionRejected(reason, QUEUE_FULL_RETRY_AFTER)
+
+
+rate_limiter = RateLimiter(RATE_LIMIT_PER_SEC, RATE_LIMIT_BURST)
+admission_controller = AdmissionController(queue_pressure)
+
+
+def admit(user_id: int, lane: str = LANE_INTERACTIVE) -> None:
+    """Вызывается до любой работы в /predict*: сначала лимит пользователя, затем состояние очереди полосы."""
+    wait = rate_limiter.acquire(user_id)
+    if wait is not None:
+        raise AdmissionRejected("rate limit exceeded", wait)
+    admission_controller.check(lane)
+
+
+def admission_stats() -> dict:
+    return {
+        "rate_limited": rate_limiter.rejected,
+        "queue_rejected": admission_controller.rejected,
+        "rate_limit_per_sec": rate_limiter.rate,
+        "rate_limit_burst": rate_limiter.burst,
+        "queue_max_depth": admission_controller.max_depth,
+    }
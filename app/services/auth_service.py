@@ -1,25 +1,33 @@
 import os
+import time
 from datetime import datetime, timedelta
 from typing import Optional
 
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 
+from shared.cache import TTLCache
 from shared.db import get_db
 from shared.models.user import User
-from app.schemas.auth import TokenData
+from app.schemas.auth import TokenData, AuthIdentity
+from app.services.password_service import pwd_context, verify_password_async, hash_password_async, needs_rehash
 
 SECRET_KEY = os.getenv("SECRET_KEY", "dev_secret")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# токен -> AuthIdentity: снимает запрос к users с каждого авторизованного запроса
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+identity_cache = TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
 
+
+# Синхронные варианты — для скриптов (init_db); обработчики запросов используют пул из password_service.
 def verify_password(plain_password: str, password_hash: str) -> bool:
     return pwd_context.verify(plain_password, password_hash)
 
@@ -35,34 +43,71 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
-    user = db.query(User).filter(User.username == username).first()
+async def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
+    """bcrypt считается в пуле процессов, запросы к БД — в threadpool; event loop не блокируется."""
+    user = await run_in_threadpool(lambda: db.query(User).filter(User.username == username).first())
     if not user:
         return None
-    if not verify_password(password, user.password_hash):
+    if not await verify_password_async(password, user.password_hash):
         return None
+    if needs_rehash(user.password_hash):
+        # поменялся BCRYPT_ROUNDS — пароль известен только сейчас, перехэшируем
+        user.password_hash = await hash_password_async(password)
+        await run_in_threadpool(db.commit)
     return user
 
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db),
-) -> User:
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+def resolve_identity(db: Session, token: str) -> Optional[AuthIdentity]:
+    """JWT -> AuthIdentity; результат кэшируется не дольше AUTH_CACHE_TTL и срока жизни токена."""
+    identity = identity_cache.get(token)
+    if identity is not None:
+        return identity
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = TokenData(username=username)
     except JWTError:
-        raise credentials_exception
+        return None
+    username = payload.get("sub")
+    if username is None:
+        return None
+    token_data = TokenData(username=username)
+
+    row = db.query(User.id, User.username).filter(User.username == token_data.username).first()
+    if row is None:
+        return None
+    identity = AuthIdentity(id=row.id, username=row.username)
+    exp = payload.get("exp")
+    identity_cache.set(token, identity, ttl=(exp - time.time()) if exp else None)
+    return identity
+
 
-    user = db.query(User).filter(User.username == token_data.username).first()
+def invalidate_token(token: str) -> None:
+    identity_cache.pop(token)
+
+
+def get_current_identity(
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db),
+) -> AuthIdentity:
+    identity = resolve_identity(db, token)
+    if identity is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return identity
+
+
+def get_current_user(
+    identity: AuthIdentity = Depends(get_current_identity),
+    db: Session = Depends(get_db),
+) -> User:
+    """Полная строка пользователя (с балансом) — для эндпоинтов, которым она действительно нужна."""
+    user = db.query(User).filter(User.id == identity.id).first()
     if user is None:
-        raise credentials_exception
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
@@ -0,0 +1,99 @@
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import datetime
+from typing import Iterator, List, Sequence
+
+from sqlalchemy import select
+
+from shared.db import SessionLocal
+from shared.models.prediction import Prediction
+from shared.models.transaction import Transaction
+
+# сколько строк за раз забирается из серверного курсора и сериализуется в один кусок ответа
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "1000"))
+
+FORMAT_CSV = "csv"
+FORMAT_NDJSON = "ndjson"
+MEDIA_TYPES = {FORMAT_CSV: "text/csv; charset=utf-8", FORMAT_NDJSON: "application/x-ndjson"}
+
+# выгружаемые колонки истории; user_id не нужен — выгрузка всегда по одному пользователю
+EXPORT_COLUMNS = {
+    "predictions": [
+        Prediction.id,
+        Prediction.model_id,
+        Prediction.prediction,
+        Prediction.cost,
+        Prediction.task_id,
+        Prediction.created_at,
+    ],
+    "transactions": [
+        Transaction.id,
+        Transaction.type,
+        Transaction.amount,
+        Transaction.task_id,
+        Transaction.created_at,
+    ],
+}
+
+
+def _value(v):
+    return v.isoformat() if isinstance(v, datetime) else v
+
+
+def _csv_chunk(rows: Sequence[Sequence]) -> str:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerows([[_value(v) for v in row] for row in rows])
+    return buf.getvalue()
+
+
+def _ndjson_chunk(names: List[str], rows: Sequence[Sequence]) -> str:
+    return "".join(json.dumps(dict(zip(names, map(_value, row))), ensure_ascii=False) + "\n" for row in rows)
+
+
+def _rows(kind: str, user_id: int, fmt: str) -> Iterator[str]:
+    """
+    Текстовые куски выгрузки по EXPORT_CHUNK_ROWS строк. Своя сессия: генератор
+    живёт дольше запроса. stream_results — серверный курсор на Postgres, так что
+    в памяти одновременно только одна пачка строк, сколько бы их ни было.
+    """
+    columns = EXPORT_COLUMNS[kind]
+    names = [c.key for c in columns]
+    model = columns[0].class_
+    stmt = (
+        select(*columns)
+        .where(model.user_id == user_id)
+        .order_by(model.created_at.desc(), model.id.desc())
+        .execution_options(stream_results=True)
+    )
+    if fmt == FORMAT_CSV:
+        yield _csv_chunk([names])
+
+    db = SessionLocal()
+    try:
+        for rows in db.execute(stmt).partitions(EXPORT_CHUNK_ROWS):
+            yield _csv_chunk(rows) if fmt == FORMAT_CSV else _ndjson_chunk(names, rows)
+    finally:
+        db.close()
+
+
+def _gzip(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 — формат gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_history(kind: str, user_id: int, fmt: str, gzip: bool = False) -> Iterator[bytes]:
+    """Поток байтов выгрузки истории kind ("predictions" / "transactions") пользователя."""
+    chunks = (text.encode("utf-8") for text in _rows(kind, user_id, fmt))
+    return _gzip(chunks) if gzip else chunks
+
+
+def export_filename(kind: str, user_id: int, fmt: str, gzip: bool = False) -> str:
+    return f"{kind}-{user_id}.{fmt}" + (".gz" if gzip else "")
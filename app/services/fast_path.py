@@ -0,0 +1,143 @@
+import importlib
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Deque, Dict, Optional
+
+from app.services.model_service import ModelInfo
+from shared.log import get_logger
+
+log = get_logger("fast-path")
+
+# быстрый путь /predict: скоринг прямо в запросе для дешёвых моделей; 0 — всё через очередь
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "1") == "1"
+# модель без флага is_cheap идёт быстрым путём, если p99 её скоринга в этом процессе не больше порога
+FAST_PATH_P99_MS = float(os.getenv("FAST_PATH_P99_MS", "5"))
+# сколько запрос готов ждать скоринга; дольше — задача уходит в очередь
+FAST_PATH_BUDGET_MS = float(os.getenv("FAST_PATH_BUDGET_MS", "20"))
+FAST_PATH_WINDOW = int(os.getenv("FAST_PATH_WINDOW", "200"))
+FAST_PATH_MIN_SAMPLES = int(os.getenv("FAST_PATH_MIN_SAMPLES", "20"))
+# модель, не прошедшая по p99, всё равно пробуется раз в столько запросов, чтобы замер не устаревал
+FAST_PATH_PROBE_EVERY = int(os.getenv("FAST_PATH_PROBE_EVERY", "50"))
+FAST_PATH_WORKERS = int(os.getenv("FAST_PATH_WORKERS", "4"))
+
+
+def _score(model_id: int, row: Dict[str, float]) -> float:
+    from worker.worker import score_rows
+
+    return score_rows(model_id, [row])[0]
+
+
+class FastPath:
+    """
+    Решает, считать ли предсказание в запросе, и считает его с бюджетом времени.
+
+    Скоринг идёт в небольшом пуле потоков: запрос ждёт не дольше бюджета, а
+    медленный скоринг досчитывается в пуле и попадает в окно замеров модели —
+    так её p99 поднимается выше порога и следующие запросы идут в очередь.
+    Пул ограничен: если он занят, ожидание тоже упирается в бюджет.
+    """
+
+    def __init__(
+        self,
+        p99_ms: float = FAST_PATH_P99_MS,
+        budget_ms: float = FAST_PATH_BUDGET_MS,
+        window: int = FAST_PATH_WINDOW,
+        min_samples: int = FAST_PATH_MIN_SAMPLES,
+        probe_every: int = FAST_PATH_PROBE_EVERY,
+        workers: int = FAST_PATH_WORKERS,
+        scorer=_score,
+    ):
+        self.p99 = p99_ms / 1000.0
+        self.budget = budget_ms / 1000.0
+        self.window = max(1, window)
+        self.min_samples = max(1, min_samples)
+        self.probe_every = max(1, probe_every)
+        self._scorer = scorer
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="fast-path")
+        self._samples: Dict[int, Deque[float]] = {}
+        self._requests: Dict[int, int] = {}
+        self._warmup: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._stats = {"inline": 0, "over_budget": 0, "errors": 0, "skipped": 0}
+
+    def _record(self, model_id: int, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(model_id, deque(maxlen=self.window)).append(seconds)
+
+    def observed_p99(self, model_id: int) -> Optional[float]:
+        """p99 скоринга модели в секундах; None — замеров меньше min_samples."""
+        with self._lock:
+            samples = list(self._samples.get(model_id, ()))
+        if len(samples) < self.min_samples:
+            return None
+        samples.sort()
+        return samples[math.ceil(len(samples) * 0.99) - 1]
+
+    def eligible(self, model: ModelInfo) -> bool:
+        if model.is_cheap:
+            return True
+        with self._lock:
+            n = self._requests[model.id] = self._requests.get(model.id, 0) + 1
+            warmup = self._warmup.get(model.id, 0)
+            if warmup < self.min_samples:
+                # замер набирается на первых min_samples запросах подряд; ожидание каждого
+                # ограничено бюджетом, а дорогая модель после них уходит в очередь
+                self._warmup[model.id] = warmup + 1
+                return True
+        p99 = self.observed_p99(model.id)
+        if p99 is not None and p99 <= self.p99:
+            return True
+        # p99 выше порога (или пробы ещё досчитываются) — в запросе только периодическая проба
+        return n % self.probe_every == 0
+
+    def _timed(self, model_id: int, row: Dict[str, float]) -> float:
+        started = time.perf_counter()
+        try:
+            return self._scorer(model_id, row)
+        finally:
+            self._record(model_id, time.perf_counter() - started)
+
+    def score(self, model: ModelInfo, input_data: Dict[str, Any]) -> Optional[float]:
+        """Значение предсказания или None — считать в запросе нельзя или не успели, задачу ставим в очередь."""
+        row = {k: float(v) for k, v in input_data.items() if isinstance(v, (int, float))}
+        if not FAST_PATH_ENABLED or not row or not self.eligible(model):
+            with self._lock:
+                self._stats["skipped"] += 1
+            return None
+        future = self._pool.submit(self._timed, model.id, row)
+        try:
+            value = future.result(timeout=self.budget)
+            outcome = "inline"
+        except FutureTimeout:
+            value, outcome = None, "over_budget"
+        except Exception as e:
+            log.warning("scoring failed", model_id=model.id, error=repr(e))
+            value, outcome = None, "errors"
+        with self._lock:
+            self._stats[outcome] += 1
+        return value
+
+    def warm(self) -> None:
+        """Импорт скорера (worker.worker тянет numpy/sklearn) заранее в пуле — иначе первый запрос не уложится в бюджет."""
+        if FAST_PATH_ENABLED and self._scorer is _score:
+            self._pool.submit(importlib.import_module, "worker.worker")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            model_ids = list(self._samples)
+            data: Dict[str, Any] = dict(self._stats)
+        p99 = {}
+        for model_id in model_ids:
+            value = self.observed_p99(model_id)
+            p99[model_id] = round(value * 1000, 3) if value is not None else None
+        return {**data, "p99_ms": p99, "budget_ms": self.budget * 1000, "threshold_ms": self.p99 * 1000}
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+fast_path = FastPath()
@@ -0,0 +1,74 @@
+import time
+
+from app.services.admission import admission_stats
+from app.services.fast_path import fast_path
+from app.services.ml_task_service import lane_stats, transport_stats
+from app.services.model_service import model_cache_stats
+from app.services.password_service import hasher_pool, password_cache_stats
+from shared.metrics import COUNT_BUCKETS, hit_ratio, registry, stats_samples, track_queries
+
+HTTP_SECONDS = registry.histogram(
+    "ml_http_request_duration_seconds", "Время обработки HTTP-запроса", ["method", "route", "status"]
+)
+HTTP_DB_QUERIES = registry.histogram(
+    "ml_http_request_db_queries", "Число SQL-запросов на HTTP-запрос", ["route"], buckets=COUNT_BUCKETS
+)
+HTTP_DB_SECONDS = registry.histogram("ml_http_request_db_seconds", "Суммарное время SQL-запросов HTTP-запроса", ["route"])
+
+
+class MetricsMiddleware:
+    """
+    ASGI-middleware: время запроса по шаблону маршрута (/tasks/{task_id}, а не
+    каждый task_id отдельно), число и время SQL-запросов внутри него. Потоковый
+    ответ (экспорт истории) учитывается целиком, до последнего чанка.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        with track_queries() as queries:
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                # route в scope кладёт роутер FastAPI; без него — 404 и служебные маршруты (docs, openapi)
+                route = getattr(scope.get("route"), "path", "unmatched")
+                HTTP_SECONDS.observe(time.perf_counter() - started, method=scope["method"], route=route, status=status)
+                HTTP_DB_QUERIES.observe(queries[0], route=route)
+                HTTP_DB_SECONDS.observe(queries[1], route=route)
+
+
+def _collect():
+    transport = transport_stats()
+    name = transport.pop("transport")
+    yield from stats_samples("ml_transport", transport, label="queue", transport=name)
+    for lane, data in lane_stats().items():
+        if data["depth"] is not None:
+            yield "ml_lane_queue_depth", {"lane": lane}, float(data["depth"])
+    yield from stats_samples("ml_admission", admission_stats())
+    fp = fast_path.stats()
+    yield from stats_samples("ml_fast_path", {k: v for k, v in fp.items() if k != "p99_ms"})
+    for model_id, p99 in fp["p99_ms"].items():
+        if p99 is not None:
+            yield "ml_fast_path_observed_p99_ms", {"model": str(model_id)}, p99
+    yield from stats_samples("ml_password_pool", hasher_pool.stats())
+    for cache, data in (("model_list", model_cache_stats()), ("password_verify", password_cache_stats())):
+        yield from stats_samples("ml_cache", data, cache=cache)
+        ratio = hit_ratio(data)
+        if ratio is not None:
+            yield "ml_cache_hit_ratio", {"cache": cache}, ratio
+
+
+registry.add_collector(_collect)
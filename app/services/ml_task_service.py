@@ -1,54 +1,198 @@
-import json
 import os
-from typing import Any, Dict
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
 
-import pika
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
 
-RABBIT_HOST = os.getenv("RABBIT_HOST", "rabbitmq")
-RABBIT_USER = os.getenv("RABBIT_USER", "guest")
-RABBIT_PASSWORD = os.getenv("RABBIT_PASSWORD", "guest")
-QUEUE_NAME = os.getenv("QUEUE_NAME", "ml_tasks")
+from app.services.task_service import new_task, mark_failed, find_task_id
+from app.services.transport import get_transport
+from shared.ledger import InsufficientFunds, hold
+from shared.log import get_logger
+from shared.metrics import registry
+from shared.models.prediction import Prediction
+from shared.models.task import HOLD_HELD, Task
+from shared.queues import LANE_INTERACTIVE, LANE_QUEUES, lane_for_rows
 
+log = get_logger("publisher")
 
-def _open_channel():
-    creds = pika.PlainCredentials(RABBIT_USER, RABBIT_PASSWORD)
-    params = pika.ConnectionParameters(
-        host=RABBIT_HOST,
-        credentials=creds,
-        heartbeat=30,
-        blocked_connection_timeout=30,
-        connection_attempts=5,
-        retry_delay=2.0,
+# сколько секунд держится резерв средств под задачу, пока её не обработал воркер
+BALANCE_HOLD_TTL = int(os.getenv("BALANCE_HOLD_TTL", "900"))
+
+# reserve — резерв средств и строка tasks с commit, publish — передача в транспорт
+# (у inline в publish входит и сама обработка)
+ENQUEUE_SECONDS = registry.histogram("ml_task_enqueue_duration_seconds", "Постановка задачи по стадиям", ["lane", "stage"])
+
+
+def transport_stats() -> Dict[str, Any]:
+    transport = get_transport()
+    return {"transport": transport.name, **transport.stats()}
+
+
+def queue_pressure(lane: str = LANE_INTERACTIVE) -> Tuple[Optional[int], bool]:
+    """(глубина очереди полосы или None, если свежего замера нет; заблокирован ли брокер)."""
+    return get_transport().pressure(lane)
+
+
+def lane_stats() -> Dict[str, Any]:
+    """Очередь и последняя измеренная глубина каждой полосы."""
+    return {lane: {"queue": queue, "depth": queue_pressure(lane)[0]} for lane, queue in LANE_QUEUES.items()}
+
+
+def split_valid_rows(rows: List[Dict[str, Any]]) -> Tuple[List[Dict[str, float]], int]:
+    """Оставляет в каждой строке числовые признаки; строки без них отбрасываются."""
+    valid_rows, rejected = [], 0
+    for row in rows:
+        valid = {k: float(v) for k, v in row.items() if isinstance(v, (int, float))}
+        if valid:
+            valid_rows.append(valid)
+        else:
+            rejected += 1
+    return valid_rows, rejected
+
+
+def _enqueue(db: Session, payload: Dict[str, Any], n_rows: int, idempotency_key: Optional[str], lane: str) -> str:
+    """
+    Строка в tasks (queued) и резерв стоимости задачи в users.reserved коммитятся
+    вместе до публикации, чтобы воркер их уже видел. Не хватает доступных
+    средств — InsufficientFunds, задача не создаётся. С транспортом inline к
+    возврату задача уже обработана.
+    """
+    started = time.perf_counter()
+    amount = payload["price"] * n_rows
+    if not hold(db, payload["user_id"], amount):
+        db.rollback()
+        raise InsufficientFunds(f"cannot reserve {amount} for user {payload['user_id']}")
+    task = new_task(
+        db, user_id=payload["user_id"], model_id=payload["model_id"], n_rows=n_rows, idempotency_key=idempotency_key
     )
-    connection = pika.BlockingConnection(params)
-    channel = connection.channel()
-    channel.queue_declare(queue=QUEUE_NAME, durable=True)
-    return channel, connection
+    task.hold_amount = amount
+    task.hold_state = HOLD_HELD
+    task.hold_expires_at = datetime.now(timezone.utc) + timedelta(seconds=BALANCE_HOLD_TTL)
+    task_id = task.id
+    try:
+        db.commit()
+    except IntegrityError:
+        # параллельный запрос с тем же Idempotency-Key успел раньше — отдаём его задачу
+        db.rollback()
+        existing = find_task_id(db, payload["user_id"], idempotency_key)
+        if existing is None:
+            raise
+        return existing
+    payload["task_id"] = task_id
+    published = time.perf_counter()
+    ENQUEUE_SECONDS.observe(published - started, lane=lane, stage="reserve")
+    try:
+        get_transport().publish(payload, lane)
+    except Exception as e:
+        mark_failed(db, task_id, f"publish failed: {e!r}")
+        raise
+    ENQUEUE_SECONDS.observe(time.perf_counter() - published, lane=lane, stage="publish")
+    return task_id
 
 
-def send_task_to_queue(*, user_id: int, model_id: int, input_data: Dict[str, Any], price: float) -> None:
+def send_task_to_queue(
+    db: Session,
+    *,
+    user_id: int,
+    model_id: int,
+    input_data: Dict[str, Any],
+    price: float,
+    idempotency_key: Optional[str] = None,
+) -> str:
     payload = {
         "user_id": int(user_id),
         "model_id": int(model_id),
         "input_data": input_data,
         "price": float(price),
     }
-    body = json.dumps(payload).encode("utf-8")
+    task_id = _enqueue(db, payload, n_rows=1, idempotency_key=idempotency_key, lane=LANE_INTERACTIVE)
+    log.task(
+        "task sent", task_id, transport=get_transport().name, queue=LANE_QUEUES[LANE_INTERACTIVE],
+        user_id=payload["user_id"], model_id=payload["model_id"], price=payload["price"], input=input_data,
+    )
+    return task_id
+
 
-    channel, connection = _open_channel()
+def send_batch_task_to_queue(
+    db: Session,
+    *,
+    user_id: int,
+    model_id: int,
+    rows: List[Dict[str, float]],
+    price: float,
+    idempotency_key: Optional[str] = None,
+) -> str:
+    """Одна задача на весь пакет; price — цена одной строки. Большие пакеты идут в batch-полосу."""
+    payload = {
+        "user_id": int(user_id),
+        "model_id": int(model_id),
+        "rows": rows,
+        "price": float(price),
+    }
+    lane = lane_for_rows(len(rows))
+    task_id = _enqueue(db, payload, n_rows=len(rows), idempotency_key=idempotency_key, lane=lane)
+    log.task(
+        "batch sent", task_id, transport=get_transport().name, queue=LANE_QUEUES[lane],
+        user_id=payload["user_id"], model_id=payload["model_id"], rows=len(rows),
+    )
+    return task_id
+
+
+def complete_task_inline(
+    db: Session,
+    *,
+    user_id: int,
+    model_id: int,
+    input_data: Dict[str, Any],
+    price: float,
+    value: float,
+    idempotency_key: Optional[str] = None,
+) -> Optional[Tuple[str, Optional[str]]]:
+    """
+    Быстрый путь: значение уже посчитано в запросе, задача, списание и
+    предсказание пишутся одной транзакцией тем же handle_task, что у воркера
+    (резерв не нужен — списание условное). Возвращает (task_id, prediction);
+    у задачи параллельного запроса с тем же ключом prediction может быть None.
+    Не хватило средств — InsufficientFunds (задача остаётся failed, ключ снят); None —
+    ошибка записи, задачу нужно поставить в очередь обычным путём.
+    """
+    from worker.worker import handle_task
+
+    task = new_task(db, user_id=user_id, model_id=model_id, idempotency_key=idempotency_key)
+    task_id = task.id
+    payload = {
+        "task_id": task_id,
+        "user_id": int(user_id),
+        "model_id": int(model_id),
+        "input_data": input_data,
+        "price": float(price),
+    }
+    try:
+        db.flush()
+    except IntegrityError:
+        # параллельный запрос с тем же Idempotency-Key успел раньше — отдаём его задачу
+        db.rollback()
+        existing = find_task_id(db, user_id, idempotency_key)
+        if existing is None:
+            raise
+        return existing, _first_prediction(db, existing)
     try:
-        channel.basic_publish(
-            exchange="",
-            routing_key=QUEUE_NAME,
-            body=body,
-            properties=pika.BasicProperties(
-                delivery_mode=2,  # persistent
-                content_type="application/json",
-            ),
-        )
-        print(f"[publisher] sent -> {QUEUE_NAME}: {payload}")
-    finally:
-        try:
-            connection.close()
-        except Exception:
-            pass
+        handle_task(db, payload, values=[value])
+    except Exception as e:
+        db.rollback()
+        log.warning("inline task failed, falling back to queue", task_id=task_id, error=repr(e))
+        return None
+    prediction = _first_prediction(db, task_id)
+    if prediction is None:
+        # handle_task пометил задачу failed: баланс изменился после проверки.
+        # Ключ идемпотентности снимается, иначе повтор после пополнения получил бы эту задачу
+        error = db.query(Task.error).filter(Task.id == task_id).scalar()
+        mark_failed(db, task_id, error or "insufficient balance")
+        raise InsufficientFunds(f"cannot charge {price} for task {task_id}")
+    return task_id, prediction
+
+
+def _first_prediction(db: Session, task_id: str) -> Optional[str]:
+    return db.query(Prediction.prediction).filter(Prediction.task_id == task_id).order_by(Prediction.id).limit(1).scalar()
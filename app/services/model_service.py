@@ -0,0 +1,45 @@
+import os
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy.orm import Session
+
+from shared.cache import TTLCache
+from shared.models.ml_model import MLModel
+
+# список моделей почти не меняется, а нужен на каждом рендере дашборда и каждом predict
+MODEL_LIST_CACHE_TTL = float(os.getenv("MODEL_LIST_CACHE_TTL", "30"))
+
+
+class ModelInfo(NamedTuple):
+    id: int
+    name: str
+    description: Optional[str]
+    price: float
+    is_cheap: bool
+
+
+_models = TTLCache(maxsize=1, ttl=MODEL_LIST_CACHE_TTL)
+
+
+def list_models(db: Session) -> List[ModelInfo]:
+    models = _models.get("all")
+    if models is None:
+        models = [
+            ModelInfo(m.id, m.name, m.description, float(m.price or 0.0), bool(m.is_cheap))
+            for m in db.query(MLModel).order_by(MLModel.id)
+        ]
+        _models.set("all", models)
+    return models
+
+
+def get_model(db: Session, model_id: int) -> Optional[ModelInfo]:
+    model = next((m for m in list_models(db) if m.id == model_id), None)
+    if model is None:
+        # модель могли добавить после заполнения кэша — перечитываем список (не чаще, чем раньше был запрос)
+        _models.pop("all")
+        model = next((m for m in list_models(db) if m.id == model_id), None)
+    return model
+
+
+def model_cache_stats() -> dict:
+    return _models.stats()
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import os
+import select
+import threading
+from collections import defaultdict
+from typing import Dict, Optional, Set, Tuple
+
+from shared.notify import PREDICTIONS_CHANNEL
+from shared.log import get_logger
+
+log = get_logger("notify")
+
+# как часто поток-слушатель просыпается проверить флаг остановки; на доставку не влияет
+LISTEN_POLL_INTERVAL = float(os.getenv("NOTIFY_LISTEN_POLL_INTERVAL", "5"))
+LISTEN_RECONNECT_DELAY = float(os.getenv("NOTIFY_RECONNECT_DELAY", "2"))
+
+
+class NotificationHub:
+    """
+    Один поток на процесс держит отдельное соединение с Postgres в режиме
+    LISTEN и раскладывает уведомления по asyncio-очередям подписчиков (SSE).
+    Пока уведомлений нет, ни запросов к БД, ни работы в event loop нет.
+    """
+
+    def __init__(self, channel: str = PREDICTIONS_CHANNEL):
+        self._channel = channel
+        self._subscribers: Dict[int, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = defaultdict(set)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def available(self) -> bool:
+        from shared.db import engine
+
+        return engine.dialect.name == "postgresql"
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=16)
+        with self._lock:
+            self._subscribers[user_id].add((asyncio.get_running_loop(), queue))
+            self._ensure_started()
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue) -> None:
+        with self._lock:
+            subs = self._subscribers.get(user_id)
+            if subs is None:
+                return
+            subs.difference_update({s for s in subs if s[1] is queue})
+            if not subs:
+                del self._subscribers[user_id]
+
+    def publish(self, user_id: int, payload: dict) -> None:
+        with self._lock:
+            targets = list(self._subscribers.get(user_id, ()))
+        for loop, queue in targets:
+            loop.call_soon_threadsafe(_offer, queue, payload)
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=LISTEN_POLL_INTERVAL + 1)
+            self._thread = None
+
+    def _ensure_started(self) -> None:
+        if self._thread is None and self.available:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="pg-listen", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self._listen()
+            except Exception as e:
+                log.warning("listener error, reconnecting", error=repr(e), delay=LISTEN_RECONNECT_DELAY)
+                self._stop.wait(LISTEN_RECONNECT_DELAY)
+
+    def _listen(self) -> None:
+        from shared.db import engine
+
+        # отдельное соединение вне пула: LISTEN живёт, пока соединение открыто
+        fairy = engine.raw_connection()
+        fairy.detach()
+        conn = fairy.connection
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {self._channel}")
+            log.info("listening", channel=self._channel)
+            while not self._stop.is_set():
+                if select.select([conn], [], [], LISTEN_POLL_INTERVAL) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    self._dispatch(conn.notifies.pop(0).payload)
+        finally:
+            conn.close()
+
+    def _dispatch(self, raw: str) -> None:
+        try:
+            payload = json.loads(raw)
+            user_id = int(payload["user_id"])
+        except (ValueError, KeyError, TypeError):
+            log.warning("bad payload", payload=raw)
+            return
+        self.publish(user_id, payload)
+
+
+def _offer(queue: asyncio.Queue, payload: dict) -> None:
+    # подписчику важен сам факт изменений: если очередь полна, уведомление уже ждёт обработки
+    if not queue.full():
+        queue.put_nowait(payload)
+
+
+hub = NotificationHub()
@@ -0,0 +1,36 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def keyset_page(
+    query: Query,
+    model,
+    limit: int,
+    before_id: Optional[int] = None,
+    after_created_at: Optional[datetime] = None,
+) -> Tuple[List, Optional[int]]:
+    """
+    Страница истории в порядке (created_at DESC, id DESC) без OFFSET.
+
+    Курсор — id последней строки предыдущей страницы: её created_at берётся
+    подзапросом в самой БД, и дальше идёт сравнение пары (created_at, id) по
+    индексу (user_id, created_at, id). Возвращает строки и курсор следующей
+    страницы (None, если строк больше нет).
+    """
+    if before_id is not None:
+        cursor_created_at = query.with_entities(model.created_at).filter(model.id == before_id).scalar_subquery()
+        query = query.filter(tuple_(model.created_at, model.id) < tuple_(cursor_created_at, before_id))
+    if after_created_at is not None:
+        query = query.filter(model.created_at > after_created_at)
+
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, rows[-1].id
@@ -0,0 +1,161 @@
+import asyncio
+import hashlib
+import multiprocessing as mp
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+from shared.cache import TTLCache
+
+# Модуль импортируется и в дочерних процессах пула, поэтому зависимостей от FastAPI/БД здесь нет.
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+# сколько операций может ждать/выполняться одновременно; сверх этого — 503
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+PASSWORD_VERIFY_CACHE_TTL = float(os.getenv("PASSWORD_VERIFY_CACHE_TTL", "30"))
+
+# min/max = default: хэши с другим cost factor считаются устаревшими и перехэшируются при входе
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+
+class PasswordPoolBusy(Exception):
+    """Пул хэширования перегружен — запрос лучше повторить позже."""
+
+
+def _timed(fn, *args) -> Tuple[object, float, float]:
+    started = time.time()
+    result = fn(*args)
+    return result, started, time.time() - started
+
+
+def _verify_in_child(plain_password: str, password_hash: str):
+    return _timed(pwd_context.verify, plain_password, password_hash)
+
+
+def _hash_in_child(password: str):
+    return _timed(pwd_context.hash, password)
+
+
+class PasswordHasherPool:
+    """
+    bcrypt в отдельном пуле процессов: хэширование не занимает ни event loop,
+    ни потоки threadpool FastAPI. Число одновременно принятых операций
+    ограничено max_pending, время ожидания в очереди пула копится в stats().
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        self._workers = max(1, workers)
+        self._max_pending = max(1, max_pending)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "rejected": 0,
+            "queue_wait_total": 0.0,
+            "queue_wait_max": 0.0,
+            "run_time_total": 0.0,
+        }
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self._workers, mp_context=mp.get_context("spawn"))
+        return self._executor
+
+    def _submit(self, fn, *args) -> Future:
+        with self._lock:
+            if self._pending >= self._max_pending:
+                self._stats["rejected"] += 1
+                raise PasswordPoolBusy(f"{self._pending} password operations in flight")
+            self._pending += 1
+            self._stats["submitted"] += 1
+        submitted_at = time.time()
+        inner = self._get_executor().submit(fn, *args)
+        outer: Future = Future()
+
+        def _done(f: Future) -> None:
+            with self._lock:
+                self._pending -= 1
+            try:
+                result, started, run_time = f.result()
+            except BaseException as e:
+                outer.set_exception(e)
+                return
+            wait = max(0.0, started - submitted_at)
+            with self._lock:
+                self._stats["completed"] += 1
+                self._stats["queue_wait_total"] += wait
+                self._stats["queue_wait_max"] = max(self._stats["queue_wait_max"], wait)
+                self._stats["run_time_total"] += run_time
+            outer.set_result(result)
+
+        inner.add_done_callback(_done)
+        return outer
+
+    def verify(self, plain_password: str, password_hash: str) -> Future:
+        return self._submit(_verify_in_child, plain_password, password_hash)
+
+    def hash(self, password: str) -> Future:
+        return self._submit(_hash_in_child, password)
+
+    def stats(self) -> dict:
+        with self._lock:
+            data = dict(self._stats)
+            data["pending"] = self._pending
+            data["workers"] = self._workers
+        return data
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+hasher_pool = PasswordHasherPool()
+
+# успешные проверки (хэш, пароль) на короткое время: повторные логины не гоняют bcrypt
+_verified = TTLCache(maxsize=10000, ttl=PASSWORD_VERIFY_CACHE_TTL)
+
+
+def _verify_key(plain_password: str, password_hash: str) -> str:
+    return hashlib.sha256(f"{password_hash}\0{plain_password}".encode("utf-8")).hexdigest()
+
+
+def needs_rehash(password_hash: str) -> bool:
+    return pwd_context.needs_update(password_hash)
+
+
+async def verify_password_async(plain_password: str, password_hash: str) -> bool:
+    key = _verify_key(plain_password, password_hash)
+    if _verified.get(key):
+        return True
+    ok = bool(await asyncio.wrap_future(hasher_pool.verify(plain_password, password_hash)))
+    if ok:
+        _verified.set(key, True)
+    return ok
+
+
+async def hash_password_async(password: str) -> str:
+    return await asyncio.wrap_future(hasher_pool.hash(password))
+
+
+def password_cache_stats() -> dict:
+    return _verified.stats()
+
+
+def password_pool_stats() -> dict:
+    return {**hasher_pool.stats(), "verify_cache": password_cache_stats()}
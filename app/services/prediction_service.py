@@ -0,0 +1,18 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from shared.models.prediction import Prediction
+from app.services.pagination import keyset_page
+
+
+def get_predictions_page(
+    db: Session,
+    user_id: int,
+    limit: int,
+    before_id: Optional[int] = None,
+    after_created_at: Optional[datetime] = None,
+):
+    query = db.query(Prediction).filter(Prediction.user_id == user_id)
+    return keyset_page(query, Prediction, limit, before_id, after_created_at)
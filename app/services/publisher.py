@@ -0,0 +1,316 @@
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Deque, Dict, List, Optional, Tuple
+
+import pika
+
+from shared.log import get_logger
+
+log = get_logger("publisher")
+
+
+class PublishNacked(Exception):
+    """Брокер отказался принять сообщение (Basic.Nack)."""
+
+
+class PublisherOverloaded(Exception):
+    """Слишком много сообщений ждут отправки/подтверждения."""
+
+
+_Message = Tuple[str, bytes, pika.BasicProperties, Future]
+
+
+class _PooledChannel:
+    def __init__(self, index: int):
+        self.index = index
+        self.channel = None
+        self.ready = False
+        self.delivery_tag = 0
+        self.unconfirmed: Dict[int, _Message] = {}
+
+
+class AsyncPublisher:
+    """
+    Долгоживущий паблишер RabbitMQ на одном соединении с пулом каналов.
+
+    Соединение (pika.SelectConnection) обслуживается фоновым потоком с ioloop.
+    Запросы только кладут сообщение в буфер и получают Future, поэтому
+    постановка задачи не платит за TCP/AMQP-рукопожатие. Каналы работают
+    в режиме publisher confirms: брокер подтверждает сообщения пачками
+    (Basic.Ack с multiple=True), неподтверждённые сообщения после
+    переподключения публикуются повторно.
+    """
+
+    def __init__(
+        self,
+        params: pika.ConnectionParameters,
+        queues: List[str],
+        pool_size: int = 4,
+        max_pending: int = 10000,
+        reconnect_delay: float = 2.0,
+        depth_interval: float = 0.0,
+    ):
+        self._params = params
+        self._queues = list(queues)
+        self._pool_size = max(1, int(pool_size))
+        self._max_pending = max(1, int(max_pending))
+        self._reconnect_delay = reconnect_delay
+        # >0 — раз в столько секунд глубина очередей опрашивается пассивным queue_declare
+        self._depth_interval = depth_interval
+        self._depths: Dict[str, Tuple[int, float]] = {}
+        self._blocked = False
+
+        self._lock = threading.Lock()
+        self._pending: Deque[_Message] = deque()
+        self._channels: List[_PooledChannel] = []
+        self._rr = itertools.count()
+        self._connection: Optional[pika.SelectConnection] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._declared = False
+
+        self._stats = {
+            "published": 0,
+            "confirmed": 0,
+            "nacked": 0,
+            "republished": 0,
+            "connects": 0,
+            "connection_errors": 0,
+            "confirm_batches": 0,
+        }
+
+    # ---------------- public API ----------------
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="rabbit-publisher", daemon=True)
+            self._thread.start()
+
+    def publish(self, routing_key: str, body: bytes, properties: pika.BasicProperties) -> Future:
+        future: Future = Future()
+        with self._lock:
+            in_flight = len(self._pending) + sum(len(c.unconfirmed) for c in self._channels)
+            if in_flight >= self._max_pending:
+                raise PublisherOverloaded(f"{in_flight} messages waiting for broker")
+            self._pending.append((routing_key, body, properties, future))
+        self.start()
+        self._call_threadsafe(self._flush)
+        return future
+
+    def queue_depth(self, queue: str, max_age: float) -> Optional[int]:
+        """Последняя измеренная глубина очереди; None — нет свежего замера."""
+        sample = self._depths.get(queue)
+        if sample is None or time.monotonic() - sample[1] > max_age:
+            return None
+        return sample[0]
+
+    @property
+    def blocked(self) -> bool:
+        """Брокер приостановил приём сообщений (memory/disk alarm, Connection.Blocked)."""
+        return self._blocked
+
+    def stats(self) -> dict:
+        with self._lock:
+            data = dict(self._stats)
+            data["pending"] = len(self._pending)
+            data["unconfirmed"] = sum(len(c.unconfirmed) for c in self._channels)
+            data["pool_size"] = self._pool_size
+            data["channels_ready"] = sum(1 for c in self._channels if c.ready)
+            data["connected"] = bool(self._connection is not None and self._connection.is_open)
+            data["blocked"] = self._blocked
+            data["queue_depths"] = {name: depth for name, (depth, _) in self._depths.items()}
+        return data
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Дожидается отправки буфера (до timeout) и закрывает соединение."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            st = self.stats()
+            if not st["pending"] and not st["unconfirmed"]:
+                break
+            time.sleep(0.05)
+        self._stopping = True
+        self._call_threadsafe(self._close_connection)
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+        self._thread = None
+
+    # ---------------- ioloop thread ----------------
+
+    def _run(self) -> None:
+        while not self._stopping:
+            self._declared = False
+            self._channels = [_PooledChannel(i) for i in range(self._pool_size)]
+            try:
+                self._connection = pika.SelectConnection(
+                    parameters=self._params,
+                    on_open_callback=self._on_connection_open,
+                    on_open_error_callback=self._on_connection_open_error,
+                    on_close_callback=self._on_connection_closed,
+                )
+                self._connection.ioloop.start()
+            except Exception as e:
+                log.error("ioloop error", error=repr(e))
+                self._stats["connection_errors"] += 1
+            self._requeue_unconfirmed()
+            if not self._stopping:
+                time.sleep(self._reconnect_delay)
+
+    def _call_threadsafe(self, callback) -> None:
+        conn = self._connection
+        if conn is None:
+            return
+        try:
+            conn.ioloop.add_callback_threadsafe(callback)
+        except Exception:
+            # ioloop ещё не поднят или уже остановлен — сообщения останутся в буфере
+            pass
+
+    def _on_connection_open(self, connection) -> None:
+        self._stats["connects"] += 1
+        self._blocked = False
+        connection.add_on_connection_blocked_callback(lambda _conn, _frame: self._set_blocked(True))
+        connection.add_on_connection_unblocked_callback(lambda _conn, _frame: self._set_blocked(False))
+        for pooled in self._channels:
+            connection.channel(on_open_callback=lambda ch, p=pooled: self._on_channel_open(p, ch))
+
+    def _on_connection_open_error(self, connection, err) -> None:
+        log.warning("connection failed", error=str(err))
+        self._stats["connection_errors"] += 1
+        connection.ioloop.stop()
+
+    def _on_connection_closed(self, connection, reason) -> None:
+        for pooled in self._channels:
+            pooled.ready = False
+        if not self._stopping:
+            log.warning("connection closed, reconnecting", reason=str(reason))
+        connection.ioloop.stop()
+
+    def _on_channel_open(self, pooled: _PooledChannel, channel) -> None:
+        pooled.channel = channel
+        channel.add_on_close_callback(lambda ch, reason, p=pooled: self._on_channel_closed(p, reason))
+        channel.confirm_delivery(ack_nack_callback=lambda frame, p=pooled: self._on_confirm(p, frame))
+        if pooled.index == 0 and not self._declared:
+            self._declare_queues(channel, list(self._queues), pooled)
+        else:
+            self._mark_ready(pooled)
+
+    def _declare_queues(self, channel, queues: List[str], pooled: _PooledChannel) -> None:
+        # очереди объявляются один раз на соединение, остальные каналы ждут
+        if not queues:
+            self._declared = True
+            for p in self._channels:
+                if p.channel is not None and p.channel.is_open:
+                    self._mark_ready(p)
+            if self._depth_interval > 0:
+                self._sample_depths()
+            return
+        name = queues.pop(0)
+        channel.queue_declare(
+            queue=name,
+            durable=True,
+            callback=lambda _frame: self._declare_queues(channel, queues, pooled),
+        )
+
+    def _set_blocked(self, blocked: bool) -> None:
+        self._blocked = blocked
+        log.warning("broker blocked the connection" if blocked else "broker unblocked the connection")
+
+    def _sample_depths(self) -> None:
+        pooled = self._channels[0]
+        conn = self._connection
+        if self._stopping or conn is None or pooled.channel is None or not pooled.channel.is_open:
+            return
+        for name in self._queues:
+            pooled.channel.queue_declare(
+                queue=name,
+                passive=True,
+                callback=lambda frame, n=name: self._depths.__setitem__(n, (frame.method.message_count, time.monotonic())),
+            )
+        conn.ioloop.call_later(self._depth_interval, self._sample_depths)
+
+    def _mark_ready(self, pooled: _PooledChannel) -> None:
+        if not self._declared:
+            return
+        pooled.ready = True
+        self._flush()
+
+    def _on_channel_closed(self, pooled: _PooledChannel, reason) -> None:
+        pooled.ready = False
+        if self._stopping:
+            return
+        log.warning("channel closed", channel=pooled.index, reason=str(reason))
+        # канал закрыт брокером — пересоздаём соединение целиком
+        conn = self._connection
+        if conn is not None and conn.is_open:
+            conn.close()
+
+    def _next_channel(self) -> Optional[_PooledChannel]:
+        ready = [c for c in self._channels if c.ready]
+        if not ready:
+            return None
+        return ready[next(self._rr) % len(ready)]
+
+    def _flush(self) -> None:
+        while True:
+            pooled = self._next_channel()
+            if pooled is None:
+                return
+            with self._lock:
+                if not self._pending:
+                    return
+                msg = self._pending.popleft()
+            routing_key, body, properties, future = msg
+            try:
+                pooled.channel.basic_publish(exchange="", routing_key=routing_key, body=body, properties=properties)
+            except Exception as e:
+                log.error("publish failed", error=repr(e))
+                with self._lock:
+                    self._pending.appendleft(msg)
+                return
+            pooled.delivery_tag += 1
+            pooled.unconfirmed[pooled.delivery_tag] = msg
+            self._stats["published"] += 1
+
+    def _on_confirm(self, pooled: _PooledChannel, frame) -> None:
+        method = frame.method
+        acked = method.NAME == "Basic.Ack"
+        tag = method.delivery_tag
+        if method.multiple:
+            tags = [t for t in pooled.unconfirmed if t <= tag]
+        else:
+            tags = [tag] if tag in pooled.unconfirmed else []
+        self._stats["confirm_batches"] += 1
+        for t in tags:
+            _, _, _, future = pooled.unconfirmed.pop(t)
+            if acked:
+                self._stats["confirmed"] += 1
+                if not future.done():
+                    future.set_result(True)
+            else:
+                self._stats["nacked"] += 1
+                if not future.done():
+                    future.set_exception(PublishNacked(f"delivery_tag={t}"))
+
+    def _requeue_unconfirmed(self) -> None:
+        # неподтверждённые сообщения уходят в начало буфера в исходном порядке
+        with self._lock:
+            for pooled in reversed(self._channels):
+                for t in sorted(pooled.unconfirmed, reverse=True):
+                    self._pending.appendleft(pooled.unconfirmed[t])
+                    self._stats["republished"] += 1
+                pooled.unconfirmed.clear()
+                pooled.ready = False
+
+    def _close_connection(self) -> None:
+        conn = self._connection
+        if conn is not None and conn.is_open:
+            conn.close()
+        elif conn is not None:
+            conn.ioloop.stop()
@@ -0,0 +1,55 @@
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from shared.ledger import release_holds
+from shared.models.task import Task, TASK_QUEUED, TASK_FAILED
+
+
+def new_task(
+    db: Session,
+    *,
+    user_id: int,
+    model_id: int,
+    n_rows: int = 1,
+    status: str = TASK_QUEUED,
+    idempotency_key: Optional[str] = None,
+) -> Task:
+    """Добавляет задачу в сессию; commit — на вызывающей стороне."""
+    task = Task(
+        id=str(uuid.uuid4()),
+        user_id=user_id,
+        model_id=model_id,
+        n_rows=n_rows,
+        status=status,
+        idempotency_key=idempotency_key,
+    )
+    db.add(task)
+    return task
+
+
+def mark_failed(db: Session, task_id: str, error: str) -> None:
+    """
+    Задача не попала в очередь; ключ идемпотентности освобождается, чтобы клиент
+    мог повторить запрос, резерв средств снимается.
+    """
+    db.query(Task).filter(Task.id == task_id).update(
+        {"status": TASK_FAILED, "error": error[:500], "finished_at": datetime.now(timezone.utc), "idempotency_key": None},
+        synchronize_session=False,
+    )
+    release_holds(db, [task_id])
+    db.commit()
+
+
+def get_task(db: Session, task_id: str, user_id: int) -> Optional[Task]:
+    return db.query(Task).filter(Task.id == task_id, Task.user_id == user_id).first()
+
+
+def find_task_id(db: Session, user_id: int, idempotency_key: Optional[str]) -> Optional[str]:
+    """id задачи, уже созданной этим пользователем с тем же Idempotency-Key."""
+    if not idempotency_key:
+        return None
+    row = db.query(Task.id).filter(Task.user_id == user_id, Task.idempotency_key == idempotency_key).first()
+    return row[0] if row else None
@@ -1,25 +1,31 @@
+from datetime import datetime
+from typing import Optional
+
 from sqlalchemy.orm import Session
+from shared import ledger
 from shared.models.transaction import Transaction
-from shared.models.user import User
+from app.services.pagination import keyset_page
 
 def create_transaction(db: Session, user_id: int, amount: float, type: str):
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        return None
-
-    if type == "withdraw" and user.balance < amount:
-        return None
-
+    """Пополнение или списание одним условным UPDATE (shared.ledger); None — нет пользователя или средств."""
     if type == "deposit":
-        user.balance += amount
+        entry = ledger.deposit(db, user_id, amount)
     elif type == "withdraw":
-        user.balance -= amount
-
-    transaction = Transaction(user_id=user_id, amount=amount, type=type)
-    db.add(transaction)
+        entry = ledger.withdraw(db, user_id, amount)
+    else:
+        return None
+    if entry is None:
+        db.rollback()
+        return None
     db.commit()
-    db.refresh(transaction)
-    return transaction
+    return db.get(Transaction, entry.transaction_ids[0])
 
-def get_transactions(db: Session, user_id: int):
-    return db.query(Transaction).filter(Transaction.user_id == user_id).all()
+def get_transactions_page(
+    db: Session,
+    user_id: int,
+    limit: int,
+    before_id: Optional[int] = None,
+    after_created_at: Optional[datetime] = None,
+):
+    query = db.query(Transaction).filter(Transaction.user_id == user_id)
+    return keyset_page(query, Transaction, limit, before_id, after_created_at)
@@ -0,0 +1,295 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+import pika
+
+from app.services.publisher import AsyncPublisher
+from shared.queues import ENQUEUED_AT_HEADER, LANE_QUEUES, USER_HEADER
+
+# куда уходят задачи: rabbit — RabbitMQ и отдельные воркеры; memory — asyncio-очередь и
+# обработчик в процессе API; inline — задача выполняется прямо в запросе.
+# TEST_MODE=1 без явного TASK_TRANSPORT — inline (синхронный режим для локальной проверки)
+TASK_TRANSPORT = os.getenv("TASK_TRANSPORT") or ("inline" if os.getenv("TEST_MODE", "0") == "1" else "rabbit")
+
+RABBIT_HOST = os.getenv("RABBIT_HOST", "rabbitmq")
+RABBIT_USER = os.getenv("RABBIT_USER", "guest")
+RABBIT_PASSWORD = os.getenv("RABBIT_PASSWORD", "guest")
+
+# размер пула каналов паблишера и лимит сообщений, ожидающих подтверждения брокером
+PUBLISHER_POOL_SIZE = int(os.getenv("RABBIT_PUBLISHER_POOL_SIZE", "4"))
+PUBLISHER_MAX_PENDING = int(os.getenv("RABBIT_PUBLISHER_MAX_PENDING", "10000"))
+# >0 — ждать publisher confirm от брокера перед ответом клиенту (секунды)
+PUBLISH_CONFIRM_TIMEOUT = float(os.getenv("RABBIT_PUBLISH_CONFIRM_TIMEOUT", "0"))
+# как часто паблишер замеряет глубину очереди для admission control (сек); 0 — не замерять
+QUEUE_DEPTH_SAMPLE_INTERVAL = float(os.getenv("QUEUE_DEPTH_SAMPLE_INTERVAL", "1"))
+# сколько обработчиков очереди memory работает параллельно (каждый — как процесс-воркер)
+MEMORY_TRANSPORT_WORKERS = max(1, int(os.getenv("MEMORY_TRANSPORT_WORKERS", "1")))
+
+
+def _headers(payload: Dict[str, Any]) -> Dict[str, Any]:
+    # по ним считается время ожидания в полосе и чередуются пользователи
+    return {ENQUEUED_AT_HEADER: int(time.time() * 1000), USER_HEADER: payload["user_id"]}
+
+
+class TaskTransport:
+    """
+    Доставка задачи до handle_task/handle_batch (worker.worker). Вызывается после
+    commit строки tasks и резерва средств; исключение из publish — задача не
+    доставлена (её пометит failed вызывающий).
+    """
+
+    name = ""
+    # True — к возврату publish задача уже обработана
+    synchronous = False
+
+    def publish(self, payload: Dict[str, Any], lane: str) -> None:
+        raise NotImplementedError
+
+    def pressure(self, lane: str) -> Tuple[Optional[int], bool]:
+        """(глубина очереди полосы или None, если замера нет; заблокирована ли публикация)."""
+        return None, False
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+    def close(self) -> None:
+        pass
+
+
+class RabbitTransport(TaskTransport):
+    """RabbitMQ через долгоживущий AsyncPublisher; соединение открывается при первой публикации."""
+
+    name = "rabbit"
+
+    def __init__(self):
+        self._publisher: Optional[AsyncPublisher] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _connection_params() -> pika.ConnectionParameters:
+        creds = pika.PlainCredentials(RABBIT_USER, RABBIT_PASSWORD)
+        return pika.ConnectionParameters(
+            host=RABBIT_HOST,
+            credentials=creds,
+            heartbeat=30,
+            blocked_connection_timeout=30,
+            connection_attempts=5,
+            retry_delay=2.0,
+        )
+
+    def _get_publisher(self) -> AsyncPublisher:
+        if self._publisher is None:
+            with self._lock:
+                if self._publisher is None:
+                    publisher = AsyncPublisher(
+                        self._connection_params(),
+                        queues=list(LANE_QUEUES.values()),
+                        pool_size=PUBLISHER_POOL_SIZE,
+                        max_pending=PUBLISHER_MAX_PENDING,
+                        depth_interval=QUEUE_DEPTH_SAMPLE_INTERVAL,
+                    )
+                    publisher.start()
+                    self._publisher = publisher
+        return self._publisher
+
+    def publish(self, payload: Dict[str, Any], lane: str) -> None:
+        future = self._get_publisher().publish(
+            LANE_QUEUES[lane],
+            json.dumps(payload).encode("utf-8"),
+            pika.BasicProperties(
+                delivery_mode=2,  # persistent
+                content_type="application/json",
+                headers=_headers(payload),
+            ),
+        )
+        if PUBLISH_CONFIRM_TIMEOUT > 0:
+            future.result(timeout=PUBLISH_CONFIRM_TIMEOUT)
+
+    def pressure(self, lane: str) -> Tuple[Optional[int], bool]:
+        if self._publisher is None:
+            return None, False
+        depth = self._publisher.queue_depth(LANE_QUEUES[lane], max_age=max(5.0, QUEUE_DEPTH_SAMPLE_INTERVAL * 5))
+        return depth, self._publisher.blocked
+
+    def stats(self) -> Dict[str, Any]:
+        if self._publisher is None:
+            return {"started": False}
+        return {"started": True, **self._publisher.stats()}
+
+    def close(self) -> None:
+        if self._publisher is not None:
+            self._publisher.close()
+        self._publisher = None
+
+
+class MemoryTransport(TaskTransport):
+    """
+    Очередь asyncio в фоновом потоке процесса API вместо брокера: полосы,
+    weighted fair выбор и микробатчи — те же, что у воркера (LaneScheduler,
+    WORKER_BATCH_SIZE/WORKER_BATCH_MAX_WAIT), обработка — worker.process_tasks
+    в потоках executor'а. Не переживает рестарт: задачи из памяти теряются,
+    их резервы снимает sweeper при следующем запуске.
+    """
+
+    name = "memory"
+
+    def __init__(self, workers: int = MEMORY_TRANSPORT_WORKERS):
+        from worker.lanes import LaneScheduler
+
+        self._workers = workers
+        self._scheduler = LaneScheduler()
+        self._depth = {lane: 0 for lane in LANE_QUEUES}
+        self._published = 0
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+        self._consumers: List[asyncio.Task] = []
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._ready = threading.Event()
+                self._thread = threading.Thread(target=self._run, args=(self._ready,), name="memory-transport", daemon=True)
+                self._thread.start()
+            ready = self._ready
+        ready.wait()
+
+    def _run(self, ready: threading.Event) -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._consumers = [loop.create_task(self._consume()) for _ in range(self._workers)]
+        self._consumers.append(loop.create_task(self._sweep()))
+        ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    def _drain(self) -> None:
+        while not self._queue.empty():
+            self._scheduler.push(*self._queue.get_nowait())
+
+    async def _consume(self) -> None:
+        from worker.worker import BATCH_MAX_WAIT, BATCH_SIZE, process_tasks
+
+        loop = asyncio.get_running_loop()
+        while True:
+            # очередь — приём задач, планировщик — выбор между полосами и пользователями
+            if not len(self._scheduler):
+                self._scheduler.push(*await self._queue.get())
+            self._drain()
+            if BATCH_SIZE > 1 and len(self._scheduler) < BATCH_SIZE:
+                await asyncio.sleep(BATCH_MAX_WAIT)  # добрать микробатч
+                self._drain()
+            batch = self._scheduler.next_batch(BATCH_SIZE)
+            if not batch:
+                continue
+            try:
+                await loop.run_in_executor(None, process_tasks, [payload for _, payload in batch])
+            finally:
+                with self._lock:
+                    for lane, _ in batch:
+                        self._depth[lane] -= 1
+
+    async def _sweep(self) -> None:
+        from worker.worker import HOLD_SWEEP_INTERVAL, sweep_holds
+
+        if HOLD_SWEEP_INTERVAL <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        while True:
+            await loop.run_in_executor(None, sweep_holds)
+            await asyncio.sleep(HOLD_SWEEP_INTERVAL)
+
+    async def _shutdown(self) -> None:
+        for task in self._consumers:
+            task.cancel()
+        await asyncio.gather(*self._consumers, return_exceptions=True)
+        asyncio.get_running_loop().stop()
+
+    def publish(self, payload: Dict[str, Any], lane: str) -> None:
+        self._start()
+        with self._lock:
+            self._depth[lane] += 1
+            self._published += 1
+        item = (lane, dict(payload), SimpleNamespace(headers=_headers(payload)))
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, item)
+
+    def pressure(self, lane: str) -> Tuple[Optional[int], bool]:
+        with self._lock:
+            return self._depth[lane], False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"started": self._thread is not None, "published": self._published, "depths": dict(self._depth)}
+
+    def close(self) -> None:
+        # задачи, ещё не взятые обработчиком, остаются queued; начатая пачка дорабатывает в executor'е
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop)
+        self._thread.join(timeout=5)
+        self._loop = self._thread = None
+
+
+class InlineTransport(TaskTransport):
+    """Без очереди: задача обрабатывается worker.process_tasks в потоке запроса."""
+
+    name = "inline"
+    synchronous = True
+
+    def __init__(self):
+        self._processed = 0
+        self._lock = threading.Lock()
+
+    def publish(self, payload: Dict[str, Any], lane: str) -> None:
+        from worker.worker import process_tasks
+
+        process_tasks([dict(payload)])
+        with self._lock:
+            self._processed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"processed": self._processed}
+
+
+TRANSPORTS = {
+    RabbitTransport.name: RabbitTransport,
+    MemoryTransport.name: MemoryTransport,
+    InlineTransport.name: InlineTransport,
+}
+
+_transport: Optional[TaskTransport] = None
+_transport_pid: Optional[int] = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> TaskTransport:
+    """Транспорт живёт один на процесс (после fork создаётся заново)."""
+    global _transport, _transport_pid
+    pid = os.getpid()
+    if _transport is not None and _transport_pid == pid:
+        return _transport
+    with _transport_lock:
+        if _transport is None or _transport_pid != pid:
+            if TASK_TRANSPORT not in TRANSPORTS:
+                raise RuntimeError(f"unknown TASK_TRANSPORT={TASK_TRANSPORT!r}, expected one of {sorted(TRANSPORTS)}")
+            _transport = TRANSPORTS[TASK_TRANSPORT]()
+            _transport_pid = pid
+    return _transport
+
+
+def close_transport() -> None:
+    global _transport
+    if _transport is not None and _transport_pid == os.getpid():
+        _transport.close()
+    _transport = None
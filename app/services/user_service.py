@@ -3,7 +3,10 @@ from shared.models.user import User
 from app.services.auth_service import get_password_hash
 
 def create_user(db: Session, username: str, email: str, password: str):
-    user = User(username=username, email=email, password_hash=get_password_hash(password), balance=0.0)
+    return create_user_with_hash(db, username=username, email=email, password_hash=get_password_hash(password))
+
+def create_user_with_hash(db: Session, username: str, email: str, password_hash: str):
+    user = User(username=username, email=email, password_hash=password_hash, balance=0.0)
     db.add(user)
     db.commit()
     db.refresh(user)
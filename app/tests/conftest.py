@@ -0,0 +1,25 @@
+import pytest
+
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    """Сессия на временной SQLite-базе со всеми таблицами: ledger и воркер без сервера и брокера."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    import shared.models.ml_model  # noqa: F401 — модели регистрируются в Base.metadata при импорте
+    import shared.models.prediction  # noqa: F401
+    import shared.models.task  # noqa: F401
+    import shared.models.transaction  # noqa: F401
+    import shared.models.user  # noqa: F401
+    import shared.models.user_summary  # noqa: F401
+    from shared.db import Base
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine, autocommit=False, autoflush=False)()
+    try:
+        yield db
+    finally:
+        db.close()
+        engine.dispose()
@@ -0,0 +1,38 @@
+import pytest
+
+from app.services.admission import AdmissionController, AdmissionRejected, RateLimiter
+
+
+def test_token_bucket_allows_burst_then_reports_wait():
+    limiter = RateLimiter(rate=1.0, burst=3)
+    assert [limiter.acquire(1) for _ in range(3)] == [None, None, None]
+    wait = limiter.acquire(1)
+    assert wait is not None and 0 < wait <= 1.0
+    # у другого пользователя свой бакет
+    assert limiter.acquire(2) is None
+
+
+def test_admission_controller_sheds_on_depth_and_blocked_broker():
+    probe = {"value": (10, False)}
+    controller = AdmissionController(lambda lane: probe["value"], max_depth=100)
+    controller.check()
+
+    probe["value"] = (100, False)
+    with pytest.raises(AdmissionRejected) as exc:
+        controller.check()
+    assert exc.value.retry_after_header.isdigit()
+
+    probe["value"] = (None, True)
+    with pytest.raises(AdmissionRejected):
+        controller.check()
+    # нет свежего замера — не отказываем
+    probe["value"] = (None, False)
+    controller.check()
+
+
+def test_admission_controller_checks_lane_depth_separately():
+    depths = {"interactive": 5, "batch": 500}
+    controller = AdmissionController(lambda lane: (depths[lane], False), max_depth=100)
+    controller.check("interactive")
+    with pytest.raises(AdmissionRejected):
+        controller.check("batch")
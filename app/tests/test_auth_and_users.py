@@ -24,6 +24,7 @@ def test_register_and_me():
     me = requests.get(f"{BASE_URL}/users/me", headers={"Authorization": f"Bearer {access}"}, timeout=10)
     assert me.status_code == 200, me.text
     assert me.json()["username"] == user["username"]
+    assert me.json()["reserved"] == 0
 
 @pytest.mark.integration
 def test_login_wrong_password():
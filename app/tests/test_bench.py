@@ -0,0 +1,18 @@
+from bench.load import parse_mix
+from bench.stats import diff_reports, summarize
+
+
+def test_summarize_percentiles_in_ms():
+    latencies = [i / 1000 for i in range(1, 101)]  # 1..100 мс
+    s = summarize(latencies, elapsed=2.0, errors=3)
+    assert (s["p50_ms"], s["p95_ms"], s["p99_ms"], s["max_ms"]) == (50.0, 95.0, 99.0, 100.0)
+    assert s["count"] == 100 and s["errors"] == 3 and s["throughput"] == 50.0
+    assert summarize([], elapsed=1.0)["p99_ms"] is None
+
+
+def test_parse_mix_and_diff_reports():
+    assert parse_mix("predict:4, poll:1,unknown:2,history:x") == {"predict": 4, "poll": 1}
+    old = {"results": {"handle_task": {"p50_ms": 10.0, "p95_ms": 20.0, "p99_ms": 40.0, "throughput": 100.0}}}
+    new = {"results": {"handle_task": {"p50_ms": 5.0, "p95_ms": 20.0, "p99_ms": 40.0, "throughput": 200.0}}}
+    (line,) = diff_reports(old, new)
+    assert "p50_ms 10.0 -> 5.0 (0.50x)" in line and "throughput 100.0 -> 200.0 (2.00x)" in line
@@ -0,0 +1,30 @@
+from types import SimpleNamespace
+
+from shared.models.task import TASK_DONE, TASK_FAILED, TASK_QUEUED, Task
+from shared.models.user import User
+from worker.dlq import replay_headers
+from worker.retry import is_replay
+from worker.worker import drop_processed
+
+
+def test_replay_keeps_publisher_headers_and_marks_message():
+    headers = replay_headers(
+        {"x-user-id": 7, "x-enqueued-at": 1, "x-attempt": 5, "x-last-error": "boom", "x-source-queue": "ml_tasks", "x-dead-at": 2},
+        now=10.0,
+    )
+    assert headers == {"x-user-id": 7, "x-enqueued-at": 10000, "x-replay": 1}
+    assert is_replay(SimpleNamespace(headers=headers)) and not is_replay(SimpleNamespace(headers={"x-user-id": 7}))
+
+
+def test_failed_task_runs_again_only_from_replay(sqlite_db):
+    db = sqlite_db
+    db.add(User(id=1, username="u", email="u@ex.com", password_hash="x", balance=10.0))
+    for task_id, status in (("done", TASK_DONE), ("failed", TASK_FAILED), ("queued", TASK_QUEUED)):
+        db.add(Task(id=task_id, user_id=1, model_id=1, status=status))
+    db.commit()
+
+    fresh = drop_processed(db, [{"task_id": t} for t in ("done", "failed", "queued", "queued")])
+    # failed без флага replay — API уже ответил ошибкой (например, таймаут подтверждения публикации)
+    assert [t["task_id"] for t in fresh] == ["queued"]
+    replayed = drop_processed(db, [{"task_id": "failed", "replay": True}, {"task_id": "done", "replay": True}])
+    assert [t["task_id"] for t in replayed] == ["failed"]
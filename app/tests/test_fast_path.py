@@ -0,0 +1,45 @@
+import threading
+import time
+
+from app.services.fast_path import FastPath
+from app.services.model_service import ModelInfo
+
+
+def _model(model_id=1, is_cheap=False):
+    return ModelInfo(id=model_id, name="m", description=None, price=0.0, is_cheap=is_cheap)
+
+
+def test_fast_path_scores_inline_and_falls_back_over_budget():
+    release = threading.Event()
+
+    def scorer(model_id, row):
+        if model_id == 2:
+            release.wait(2)
+        return row["feature1"] * 2
+
+    fp = FastPath(budget_ms=50, min_samples=1, scorer=scorer)
+    try:
+        assert fp.score(_model(1, is_cheap=True), {"feature1": 1.5, "bad": "x"}) == 3.0
+        assert fp.score(_model(2, is_cheap=True), {"feature1": 1.0}) is None
+        assert fp.stats()["inline"] == 1 and fp.stats()["over_budget"] == 1
+    finally:
+        release.set()
+        fp.shutdown()
+
+
+def test_uncheap_model_is_probed_before_going_inline():
+    delay = {1: 0.01, 2: 0.0}
+    fp = FastPath(p99_ms=1, budget_ms=500, min_samples=2, probe_every=3, scorer=lambda model_id, row: time.sleep(delay[model_id]) or 1.0)
+    try:
+        slow, fast = _model(1), _model(2)
+        # первые min_samples запросов подряд — пробы в запросе, дальше решает замер
+        assert [fp.score(slow, {"feature1": 1.0}) for _ in range(2)] == [1.0, 1.0]
+        assert fp.observed_p99(slow.id) > 0.001
+        # p99 выше порога: очередь, кроме каждого probe_every-го запроса
+        assert [fp.score(slow, {"feature1": 1.0}) for _ in range(4)] == [1.0, None, None, 1.0]
+        # быстрая модель после тех же проб идёт в запросе всегда
+        assert [fp.score(fast, {"feature1": 1.0}) for _ in range(5)] == [1.0] * 5
+        # флаг is_cheap пропускает без замеров
+        assert fp.eligible(_model(3, is_cheap=True))
+    finally:
+        fp.shutdown()
@@ -0,0 +1,62 @@
+import pickle
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("sklearn")
+
+from sklearn.ensemble import (  # noqa: E402
+    AdaBoostClassifier,
+    BaggingClassifier,
+    GradientBoostingClassifier,
+    GradientBoostingRegressor,
+    RandomForestRegressor,
+)
+from sklearn.tree import DecisionTreeClassifier  # noqa: E402
+
+from shared.ml_model.forest import compile_model  # noqa: E402
+from shared.ml_model.model_loader import MODEL_PATH  # noqa: E402
+from shared.ml_model.registry import ModelArtifact  # noqa: E402
+
+
+def test_compiled_forest_matches_sklearn_classifier():
+    with open(MODEL_PATH, "rb") as f:
+        model = pickle.load(f)
+    engine = compile_model(model)
+    assert engine is not None
+
+    X = np.random.RandomState(0).normal(scale=2.0, size=(2000, model.n_features_in_))
+    assert np.allclose(engine.predict_proba(X), model.predict_proba(X), atol=1e-9)
+    assert np.allclose(engine.predict_proba(X[:1]), model.predict_proba(X[:1]), atol=1e-9)
+    assert (engine.predict(X) == model.predict(X)).all()
+
+
+def test_compiled_forest_matches_sklearn_regressor():
+    rng = np.random.RandomState(1)
+    X = rng.normal(size=(500, 4))
+    y = X[:, 0] * 2.0 - X[:, 1]
+    model = RandomForestRegressor(n_estimators=10, random_state=0).fit(X, y)
+    engine = compile_model(model)
+    assert np.allclose(engine.predict(X), model.predict(X), atol=1e-9)
+
+
+@pytest.mark.parametrize(
+    "make",
+    [
+        lambda: AdaBoostClassifier(n_estimators=20, random_state=0),
+        lambda: BaggingClassifier(DecisionTreeClassifier(), n_estimators=10, max_features=0.6, random_state=0),
+        lambda: GradientBoostingClassifier(n_estimators=20, random_state=0),
+        lambda: GradientBoostingRegressor(n_estimators=20, random_state=0),
+    ],
+)
+def test_other_ensembles_are_scored_by_sklearn(make):
+    # не среднее по листьям — не компилируются, скоринг артефакта совпадает с самим sklearn
+    rng = np.random.RandomState(2)
+    X = rng.normal(size=(400, 5))
+    y = (X[:, 0] + X[:, 1] * X[:, 2] > 0).astype(int)
+    model = make().fit(X, y)
+    assert compile_model(model) is None
+
+    artifact = ModelArtifact(None, "test.pkl", model, "v", 0.0, 0)
+    expected = model.predict_proba(X)[:, -1] if hasattr(model, "predict_proba") else model.predict(X)
+    assert np.allclose(artifact.predict_matrix(X), expected, atol=1e-12)
@@ -0,0 +1,59 @@
+from collections import deque
+from types import SimpleNamespace
+
+from worker.lanes import LaneScheduler, parse_lane_weights
+
+
+def _props(user, enqueued_at=None):
+    headers = {"x-user-id": user}
+    if enqueued_at is not None:
+        headers["x-enqueued-at"] = enqueued_at
+    return SimpleNamespace(headers=headers)
+
+
+def test_scheduler_shares_lanes_by_weight_and_interleaves_users():
+    scheduler = LaneScheduler({"interactive": 2, "batch": 1})
+    for i in range(6):
+        scheduler.push("batch", f"b{i}", _props(user=1))
+    # первый пользователь успел поставить три задачи раньше второго
+    for item, user in [("a1", 1), ("a2", 1), ("a3", 1), ("c1", 2)]:
+        scheduler.push("interactive", item, _props(user=user))
+
+    picked = [item for _, item in scheduler.next_batch(6)]
+    assert [item for item in picked if not item.startswith("b")] == ["a1", "c1", "a2", "a3"]
+    assert sum(item.startswith("b") for item in picked) == 2
+
+
+def test_scheduler_reports_wait_per_lane():
+    scheduler = LaneScheduler({"interactive": 1, "batch": 1})
+    scheduler.push("batch", "x", _props(user=1, enqueued_at=1_000_000))
+    scheduler.push("batch", "y", _props(user=1))
+    scheduler.next_batch(10, now=1_003.5)
+
+    stats = scheduler.stats(reset=True)
+    assert stats["batch"]["processed"] == 2
+    assert stats["batch"]["wait_avg"] == 3.5
+    assert stats["interactive"]["wait_avg"] is None
+    assert scheduler.stats()["batch"]["processed"] == 0
+
+
+def test_parse_lane_weights_ignores_garbage():
+    assert parse_lane_weights("interactive:8,batch:x,other:3") == {"interactive": 8, "batch": 1}
+
+
+def test_default_prefetch_interleaves_users():
+    from worker.worker import BATCH_SIZE, PREFETCH
+
+    assert PREFETCH > BATCH_SIZE
+    # брокер отдаёт полосе не больше PREFETCH неподтверждённых сообщений; первый пользователь успел раньше
+    queue = deque([("a", 1), ("a", 1), ("a", 1), ("a", 1), ("b", 2), ("b", 2)])
+    scheduler, unacked, order = LaneScheduler(), 0, []
+    while queue or len(scheduler):
+        while queue and unacked < PREFETCH:
+            item, user = queue.popleft()
+            scheduler.push("interactive", item, _props(user=user))
+            unacked += 1
+        for _, item in scheduler.next_batch(BATCH_SIZE):
+            order.append(item)
+            unacked -= 1
+    assert order == ["a", "b", "a", "b", "a", "a"]
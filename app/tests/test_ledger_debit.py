@@ -0,0 +1,65 @@
+from shared.ledger import _pg_statement, debit, deposit, withdraw
+from shared.models.transaction import Transaction
+from shared.models.user import User
+from shared.models.user_summary import UserSummary
+
+
+def _setup(db, balance=10.0, reserved=0.0):
+    db.add(User(id=1, username="u", email="u@ex.com", password_hash="x", balance=balance, reserved=reserved))
+    db.commit()
+
+
+def _state(db):
+    db.expire_all()
+    summary = db.get(UserSummary, 1)
+    return db.get(User, 1).balance, db.query(Transaction).count(), summary
+
+
+def test_withdraw_without_funds_writes_nothing(sqlite_db):
+    db = sqlite_db
+    _setup(db, balance=10.0, reserved=4.0)
+    # 7 > balance - reserved: чужой резерв трогать нельзя
+    assert withdraw(db, 1, 7.0) is None
+    assert withdraw(db, 99, 1.0) is None
+    db.commit()
+    balance, transactions, summary = _state(db)
+    assert balance == 10.0 and transactions == 0 and summary is None
+
+    entry = withdraw(db, 1, 6.0, task_id="t1")
+    db.commit()
+    assert entry.balance == 4.0 and len(entry.transaction_ids) == 1
+    assert db.get(Transaction, entry.transaction_ids[0]).task_id == "t1"
+
+
+def test_debit_of_several_charges_is_all_or_nothing(sqlite_db):
+    db = sqlite_db
+    _setup(db, balance=10.0)
+    assert debit(db, 1, [(4.0, "a"), (4.0, "b"), (4.0, "c")]) is None
+    db.commit()
+    assert _state(db)[:2] == (10.0, 0)
+
+    entry = debit(db, 1, [(4.0, "a"), (4.0, "b")])
+    db.commit()
+    assert entry.balance == 2.0 and len(entry.transaction_ids) == 2
+    assert sorted(t for (t,) in db.query(Transaction.task_id)) == ["a", "b"]
+
+
+def test_debit_and_deposit_upsert_summary(sqlite_db):
+    db = sqlite_db
+    _setup(db, balance=0.0)
+    assert deposit(db, 1, 10.0).balance == 10.0
+    debit(db, 1, [(2.0, "a"), (3.0, "b")])
+    db.commit()
+    _, transactions, summary = _state(db)
+    assert transactions == 3
+    assert (summary.deposits_count, summary.deposits_total) == (1, 10.0)
+    assert (summary.withdrawals_count, summary.withdrawals_total) == (2, 5.0)
+
+
+def test_postgres_debit_writes_transactions_and_summary_in_one_statement():
+    sql = " ".join(str(_pg_statement("-", True, 2, "withdraw")).split())
+    # UPDATE баланса, вставки и сводка — части одного WITH: без изменённой строки ничего не пишется
+    assert sql.startswith("WITH changed AS ( UPDATE users")
+    assert "INSERT INTO transactions" in sql and "FROM changed CROSS JOIN" in sql
+    assert "INSERT INTO user_summaries (user_id, withdrawals_count, withdrawals_total)" in sql
+    assert "SELECT id, 2, :total FROM changed ON CONFLICT (user_id) DO UPDATE" in sql
@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta, timezone
+
+from shared.ledger import capture, hold, release_holds, sweep_expired_holds
+from shared.models.task import HOLD_CAPTURED, HOLD_HELD, HOLD_RELEASED, Task
+from shared.models.user import User
+
+
+def _setup(db, balance=10.0, holds=(), expires_in=60.0):
+    """Пользователь 1 и его задачи с резервами: holds — (task_id, сумма)."""
+    db.add(User(id=1, username="u", email="u@ex.com", password_hash="x", balance=balance, reserved=0.0))
+    db.add(User(id=2, username="v", email="v@ex.com", password_hash="x", balance=balance, reserved=0.0))
+    db.commit()
+    expires = datetime.now(timezone.utc) + timedelta(seconds=expires_in)
+    for task_id, amount in holds:
+        assert hold(db, 1, amount)
+        db.add(Task(id=task_id, user_id=1, model_id=1, hold_amount=amount, hold_state=HOLD_HELD, hold_expires_at=expires))
+    db.commit()
+
+
+def _user(db, user_id=1):
+    db.expire_all()
+    return db.get(User, user_id)
+
+
+def _hold_state(db, task_id):
+    db.expire_all()
+    return db.get(Task, task_id).hold_state
+
+
+def test_hold_is_rejected_when_balance_is_already_reserved(sqlite_db):
+    _setup(sqlite_db, balance=10.0, holds=[("t1", 6.0)])
+    assert not hold(sqlite_db, 1, 5.0)
+    assert hold(sqlite_db, 1, 4.0)
+    assert not hold(sqlite_db, 99, 1.0)
+    sqlite_db.commit()
+    assert _user(sqlite_db).reserved == 10.0 and _user(sqlite_db).balance == 10.0
+
+
+def test_capture_spends_own_hold_but_not_others(sqlite_db):
+    db = sqlite_db
+    _setup(db, balance=10.0, holds=[("t1", 6.0), ("t2", 4.0)])
+
+    # свой резерв: t1 списывается, хотя доступно 0 (весь баланс зарезервирован)
+    paid, balance = capture(db, 1, [(6.0, "t1")])
+    db.commit()
+    assert paid == [True] and balance == 4.0
+    assert _hold_state(db, "t1") == HOLD_CAPTURED
+    user = _user(db)
+    assert (user.balance, user.reserved) == (4.0, 4.0)
+
+    # задача без резерва не может потратить резерв t2
+    paid, balance = capture(db, 1, [(1.0, "t3")])
+    db.commit()
+    assert paid == [False] and balance is None
+    assert _hold_state(db, "t2") == HOLD_HELD and _user(db).balance == 4.0
+
+    # чужой резерв не засчитывается: у пользователя 2 нет 14 даже вместе с резервом t2
+    paid, balance = capture(db, 2, [(14.0, "t2")])
+    db.commit()
+    assert paid == [False] and _hold_state(db, "t2") == HOLD_HELD
+    user = _user(db)
+    assert (user.balance, user.reserved) == (4.0, 4.0)
+
+
+def test_capture_falls_back_per_charge_and_returns_unpaid_hold(sqlite_db):
+    db = sqlite_db
+    _setup(db, balance=5.0, holds=[("t1", 3.0)])
+    # t1 по своему резерву проходит, t2 (без резерва) — нет: на двоих не хватает
+    paid, balance = capture(db, 1, [(3.0, "t1"), (4.0, "t2")])
+    db.commit()
+    assert paid == [True, False] and balance == 2.0
+    assert _hold_state(db, "t1") == HOLD_CAPTURED
+
+
+def test_unpaid_hold_goes_back_to_held_and_is_released_on_failure(sqlite_db):
+    db = sqlite_db
+    _setup(db, balance=5.0, holds=[("t1", 2.0)])
+    # цена выросла после резерва: не хватает даже с резервом
+    paid, _ = capture(db, 1, [(8.0, "t1")])
+    db.commit()
+    assert paid == [False]
+    assert _hold_state(db, "t1") == HOLD_HELD and _user(db).reserved == 2.0
+
+    assert release_holds(db, ["t1"]) == 1
+    # повторное снятие ничего не делает: резерв уже released
+    assert release_holds(db, ["t1"]) == 0
+    db.commit()
+    assert _hold_state(db, "t1") == HOLD_RELEASED
+    user = _user(db)
+    assert (user.balance, user.reserved) == (5.0, 0.0)
+
+
+def test_sweep_releases_only_expired_holds(sqlite_db):
+    db = sqlite_db
+    _setup(db, balance=10.0, holds=[("old", 3.0)], expires_in=-1.0)
+    assert hold(db, 1, 2.0)
+    db.add(Task(id="new", user_id=1, model_id=1, hold_amount=2.0, hold_state=HOLD_HELD,
+                hold_expires_at=datetime.now(timezone.utc) + timedelta(minutes=5)))
+    db.commit()
+
+    assert sweep_expired_holds(db) == 1
+    db.commit()
+    assert _hold_state(db, "old") == HOLD_RELEASED and _hold_state(db, "new") == HOLD_HELD
+    assert _user(db).reserved == 2.0
+    # снятый резерв не списывается повторно: задача оплачивается из доступного баланса
+    paid, balance = capture(db, 1, [(3.0, "old")])
+    db.commit()
+    assert paid == [True] and balance == 7.0 and _user(db).reserved == 2.0
@@ -0,0 +1,35 @@
+import json
+import logging
+import queue
+
+from shared.log import DROPPED, JsonFormatter, _NonBlockingQueueHandler, task_sampled
+
+
+def _record():
+    return logging.LogRecord("worker", logging.INFO, __file__, 1, "task received", None, None)
+
+
+def test_json_formatter_truncates_large_fields():
+    record = _record()
+    record.fields = {"task_id": "t1", "input": {f"f{i}": i for i in range(200)}, "price": 1.5}
+    data = json.loads(JsonFormatter().format(record))
+    assert data["event"] == "task received" and data["logger"] == "worker" and data["level"] == "info"
+    assert data["task_id"] == "t1" and data["price"] == 1.5
+    assert isinstance(data["input"], str) and "chars)" in data["input"] and len(data["input"]) < 600
+
+
+def test_task_sampling_is_deterministic_per_task():
+    ids = [f"task-{i}" for i in range(2000)]
+    picked = [t for t in ids if task_sampled(t, rate=0.1)]
+    assert 100 < len(picked) < 300
+    assert picked == [t for t in ids if task_sampled(t, rate=0.1)]
+    assert all(task_sampled(t, rate=1.0) for t in ids[:10]) and not any(task_sampled(t, rate=0.0) for t in ids[:10])
+
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = _NonBlockingQueueHandler(queue.Queue(maxsize=1))
+    before = DROPPED.value()
+    for _ in range(3):
+        handler.handle(_record())
+    assert handler.queue.qsize() == 1
+    assert DROPPED.value() == before + 2
@@ -0,0 +1,53 @@
+import os
+import uuid
+
+import pytest
+import requests
+
+from shared.metrics import Registry, start_http_server, stats_samples
+
+BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
+
+
+def test_registry_renders_prometheus_text():
+    reg = Registry()
+    hist = reg.histogram("t_seconds", "time", ["route"], buckets=(0.1, 1.0))
+    hist.observe(0.05, route="/a")
+    hist.observe(0.5, route="/a")
+    hist.observe(5, route="/a")
+    reg.counter("t_events", "events", ["kind"]).inc(2, kind='say "hi"')
+    reg.add_collector(lambda: stats_samples("t_cache", {"hits": 3, "name": "x", "depths": {"q": 1}}, label="queue"))
+    reg.add_collector(lambda: 1 / 0)  # сломанный коллектор не мешает остальным
+
+    text = reg.render()
+    assert '# TYPE t_seconds histogram' in text
+    assert 't_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 't_seconds_bucket{route="/a",le="1"} 2' in text
+    assert 't_seconds_bucket{route="/a",le="+Inf"} 3' in text
+    assert 't_seconds_count{route="/a"} 3' in text
+    assert 't_events_total{kind="say \\"hi\\""} 2' in text
+    assert "t_cache_hits 3" in text and 't_cache_depths{queue="q"} 1' in text
+    assert "t_cache_name" not in text
+    with pytest.raises(ValueError):
+        hist.observe(1.0)
+
+
+def test_worker_metrics_port_serves_registry():
+    server = start_http_server(0, addr="127.0.0.1")
+    try:
+        r = requests.get(f"http://127.0.0.1:{server.server_address[1]}/metrics", timeout=5)
+        assert r.status_code == 200 and r.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    finally:
+        server.shutdown()
+
+
+@pytest.mark.integration
+def test_metrics_endpoint_counts_requests():
+    suf = uuid.uuid4().hex[:8]
+    user = {"username": f"m_{suf}", "email": f"m_{suf}@ex.com", "password": "test123"}
+    assert requests.post(f"{BASE_URL}/register", json=user, timeout=10).status_code == 200
+
+    r = requests.get(f"{BASE_URL}/metrics", timeout=10)
+    assert r.status_code == 200, r.text
+    assert 'ml_http_request_duration_seconds_count{method="POST",route="/register",status="200"}' in r.text
+    assert "ml_http_request_db_queries_bucket" in r.text
@@ -0,0 +1,69 @@
+import pickle
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from shared.ml_model import registry as registry_module  # noqa: E402
+from shared.ml_model.registry import ModelLoadError, ModelRegistry  # noqa: E402
+
+
+def _write(path, obj):
+    with open(path, "wb") as f:
+        pickle.dump(obj, f)
+
+
+def test_broken_reload_keeps_serving_previous_artifact(tmp_path):
+    path = str(tmp_path / "m.pkl")
+    _write(path, {"weights": [1, 2]})
+    reg = ModelRegistry(resolver=lambda model_id: path, check_interval=0.05)
+    good = reg.get(1)
+    assert good.model == {"weights": [1, 2]}
+
+    with open(path, "wb") as f:
+        f.write(b"not a pickle")
+    time.sleep(0.06)
+    assert reg.get(1) is good
+    # до следующей проверки файл не перечитывается
+    assert reg.get(1) is good and reg.stats()["load_errors"] == 1
+
+    # без прежней версии ошибка поднимается, но тоже не чаще check_interval
+    broken = ModelRegistry(resolver=lambda model_id: path, check_interval=60)
+    for _ in range(3):
+        with pytest.raises(ModelLoadError):
+            broken.get(2)
+    assert broken.stats()["load_errors"] == 1
+
+
+def test_slow_load_does_not_block_other_models(tmp_path, monkeypatch):
+    paths = {1: str(tmp_path / "slow.pkl"), 2: str(tmp_path / "fast.pkl")}
+    for model_id, path in paths.items():
+        _write(path, {"id": model_id})
+    entered, release = threading.Event(), threading.Event()
+    read_artifact = registry_module.read_artifact
+
+    def slow_read(model_id, path):
+        if model_id == 1:
+            entered.set()
+            release.wait(5)
+        return read_artifact(model_id, path)
+
+    monkeypatch.setattr(registry_module, "read_artifact", slow_read)
+    reg = ModelRegistry(resolver=paths.get)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(reg.get(1))) for _ in range(2)]
+    for t in threads:
+        t.start()
+    try:
+        assert entered.wait(5)
+        started = time.monotonic()
+        assert reg.get(2).model == {"id": 2}
+        assert time.monotonic() - started < 1
+    finally:
+        release.set()
+        for t in threads:
+            t.join(5)
+    # два потока ждали одну загрузку, а не грузили модель дважды
+    assert len(results) == 2 and results[0] is results[1] and reg.stats()["loads"] == 2
@@ -29,17 +29,26 @@ def test_predict_and_history_with_test_mode():
     p = requests.post(f"{BASE_URL}/predict", json=req, headers=headers, timeout=10)
     assert p.status_code == 200, p.text
     assert "message" in p.json()
+    task_id = p.json()["task_id"]
+    assert task_id
 
     # получаем историю предсказаний
     hist = requests.get(f"{BASE_URL}/predictions/{uid}", headers=headers, timeout=10)
     assert hist.status_code == 200, hist.text
-    items = hist.json()
+    items = hist.json()["items"]
     assert isinstance(items, list) and len(items) >= 1
     latest = items[0]
     assert latest["user_id"] == uid
     assert latest["model_id"] == 1
     assert "prediction" in latest
 
+    # статус задачи — одна строка по id; в TEST_MODE задача уже выполнена
+    task = requests.get(f"{BASE_URL}/tasks/{task_id}", headers=headers, timeout=10)
+    assert task.status_code == 200, task.text
+    assert task.json()["status"] == "done"
+    assert task.json()["prediction_id"] == latest["id"]
+    assert requests.get(f"{BASE_URL}/tasks/{uuid.uuid4()}", headers=headers, timeout=10).status_code == 404
+
 @pytest.mark.integration
 def test_predict_forbidden_other_user():
     # user A
@@ -66,3 +75,51 @@ def test_predict_forbidden_other_user():
         timeout=10
     )
     assert bad.status_code == 403
+
+@pytest.mark.integration
+def test_batch_predict_counts_valid_rows():
+    suf = uuid.uuid4().hex[:8]
+    user = {"username": f"bp_{suf}", "email": f"bp_{suf}@ex.com", "password": "test123"}
+    assert requests.post(f"{BASE_URL}/register", json=user, timeout=10).status_code == 200
+    tok = requests.post(f"{BASE_URL}/token", data={"username": user["username"], "password": user["password"]}, timeout=10)
+    headers = {"Authorization": f"Bearer {tok.json()['access_token']}"}
+    uid = requests.get(f"{BASE_URL}/users/me", headers=headers, timeout=10).json()["id"]
+    dep = requests.post(f"{BASE_URL}/transactions/deposit", json={"user_id": uid, "amount": 1000, "type": "deposit"}, headers=headers, timeout=10)
+    assert dep.status_code == 200, dep.text
+
+    rows = [{"feature1": 1.0, "feature2": 2.0}, {"feature1": 3.0}, {"feature1": "oops"}]
+    r = requests.post(f"{BASE_URL}/predict/batch", json={"user_id": uid, "model_id": 1, "rows": rows}, headers=headers, timeout=10)
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body["accepted"] == 2
+    assert body["rejected"] == 1
+
+    # история листается курсором: limit=1 отдаёт последнюю строку и курсор на следующую
+    first = requests.get(f"{BASE_URL}/predictions/{uid}", params={"limit": 1}, headers=headers, timeout=10)
+    assert first.status_code == 200, first.text
+    page = first.json()
+    assert len(page["items"]) == 1 and page["next_cursor"] is not None
+    second = requests.get(f"{BASE_URL}/predictions/{uid}", params={"limit": 1, "before_id": page["next_cursor"]}, headers=headers, timeout=10)
+    assert second.status_code == 200, second.text
+    assert second.json()["items"][0]["id"] < page["items"][0]["id"]
+
+@pytest.mark.integration
+def test_predict_idempotency_key_returns_same_task():
+    suf = uuid.uuid4().hex[:8]
+    user = {"username": f"ik_{suf}", "email": f"ik_{suf}@ex.com", "password": "test123"}
+    assert requests.post(f"{BASE_URL}/register", json=user, timeout=10).status_code == 200
+    tok = requests.post(f"{BASE_URL}/token", data={"username": user["username"], "password": user["password"]}, timeout=10)
+    headers = {"Authorization": f"Bearer {tok.json()['access_token']}", "Idempotency-Key": uuid.uuid4().hex}
+    uid = requests.get(f"{BASE_URL}/users/me", headers=headers, timeout=10).json()["id"]
+
+    req = {"user_id": uid, "model_id": 1, "input_data": {"feature1": 1.0}}
+    first = requests.post(f"{BASE_URL}/predict", json=req, headers=headers, timeout=10)
+    retry = requests.post(f"{BASE_URL}/predict", json=req, headers=headers, timeout=10)
+    assert first.status_code == 200 and retry.status_code == 200, retry.text
+    assert retry.json()["task_id"] == first.json()["task_id"]
+
+    # повтор не создал вторую задачу и не списал кредиты ещё раз
+    hist = requests.get(f"{BASE_URL}/predictions/{uid}", headers=headers, timeout=10)
+    assert len(hist.json()["items"]) == 1
+    tx = requests.get(f"{BASE_URL}/transactions/{uid}", headers=headers, timeout=10)
+    assert len([t for t in tx.json()["items"] if t["type"] == "withdraw"]) == 1
@@ -0,0 +1,45 @@
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from sqlalchemy.dialects import postgresql  # noqa: E402
+
+from worker.result_cache import ResultCache  # noqa: E402
+
+
+def test_result_cache_hits_canonical_rows_and_invalidates_by_model():
+    cache = ResultCache(maxsize=10, shared=False)
+    rows = [{"feature1": 1, "feature2": 2.0}]
+
+    values, keys = cache.lookup(None, 1, "v1", rows)
+    assert values == [None]
+    cache.store(None, keys, [0.5])
+
+    # порядок ключей и int/float не важны, другая версия модели — промах
+    assert cache.lookup(None, 1, "v1", [{"feature2": 2, "feature1": 1.0}])[0] == [0.5]
+    assert cache.lookup(None, 1, "v2", rows)[0] == [None]
+
+    cache.invalidate(1)
+    assert cache.lookup(None, 1, "v1", rows)[0] == [None]
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 3 and stats["size"] == 0
+
+
+def test_shared_store_inserts_rows_in_key_order():
+    class FakeSession:
+        def __init__(self):
+            self.statements = []
+
+        def execute(self, statement):
+            self.statements.append(statement)
+
+    cache = ResultCache(maxsize=10, shared=True)
+    rows = [{"feature1": i} for i in range(20)] + [{"feature1": 3.0}]
+    _, keys = cache.lookup(None, 1, "v1", rows)
+    db = FakeSession()
+    cache.store(db, keys, [float(i) for i in range(len(keys))])
+
+    (statement,) = db.statements
+    params = statement.compile(dialect=postgresql.dialect()).params
+    inserted = [params[f"key_m{i}"] for i in range(len(params)) if f"key_m{i}" in params]
+    assert len(inserted) == 20 and inserted == sorted(inserted)
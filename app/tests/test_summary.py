@@ -0,0 +1,27 @@
+from shared.models.prediction import Prediction
+from shared.models.transaction import Transaction
+from shared.models.user import User
+from shared.models.user_summary import UserSummary
+from shared.summary import backfill_summaries, record_predictions
+
+
+def test_backfill_builds_summary_from_history_once(sqlite_db):
+    db = sqlite_db
+    db.add(User(id=1, username="u", email="u@ex.com", password_hash="x", balance=5.0))
+    db.add_all([
+        Transaction(user_id=1, amount=10.0, type="deposit"),
+        Transaction(user_id=1, amount=3.0, type="withdraw"),
+        Transaction(user_id=1, amount=2.0, type="withdraw"),
+        Prediction(user_id=1, model_id=1, prediction="0.5", cost=3.0),
+    ])
+    db.commit()
+
+    assert backfill_summaries(db) == 1
+    # дальше — только инкременты, повторный backfill строку не трогает
+    record_predictions(db, {1: (1, 2.0)})
+    assert backfill_summaries(db) == 0
+    db.commit()
+    summary = db.get(UserSummary, 1)
+    assert (summary.deposits_count, summary.deposits_total) == (1, 10.0)
+    assert (summary.withdrawals_count, summary.withdrawals_total) == (2, 5.0)
+    assert (summary.predictions_count, summary.predictions_cost) == (2, 5.0)
@@ -0,0 +1,15 @@
+from worker.supervisor import RESTART_BACKOFF_MAX, RESTART_STABLE_SECONDS, Supervisor
+
+
+def test_restart_backoff_resets_after_stable_run():
+    sup = Supervisor(concurrency=1)
+    sup._started_at[0] = 0.0
+    # падения сразу после старта: задержка растёт до потолка
+    delays = [sup._restart_delay(0, now=1.0) for _ in range(6)]
+    assert delays == [2, 4, 8, 16, RESTART_BACKOFF_MAX, RESTART_BACKOFF_MAX]
+    # воркер проработал дольше RESTART_STABLE_SECONDS — следующее падение снова с короткой задержкой
+    sup._started_at[0] = 100.0
+    assert sup._restart_delay(0, now=100.0 + RESTART_STABLE_SECONDS) == 2
+    # перезапущенный воркер снова падает сразу — backoff растёт дальше
+    sup._started_at[0] = 200.0
+    assert sup._restart_delay(0, now=201.0) == 4
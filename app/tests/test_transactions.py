@@ -1,3 +1,5 @@
+import gzip
+import json
 import os
 import uuid
 import requests
@@ -29,7 +31,7 @@ def test_deposit_and_list():
     assert res.status_code == 200, res.text
     lst = requests.get(f"{BASE_URL}/transactions/{me['id']}", headers=headers, timeout=10)
     assert lst.status_code == 200
-    assert any(tx["type"] == "deposit" and tx["amount"] >= 50 for tx in lst.json())
+    assert any(tx["type"] == "deposit" and tx["amount"] >= 50 for tx in lst.json()["items"])
 
 @pytest.mark.integration
 def test_transactions_forbidden_other_user():
@@ -43,3 +45,29 @@ def test_transactions_forbidden_other_user():
     me1 = requests.get(f"{BASE_URL}/users/me", headers={"Authorization": f"Bearer {t1.json()['access_token']}"}, timeout=10).json()
     res = requests.get(f"{BASE_URL}/transactions/{me1['id']}", headers=headers2, timeout=10)
     assert res.status_code == 403
+
+@pytest.mark.integration
+def test_export_transactions_csv_and_ndjson_gzip():
+    user = unique_user()
+    headers = {"Authorization": f"Bearer {login(user)}"}
+    uid = requests.get(f"{BASE_URL}/users/me", headers=headers, timeout=10).json()["id"]
+    for amount in (5, 7):
+        res = requests.post(f"{BASE_URL}/transactions/deposit", json={"user_id": uid, "amount": amount, "type": "deposit"}, headers=headers, timeout=10)
+        assert res.status_code == 200, res.text
+
+    csv_res = requests.get(f"{BASE_URL}/transactions/{uid}/export", headers=headers, timeout=10)
+    assert csv_res.status_code == 200, csv_res.text
+    assert csv_res.headers["content-type"].startswith("text/csv")
+    lines = csv_res.text.splitlines()
+    assert lines[0] == "id,type,amount,task_id,created_at"
+    assert [line.split(",")[2] for line in lines[1:]] == ["7.0", "5.0"]  # от новых к старым
+
+    nd = requests.get(f"{BASE_URL}/transactions/{uid}/export", params={"format": "ndjson", "gzip": "true"}, headers=headers, timeout=10)
+    assert nd.status_code == 200, nd.text
+    assert nd.headers["content-disposition"].endswith(f'"transactions-{uid}.ndjson.gz"')
+    rows = [json.loads(line) for line in gzip.decompress(nd.content).decode().splitlines()]
+    assert [r["amount"] for r in rows] == [7.0, 5.0] and rows[0]["type"] == "deposit"
+
+    other = unique_user()
+    other_headers = {"Authorization": f"Bearer {login(other)}"}
+    assert requests.get(f"{BASE_URL}/transactions/{uid}/export", headers=other_headers, timeout=10).status_code == 403
@@ -0,0 +1,38 @@
+import threading
+import time
+
+import worker.worker
+from app.services.transport import InlineTransport, MemoryTransport
+
+
+def test_memory_transport_processes_tasks_in_background(monkeypatch):
+    processed, done = [], threading.Event()
+
+    def fake_process(tasks):
+        processed.extend(t["task_id"] for t in tasks)
+        if len(processed) == 3:
+            done.set()
+
+    monkeypatch.setattr(worker.worker, "process_tasks", fake_process)
+    monkeypatch.setattr(worker.worker, "HOLD_SWEEP_INTERVAL", 0)  # без БД
+    transport = MemoryTransport(workers=1)
+    try:
+        for i, lane in enumerate(["interactive", "batch", "interactive"]):
+            transport.publish({"task_id": f"t{i}", "user_id": 1}, lane)
+        assert done.wait(5)
+        assert sorted(processed) == ["t0", "t1", "t2"]
+        deadline = time.monotonic() + 5
+        while transport.pressure("interactive")[0] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert transport.pressure("interactive") == (0, False)
+        assert transport.stats()["published"] == 3
+    finally:
+        transport.close()
+
+
+def test_inline_transport_runs_task_before_returning(monkeypatch):
+    calls = []
+    monkeypatch.setattr(worker.worker, "process_tasks", lambda tasks: calls.append(tasks))
+    transport = InlineTransport()
+    transport.publish({"task_id": "t", "user_id": 1}, "interactive")
+    assert transport.synchronous and calls == [[{"task_id": "t", "user_id": 1}]]
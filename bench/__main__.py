@@ -0,0 +1,94 @@
+"""
+Нагрузочные прогоны и микробенчмарки; отчёт — JSON, два отчёта сравниваются командой diff.
+
+    python -m bench http --base-url http://localhost:8000 -c 16 -n 2000 [--traffic traffic.jsonl] --out http.json
+    python -m bench micro [-n 2000] --out micro.json
+    python -m bench diff old.json new.json
+"""
+import argparse
+import itertools
+import json
+import sys
+from typing import List, Optional
+
+from bench.stats import diff_reports, run_meta
+
+
+def _write(report: dict, out: Optional[str]) -> None:
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if out:
+        with open(out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"[bench] report written to {out}")
+    else:
+        print(text)
+
+
+def _http(args) -> dict:
+    from bench.load import DEFAULT_MIX, create_users, load_traffic, parse_mix, run_load, synthetic_traffic
+
+    if args.traffic:
+        items = load_traffic(args.traffic)
+        total = args.requests or len(items)
+        traffic = itertools.cycle(items)
+    else:
+        total = args.requests or 1000
+        traffic = synthetic_traffic(parse_mix(args.mix or DEFAULT_MIX), args.model_id, args.seed)
+    base_url = args.base_url.rstrip("/")
+    users = create_users(base_url, args.users, args.deposit)
+    print(f"[bench] {total} requests, concurrency={args.concurrency}, users={len(users)} -> {base_url}")
+    result = run_load(base_url, traffic, total, args.concurrency, users, args.timeout)
+    meta = run_meta(
+        mode="http", base_url=base_url, concurrency=args.concurrency, requests=total,
+        users=args.users, traffic=args.traffic or f"synthetic:{args.mix or DEFAULT_MIX}", seed=args.seed,
+    )
+    return {"meta": meta, **result}
+
+
+def _micro(args) -> dict:
+    from bench.micro import run_micro
+
+    result = run_micro(args.iterations, args.warmup, args.seed)
+    meta = run_meta(mode="micro", iterations=args.iterations, warmup=args.warmup, seed=args.seed)
+    return {"meta": meta, **result}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Бенчмарки ML-сервиса")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_http = sub.add_parser("http", help="нагрузка на запущенный API")
+    p_http.add_argument("--base-url", default="http://localhost:8000")
+    p_http.add_argument("-c", "--concurrency", type=int, default=8)
+    p_http.add_argument("-n", "--requests", type=int, default=0, help="число запросов (0 — 1000 или весь файл трафика)")
+    p_http.add_argument("--traffic", help="JSONL-файл операций; без него трафик синтетический")
+    p_http.add_argument("--mix", help="веса синтетического трафика, например predict:4,history:3,poll:2,token:1")
+    p_http.add_argument("--users", type=int, default=4, help="сколько пользователей создать для прогона")
+    p_http.add_argument("--deposit", type=float, default=100000.0, help="пополнение каждого пользователя")
+    p_http.add_argument("--model-id", type=int, default=1)
+    p_http.add_argument("--timeout", type=float, default=30.0)
+
+    p_micro = sub.add_parser("micro", help="микробенчмарки без брокера (SQLite или DATABASE_URL)")
+    p_micro.add_argument("-n", "--iterations", type=int, default=2000)
+    p_micro.add_argument("--warmup", type=int, default=20)
+
+    for p in (p_http, p_micro):
+        p.add_argument("--seed", type=int, default=1)
+        p.add_argument("--out", help="файл отчёта (по умолчанию — stdout)")
+
+    p_diff = sub.add_parser("diff", help="сравнить два отчёта")
+    p_diff.add_argument("old")
+    p_diff.add_argument("new")
+
+    args = parser.parse_args(argv)
+    if args.command == "diff":
+        with open(args.old, encoding="utf-8") as f_old, open(args.new, encoding="utf-8") as f_new:
+            lines = diff_reports(json.load(f_old), json.load(f_new))
+        print("\n".join(lines) if lines else "no common measurements")
+        return
+    report = _http(args) if args.command == "http" else _micro(args)
+    _write(report, args.out)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,176 @@
+"""
+Нагрузка на запущенный API: /token, /predict, /predictions/{id}, /web/poll.
+
+Трафик — JSONL-файл (по операции в строке, файл проигрывается по кругу) или
+синтетический по весам --mix. Строка файла:
+
+    {"op": "predict", "model_id": 1, "input_data": {"feature1": 1.0}}
+    {"op": "history", "limit": 20}
+    {"op": "token"}
+    {"op": "poll"}
+"""
+import json
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+import requests
+
+from bench.stats import summarize
+
+OPS = ("token", "predict", "history", "poll")
+DEFAULT_MIX = "token:1,predict:4,history:3,poll:2"
+BENCH_PASSWORD = "bench123"
+
+
+def parse_mix(raw: str) -> Dict[str, int]:
+    """"predict:4,poll:1" -> {"predict": 4, "poll": 1}; неизвестные операции и мусор пропускаются."""
+    mix = {}
+    for part in raw.split(","):
+        op, _, weight = part.partition(":")
+        op = op.strip()
+        try:
+            w = int(weight)
+        except ValueError:
+            continue
+        if op in OPS and w > 0:
+            mix[op] = w
+    return mix
+
+
+def load_traffic(path: str) -> List[dict]:
+    ops = []
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if item.get("op") not in OPS:
+                raise ValueError(f"{path}:{n}: unknown op {item.get('op')!r}")
+            ops.append(item)
+    return ops
+
+
+def synthetic_traffic(mix: Dict[str, int], model_id: int, seed: int) -> Iterator[dict]:
+    rnd = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    while True:
+        op = rnd.choices(names, weights)[0]
+        item = {"op": op}
+        if op == "predict":
+            item["model_id"] = model_id
+            item["input_data"] = {f"feature{i}": round(rnd.uniform(0, 10), 3) for i in (1, 2, 3)}
+        yield item
+
+
+class BenchUser:
+    def __init__(self, username: str, user_id: int, token: str):
+        self.username = username
+        self.user_id = user_id
+        self.token = token
+
+
+def create_users(base_url: str, n: int, deposit: float) -> List[BenchUser]:
+    """Новые пользователи прогона с пополненным балансом, чтобы /predict не упирался в 400."""
+    users = []
+    for _ in range(n):
+        name = f"bench_{uuid.uuid4().hex[:10]}"
+        r = requests.post(
+            f"{base_url}/register",
+            json={"username": name, "email": f"{name}@example.com", "password": BENCH_PASSWORD},
+            timeout=30,
+        )
+        r.raise_for_status()
+        token = requests.post(f"{base_url}/token", data={"username": name, "password": BENCH_PASSWORD}, timeout=30)
+        token.raise_for_status()
+        access = token.json()["access_token"]
+        headers = {"Authorization": f"Bearer {access}"}
+        user_id = requests.get(f"{base_url}/users/me", headers=headers, timeout=30).json()["id"]
+        if deposit > 0:
+            requests.post(
+                f"{base_url}/transactions/deposit",
+                json={"user_id": user_id, "amount": deposit, "type": "deposit"},
+                headers=headers,
+                timeout=30,
+            ).raise_for_status()
+        users.append(BenchUser(name, user_id, access))
+    return users
+
+
+def _request(session: requests.Session, base_url: str, user: BenchUser, item: dict, timeout: float) -> requests.Response:
+    op = item["op"]
+    headers = {"Authorization": f"Bearer {user.token}"}
+    if op == "token":
+        return session.post(
+            f"{base_url}/token", data={"username": user.username, "password": BENCH_PASSWORD}, timeout=timeout
+        )
+    if op == "predict":
+        body = {"user_id": user.user_id, "model_id": item.get("model_id", 1), "input_data": item.get("input_data", {})}
+        return session.post(f"{base_url}/predict", json=body, headers=headers, timeout=timeout)
+    if op == "history":
+        params = {"limit": item.get("limit", 20)}
+        return session.get(f"{base_url}/predictions/{user.user_id}", params=params, headers=headers, timeout=timeout)
+    # poll: веб-клиент авторизуется cookie с тем же JWT
+    return session.get(f"{base_url}/web/poll", cookies={"access_token": user.token}, timeout=timeout)
+
+
+def run_load(
+    base_url: str,
+    traffic: Iterator[dict],
+    total: int,
+    concurrency: int,
+    users: List[BenchUser],
+    timeout: float = 30.0,
+) -> dict:
+    """
+    total запросов в concurrency потоков (у каждого свой requests.Session).
+    Ошибка — исключение или статус >= 400; задержки ошибок в перцентили не входят.
+    """
+    base_url = base_url.rstrip("/")
+    lock = threading.Lock()
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    statuses: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    local = threading.local()
+
+    def next_item() -> Optional[dict]:
+        with lock:
+            return next(traffic, None)
+
+    def one(i: int) -> None:
+        item = next_item()
+        if item is None:
+            return
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        op = item["op"]
+        started = time.perf_counter()
+        try:
+            status = _request(session, base_url, users[i % len(users)], item, timeout).status_code
+        except requests.RequestException as e:
+            status = type(e).__name__
+        elapsed = time.perf_counter() - started
+        with lock:
+            statuses[op][str(status)] += 1
+            if isinstance(status, int) and status < 400:
+                latencies[op].append(elapsed)
+            else:
+                errors[op] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    wall = time.perf_counter() - started
+
+    ops = {
+        op: {**summarize(latencies[op], wall, errors[op]), "statuses": dict(statuses[op])}
+        for op in sorted(set(latencies) | set(errors))
+    }
+    all_latencies = [v for values in latencies.values() for v in values]
+    return {"elapsed_s": round(wall, 3), "total": summarize(all_latencies, wall, sum(errors.values())), "ops": ops}
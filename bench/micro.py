@@ -0,0 +1,110 @@
+"""
+Микробенчмарки горячих функций воркера без брокера и HTTP: linear_predict,
+загрузчик модели и handle_task целиком на SQLite (или на DATABASE_URL).
+"""
+import io
+import os
+import random
+import tempfile
+import time
+from contextlib import redirect_stdout
+from typing import Callable, Dict, List
+
+from bench.stats import summarize
+
+
+def time_calls(fn: Callable[[], object], iterations: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        fn()
+    latencies: List[float] = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def _features(rnd: random.Random) -> Dict[str, float]:
+    return {f"feature{i}": round(rnd.uniform(0, 10), 3) for i in (1, 2, 3)}
+
+
+def _bench_linear(iterations: int, warmup: int, rnd: random.Random) -> Dict[str, dict]:
+    from worker.worker import linear_predict, linear_predict_many
+
+    row = _features(rnd)
+    rows = [_features(rnd) for _ in range(1000)]
+    return {
+        "linear_predict": time_calls(lambda: linear_predict(row), iterations, warmup),
+        "linear_predict_many_1000": time_calls(lambda: linear_predict_many(rows), max(1, iterations // 10), warmup),
+    }
+
+
+def _bench_model_loader(iterations: int, warmup: int) -> Dict[str, dict]:
+    from shared.ml_model.model_loader import MODEL_PATH, load_model
+    from shared.ml_model.registry import ModelLoadError, read_artifact
+
+    try:
+        load_model()
+    except (OSError, ModelLoadError) as e:
+        return {"load_model": {"error": str(e)}}
+    return {
+        # файл не менялся: stat и сравнение с закэшированным артефактом
+        "load_model": time_calls(load_model, iterations, warmup),
+        # холодная загрузка: чтение и распаковка pickle
+        "read_artifact": time_calls(lambda: read_artifact(None, MODEL_PATH), max(1, iterations // 100), 1),
+    }
+
+
+def _bench_handle_task(iterations: int, warmup: int, rnd: random.Random) -> Dict[str, dict]:
+    """handle_task на свежих задачах: статус задачи, скоринг линейной формулой, списание, prediction."""
+    from shared.db import SessionLocal, sync_schema
+    from shared.models.ml_model import MLModel
+    from shared.models.user import User
+    from app.services.task_service import new_task
+    from worker.worker import handle_task
+
+    sync_schema()
+    db = SessionLocal()
+    try:
+        user = User(
+            username=f"bench_{rnd.getrandbits(32):08x}", email=f"{rnd.getrandbits(32):08x}@example.com",
+            password_hash="-", balance=10.0 ** 9,
+        )
+        model = MLModel(name="bench linear", description="micro benchmark", price=1.0)
+        db.add_all([user, model])
+        db.commit()
+        user_id, model_id = user.id, model.id
+
+        def one() -> None:
+            task = new_task(db, user_id=user_id, model_id=model_id)
+            db.commit()
+            message = {"task_id": task.id, "user_id": user_id, "model_id": model_id, "input_data": _features(rnd), "price": 1.0}
+            # в замер идёт только обработка сообщения, как в воркере
+            t0 = time.perf_counter()
+            handle_task(db, message)
+            samples.append(time.perf_counter() - t0)
+
+        samples: List[float] = []
+        with redirect_stdout(io.StringIO()):
+            for _ in range(warmup):
+                one()
+            samples.clear()
+            for _ in range(iterations):
+                one()
+        # throughput — по времени самой обработки, без подготовки задач
+        return {"handle_task": summarize(samples, sum(samples))}
+    finally:
+        db.close()
+
+
+def run_micro(iterations: int, warmup: int, seed: int) -> dict:
+    # без явной БД — временный SQLite-файл; задать нужно до первого импорта shared.db
+    if not os.getenv("DATABASE_URL"):
+        os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='bench-')}/bench.db"
+    rnd = random.Random(seed)
+    results: Dict[str, dict] = {}
+    results.update(_bench_linear(iterations, warmup, rnd))
+    results.update(_bench_model_loader(iterations, warmup))
+    results.update(_bench_handle_task(max(1, iterations // 10), warmup, rnd))
+    return {"database": os.environ["DATABASE_URL"].split("@")[-1], "results": results}
@@ -0,0 +1,62 @@
+import math
+import os
+import subprocess
+import time
+from typing import Dict, List, Optional
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Перцентиль по ближайшему рангу; sorted_values — уже отсортированы и не пусты."""
+    rank = max(1, math.ceil(p / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int = 0) -> Dict[str, Optional[float]]:
+    """Задержки в секундах -> p50/p95/p99/mean/max в мс и пропускная способность (операций в секунду)."""
+    values = sorted(latencies)
+    summary: Dict[str, Optional[float]] = {"count": len(values), "errors": errors}
+    if not values:
+        return {**summary, "p50_ms": None, "p95_ms": None, "p99_ms": None, "mean_ms": None, "max_ms": None, "throughput": 0.0}
+    for p in (50, 95, 99):
+        summary[f"p{p}_ms"] = round(percentile(values, p) * 1000, 4)
+    summary["mean_ms"] = round(sum(values) / len(values) * 1000, 4)
+    summary["max_ms"] = round(values[-1] * 1000, 4)
+    summary["throughput"] = round(len(values) / elapsed, 2) if elapsed > 0 else None
+    return summary
+
+
+def run_meta(**params) -> dict:
+    """Что нужно, чтобы сравнивать прогоны: когда, на каком коммите и с какими параметрами."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "cpu_count": os.cpu_count(),
+        **params,
+    }
+
+
+# метрики, по которым сравниваются отчёты: для задержек меньше — лучше, для throughput — больше
+COMPARED = ("p50_ms", "p95_ms", "p99_ms", "throughput")
+
+
+def diff_reports(old: dict, new: dict) -> List[str]:
+    """Строки сравнения двух отчётов по одинаковым именам замеров (new / old)."""
+    lines = []
+    for section in ("results", "ops"):
+        for name, before in old.get(section, {}).items():
+            after = new.get(section, {}).get(name)
+            if not after:
+                continue
+            parts = []
+            for key in COMPARED:
+                a, b = before.get(key), after.get(key)
+                if a and b is not None:
+                    parts.append(f"{key} {a} -> {b} ({b / a:.2f}x)")
+            lines.append(f"{section}.{name}: " + ", ".join(parts))
+    return lines
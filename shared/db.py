@@ -1,14 +1,23 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.schema import CreateColumn
 from sqlalchemy.orm import sessionmaker, declarative_base
 
-DATABASE_URL = (
+from shared.metrics import instrument_engine, instrument_sessions
+
+# DATABASE_URL целиком (например, sqlite:///bench.db для локальных прогонов) важнее POSTGRES_*
+DATABASE_URL = os.getenv("DATABASE_URL") or (
     f"postgresql://{os.getenv('POSTGRES_USER')}:{os.getenv('POSTGRES_PASSWORD')}"
     f"@{os.getenv('POSTGRES_HOST', 'ml_postgres')}:5432/{os.getenv('POSTGRES_DB', 'ml_service')}"
 )
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+# SQLite-соединение используется из потоков threadpool, а не только из создавшего его
+_connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+engine = create_engine(DATABASE_URL, pool_pre_ping=True, connect_args=_connect_args)
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+# время SQL-запросов и commit — в метрики процесса
+instrument_engine(engine)
+instrument_sessions(SessionLocal)
 Base = declarative_base()
 
 def get_db():
@@ -17,3 +26,24 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def sync_schema() -> None:
+    """
+    create_all + недостающие колонки и индексы в уже существующих таблицах.
+    Миграций в проекте нет, поэтому новые колонки должны быть nullable или с server_default.
+    """
+    Base.metadata.create_all(bind=engine)
+    existing_tables = set(inspect(engine).get_table_names())
+    with engine.begin() as conn:
+        insp = inspect(conn)
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            columns = {c["name"] for c in insp.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    ddl = CreateColumn(column).compile(dialect=conn.dialect)
+                    conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
@@ -0,0 +1,217 @@
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import case, insert, select, text, update
+from sqlalchemy.orm import Session
+
+from shared.models.task import Task, HOLD_HELD, HOLD_CAPTURED, HOLD_RELEASED
+from shared.models.transaction import Transaction
+from shared.models.user import User
+from shared.summary import TRANSACTION_COLUMNS, record_transactions
+
+WITHDRAW = "withdraw"
+DEPOSIT = "deposit"
+
+
+class InsufficientFunds(Exception):
+    """Доступных средств (balance - reserved) не хватает на резерв задачи."""
+
+
+class LedgerEntry(NamedTuple):
+    balance: float  # баланс сразу после операции
+    transaction_ids: List[int]
+
+
+# (сумма, task_id) — одна строка в transactions; списание/зачисление идёт на их сумму
+Charge = Tuple[float, Optional[str]]
+
+
+def _pg_statement(sign: str, conditional: bool, n: int, type: str):
+    values = ", ".join(f"(CAST(:a{i} AS DOUBLE PRECISION), CAST(:t{i} AS VARCHAR))" for i in range(n))
+    count_column, total_column = TRANSACTION_COLUMNS[type]
+    # чужие резервы трогать нельзя, свой (held) списание снимает
+    condition = " AND balance - reserved + :held >= :total" if conditional else ""
+    # UPDATE и INSERT в одном выражении: строка пользователя заблокирована только на время этого запроса
+    # (и до commit), а транзакции и сводка (user_summaries) пишутся только если UPDATE что-то изменил
+    return text(
+        f"""
+        WITH changed AS (
+            UPDATE users SET balance = balance {sign} :total,
+                reserved = CASE WHEN reserved > :held THEN reserved - :held ELSE 0 END
+            WHERE id = :user_id{condition}
+            RETURNING id, balance
+        ), tx AS (
+            INSERT INTO transactions (user_id, amount, type, task_id)
+            SELECT changed.id, v.amount, :type, v.task_id
+            FROM changed CROSS JOIN (VALUES {values}) AS v(amount, task_id)
+            RETURNING id
+        ), summary AS (
+            INSERT INTO user_summaries (user_id, {count_column}, {total_column})
+            SELECT id, {n}, :total FROM changed
+            ON CONFLICT (user_id) DO UPDATE SET
+                {count_column} = user_summaries.{count_column} + EXCLUDED.{count_column},
+                {total_column} = user_summaries.{total_column} + EXCLUDED.{total_column},
+                updated_at = now()
+        )
+        SELECT (SELECT balance FROM changed) AS balance, (SELECT array_agg(id) FROM tx) AS ids
+        """
+    )
+
+
+def _reserved_minus(amount: float):
+    return case((User.reserved > amount, User.reserved - amount), else_=0.0)
+
+
+def _apply(
+    db: Session, user_id: int, charges: Sequence[Charge], type: str, conditional: bool, held: float = 0.0
+) -> Optional[LedgerEntry]:
+    if not charges:
+        return None
+    total = float(sum(amount for amount, _ in charges))
+    sign = "-" if type == WITHDRAW else "+"
+
+    if db.get_bind().dialect.name == "postgresql":
+        params = {"user_id": user_id, "total": total, "type": type, "held": float(held)}
+        for i, (amount, task_id) in enumerate(charges):
+            params[f"a{i}"] = float(amount)
+            params[f"t{i}"] = task_id
+        balance, ids = db.execute(_pg_statement(sign, conditional, len(charges), type), params).one()
+        if balance is None:
+            return None
+        return LedgerEntry(float(balance), sorted(ids or []))
+
+    # SQLite и прочие: условный UPDATE по rowcount, затем вставки (база блокируется целиком до commit)
+    stmt = update(User).where(User.id == user_id)
+    if conditional:
+        stmt = stmt.where(User.balance - User.reserved + held >= total)
+    new_balance = User.balance - total if type == WITHDRAW else User.balance + total
+    result = db.execute(
+        stmt.values(balance=new_balance, reserved=_reserved_minus(held)).execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        return None
+    ids = [
+        db.execute(
+            insert(Transaction).values(user_id=user_id, amount=float(amount), type=type, task_id=task_id)
+        ).inserted_primary_key[0]
+        for amount, task_id in charges
+    ]
+    record_transactions(db, user_id, type, len(ids), total)
+    balance = db.execute(select(User.balance).where(User.id == user_id)).scalar_one()
+    return LedgerEntry(float(balance), ids)
+
+
+def debit(db: Session, user_id: int, charges: Sequence[Charge], held: float = 0.0) -> Optional[LedgerEntry]:
+    """
+    Списывает сумму charges, только если доступных средств (balance - reserved
+    плюс собственный резерв held, который при этом снимается) хватает на всё
+    сразу; по строке withdraw на каждую charge. None — пользователя нет или
+    не хватает средств. Коммитит вызывающий; до commit строка пользователя
+    остаётся заблокированной, поэтому скоринг и прочую работу делайте до вызова.
+    """
+    return _apply(db, user_id, charges, WITHDRAW, conditional=True, held=held)
+
+
+def withdraw(db: Session, user_id: int, amount: float, task_id: Optional[str] = None) -> Optional[LedgerEntry]:
+    return debit(db, user_id, [(amount, task_id)])
+
+
+def deposit(db: Session, user_id: int, amount: float) -> Optional[LedgerEntry]:
+    """None — пользователя нет."""
+    return _apply(db, user_id, [(amount, None)], DEPOSIT, conditional=False)
+
+
+def hold(db: Session, user_id: int, amount: float) -> bool:
+    """Резервирует amount из доступных средств одним условным UPDATE; False — не хватает (или нет пользователя)."""
+    if amount <= 0:
+        return True
+    result = db.execute(
+        update(User)
+        .where(User.id == user_id, User.balance - User.reserved >= amount)
+        .values(reserved=User.reserved + amount)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def claim_holds(
+    db: Session, task_ids: Sequence[str], state: str, user_id: Optional[int] = None
+) -> Dict[str, Tuple[int, float]]:
+    """
+    Переводит резервы задач из held в state; task_id -> (user_id, сумма) только
+    для тех, что были held (и принадлежат user_id, если он задан). Условие по
+    hold_state делает захват и снятие (воркер и sweeper одновременно) взаимоисключающими.
+    """
+    if not task_ids:
+        return {}
+    conditions = [Task.id.in_(list(task_ids)), Task.hold_state == HOLD_HELD]
+    if user_id is not None:
+        conditions.append(Task.user_id == user_id)
+    stmt = update(Task).where(*conditions).values(hold_state=state).execution_options(synchronize_session=False)
+    if db.get_bind().dialect.name == "postgresql":
+        rows = db.execute(stmt.returning(Task.id, Task.user_id, Task.hold_amount)).all()
+    else:
+        rows = db.execute(select(Task.id, Task.user_id, Task.hold_amount).where(*conditions)).all()
+        db.execute(stmt)
+    return {task_id: (user_id, float(amount or 0.0)) for task_id, user_id, amount in rows}
+
+
+def release_holds(db: Session, task_ids: Sequence[str]) -> int:
+    """Снимает резервы задач (ошибка, истечение); возвращает сколько снято. Коммитит вызывающий."""
+    claimed = claim_holds(db, task_ids, HOLD_RELEASED)
+    by_user: Dict[int, float] = defaultdict(float)
+    for user_id, amount in claimed.values():
+        by_user[user_id] += amount
+    for user_id in sorted(by_user):
+        db.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(reserved=_reserved_minus(by_user[user_id]))
+            .execution_options(synchronize_session=False)
+        )
+    return len(claimed)
+
+
+def capture(db: Session, user_id: int, charges: Sequence[Charge]) -> Tuple[List[bool], Optional[float]]:
+    """
+    Списание за задачи воркером: резервы задач захватываются и списываются
+    вместе с оплатой. Если на все задачи не хватает, списывает по одной в
+    порядке charges. Возвращает флаги «оплачено» и баланс после списаний.
+    Резерв неоплаченной задачи возвращается в held — его снимет release_holds.
+    """
+    # только резервы задач этого пользователя: чужой резерв не должен увеличить его доступные средства
+    holds = claim_holds(db, [task_id for _, task_id in charges if task_id], HOLD_CAPTURED, user_id=user_id)
+    entry = debit(db, user_id, charges, held=sum(amount for _, amount in holds.values()))
+    if entry is not None:
+        return [True] * len(charges), entry.balance
+
+    paid, balance = [], None
+    for amount, task_id in charges:
+        held = holds[task_id][1] if task_id in holds else 0.0
+        entry = debit(db, user_id, [(amount, task_id)], held=held)
+        if entry is not None:
+            balance = entry.balance
+        elif task_id in holds:
+            db.execute(
+                update(Task).where(Task.id == task_id).values(hold_state=HOLD_HELD).execution_options(synchronize_session=False)
+            )
+        paid.append(entry is not None)
+    return paid, balance
+
+
+def sweep_expired_holds(db: Session, limit: int = 500) -> int:
+    """
+    Снимает резервы, срок которых истёк (задача застряла в очереди, публикация
+    потерялась). Сама задача не трогается: если её всё же обработают,
+    списание пройдёт по доступному балансу. Коммитит вызывающий.
+    """
+    ids = [
+        task_id
+        for (task_id,) in db.execute(
+            select(Task.id)
+            .where(Task.hold_state == HOLD_HELD, Task.hold_expires_at < datetime.now(timezone.utc))
+            .limit(limit)
+        )
+    ]
+    return release_holds(db, ids)
@@ -0,0 +1,177 @@
+"""
+Логи процессов API и воркера: структурированные события вместо print().
+
+Вызывающий поток только создаёт LogRecord и кладёт его в ограниченную очередь
+(QueueHandler); форматирование (JSON, обрезка больших полей) и запись в stdout
+делает фоновый поток QueueListener. Переполненная очередь не блокирует
+горячий путь — запись отбрасывается и учитывается в метрике
+ml_log_records_dropped. Пер-задачные события (task) пишутся для доли задач
+LOG_TASK_SAMPLE_RATE, решение детерминировано по task_id: у выбранной задачи
+видны все её события, ошибки пишутся всегда.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import zlib
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+from shared.metrics import registry
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# json — одна строка JSON на событие (для сборщика логов), text — «[worker] событие поле=значение»
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# доля задач, чьи события task попадают в лог (1 — все, 0 — ни одной)
+LOG_TASK_SAMPLE_RATE = min(1.0, max(0.0, float(os.getenv("LOG_TASK_SAMPLE_RATE", "0.1"))))
+# поле длиннее — обрезается (input_data пакета, payload задачи)
+LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "512"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+DROPPED = registry.counter("ml_log_records_dropped", "Записи лога, отброшенные из-за переполненной очереди")
+
+
+def _truncate(value: Any, limit: int) -> Any:
+    if isinstance(value, (bool, int, float)) or value is None:
+        return value
+    if not isinstance(value, str):
+        text = json.dumps(value, ensure_ascii=False, default=str)
+        if len(text) <= limit:
+            return value
+        value = text
+    if len(value) <= limit:
+        return value
+    return f"{value[:limit]}...(+{len(value) - limit} chars)"
+
+
+def record_fields(record: logging.LogRecord, limit: int = LOG_MAX_FIELD_CHARS) -> Dict[str, Any]:
+    return {k: _truncate(v, limit) for k, v in getattr(record, "fields", {}).items()}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.getMessage(),
+            "pid": record.process,
+            **record_fields(record),
+        }
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        fields = " ".join(f"{k}={v}" for k, v in record_fields(record).items())
+        line = f"[{record.name}] {record.getMessage()}" + (f" {fields}" if fields else "")
+        if record.levelno >= logging.WARNING:
+            line = f"{record.levelname} {line}"
+        return line + (f"\n{record.exc_text}" if record.exc_text else "")
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # стандартный prepare форматирует сообщение в вызывающем потоке; здесь — только
+        # traceback (его нельзя отложить) и снимок словаря полей, остальное — в фоне
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if hasattr(record, "fields"):
+            record.fields = dict(record.fields)
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED.inc()
+
+
+def task_sampled(task_id: Optional[str], rate: float = None) -> bool:
+    """Попадает ли задача в выборку логов: одно и то же решение во всех процессах."""
+    rate = LOG_TASK_SAMPLE_RATE if rate is None else rate
+    if rate >= 1.0 or not task_id:
+        return rate > 0.0
+    return zlib.crc32(str(task_id).encode("utf-8")) % 10000 < rate * 10000
+
+
+class EventLogger:
+    """
+    log.info("task done", task_id=..., balance=...) — событие и поля; поля
+    форматируются в фоне, поэтому передавать их можно как есть (dict, list),
+    но нельзя менять после вызова.
+    """
+
+    def __init__(self, name: str):
+        self.logger = logging.getLogger(name)
+
+    def _log(self, level: int, event: str, fields: Dict[str, Any], exc_info: bool = False) -> None:
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, event, exc_info=exc_info, extra={"fields": fields})
+
+    def debug(self, event: str, **fields: Any) -> None:
+        self._log(logging.DEBUG, event, fields)
+
+    def info(self, event: str, **fields: Any) -> None:
+        self._log(logging.INFO, event, fields)
+
+    def warning(self, event: str, **fields: Any) -> None:
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event: str, exc_info: bool = False, **fields: Any) -> None:
+        self._log(logging.ERROR, event, fields, exc_info=exc_info)
+
+    def task(self, event: str, task_id: Optional[str], **fields: Any) -> None:
+        """Пер-задачное событие уровня INFO, с выборкой по task_id."""
+        if self.logger.isEnabledFor(logging.INFO) and task_sampled(task_id):
+            self.logger.log(logging.INFO, event, extra={"fields": {"task_id": task_id, **fields}})
+
+
+def get_logger(name: str) -> EventLogger:
+    return EventLogger(name)
+
+
+_listener: Optional[QueueListener] = None
+_listener_pid: Optional[int] = None
+_setup_lock = threading.Lock()
+
+
+def setup_logging(stream=None) -> None:
+    """
+    Корневой логгер процесса -> очередь -> фоновый поток -> stdout. Повторный
+    вызов в том же процессе ничего не делает; в дочернем процессе (spawn) — свой listener.
+    """
+    global _listener, _listener_pid
+    with _setup_lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            return
+        handler = logging.StreamHandler(stream or sys.stdout)
+        handler.setFormatter(TextFormatter() if LOG_FORMAT == "text" else JsonFormatter())
+        log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=max(1, LOG_QUEUE_SIZE))
+        root = logging.getLogger()
+        for old in [h for h in root.handlers if isinstance(h, _NonBlockingQueueHandler)]:
+            root.removeHandler(old)
+        root.addHandler(_NonBlockingQueueHandler(log_queue))
+        root.setLevel(LOG_LEVEL)
+        # pika пишет каждое соединение/канал на INFO
+        logging.getLogger("pika").setLevel(max(logging.WARNING, root.level))
+        _listener = QueueListener(log_queue, handler, respect_handler_level=True)
+        _listener.start()
+        _listener_pid = os.getpid()
+        atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Дописывает очередь и останавливает фоновый поток (atexit, shutdown приложения)."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            _listener.stop()
+        _listener = None
@@ -0,0 +1,309 @@
+"""
+Метрики в текстовом формате Prometheus без внешних зависимостей.
+
+Счётчики и гистограммы с метками обновляются на горячем пути (под одним
+коротким lock на метрику); коллекторы — функции, которые на каждом scrape
+превращают уже существующую статистику сервисов (stats()) в gauge'и.
+Всё живёт в памяти процесса: API отдаёт /metrics, у каждого процесса-воркера
+свой порт (WORKER_METRICS_PORT + номер слота).
+"""
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# секунды: от долей миллисекунды (скоринг, простой SELECT) до десятков секунд (ожидание в очереди)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+# (имя, метки, значение)
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_sample(name: str, labels: Dict[str, str], value: float) -> str:
+    if labels:
+        body = ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items())
+        return f"{name}{{{body}}} {_format_value(value)}"
+    return f"{name} {_format_value(value)}"
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {sorted(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = list(self._values.items())
+        return [(f"{self.name}_total", dict(zip(self.labelnames, key)), value) for key, value in items]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # по меткам: [счётчики по корзинам (+Inf последней), сумма]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            data[0][index] += 1
+            data[1] += value
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels: Any) -> int:
+        with self._lock:
+            data = self._values.get(self._key(labels))
+            return sum(data[0]) if data else 0
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        out: List[Sample] = []
+        for key, counts, total in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                out.append((f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            out.append((f"{self.name}_count", labels, cumulative))
+            out.append((f"{self.name}_sum", labels, total))
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"metric {name} already registered as {metric.type}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def histogram(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets)
+
+    def add_collector(self, collector: Callable[[], Iterable[Sample]]) -> None:
+        """collector() -> сэмплы gauge; вызывается на каждом scrape, ошибка одного коллектора не роняет остальные."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines: List[str] = []
+        for metric in metrics:
+            samples = metric.samples()
+            if not samples:
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(_format_sample(*s) for s in samples)
+        gauges: Dict[str, List[Sample]] = {}
+        for collector in collectors:
+            try:
+                for sample in collector():
+                    gauges.setdefault(sample[0], []).append(sample)
+            except Exception as e:
+                # shared.log сам регистрирует метрики — импорт здесь, а не в начале модуля
+                from shared.log import get_logger
+
+                get_logger("metrics").warning("collector failed", collector=getattr(collector, "__name__", repr(collector)), error=repr(e))
+        for name, samples in gauges.items():
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(_format_sample(*s) for s in samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def stats_samples(prefix: str, stats: Dict[str, Any], label: str = "key", **labels: str) -> Iterator[Sample]:
+    """
+    Словарь stats() -> сэмплы gauge: числа и bool — как есть (prefix_<ключ>),
+    вложенный словарь чисел — одна метрика с меткой label. Строки и None пропускаются.
+    """
+    for key, value in stats.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, (int, float)):
+            yield name, dict(labels), float(value)
+        elif isinstance(value, dict):
+            for sub, v in value.items():
+                if isinstance(v, (int, float)):
+                    yield name, {**labels, label: str(sub)}, float(v)
+
+
+def hit_ratio(stats: Dict[str, Any], hits: Sequence[str] = ("hits",), misses: Sequence[str] = ("misses",)) -> Optional[float]:
+    hit = sum(stats.get(k, 0) for k in hits)
+    total = hit + sum(stats.get(k, 0) for k in misses)
+    return hit / total if total else None
+
+
+# ---- БД: время запросов и commit, число запросов на HTTP-запрос ----
+
+DB_QUERY_SECONDS = registry.histogram(
+    "ml_db_query_duration_seconds", "Время выполнения SQL-запроса", ["statement"]
+)
+DB_COMMIT_SECONDS = registry.histogram("ml_db_commit_duration_seconds", "Время commit сессии (включая flush)")
+
+# [число запросов, суммарное время] текущего HTTP-запроса; выставляет middleware API
+_request_queries: ContextVar[Optional[list]] = ContextVar("request_queries", default=None)
+
+
+def _statement_kind(statement: str) -> str:
+    word = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else ""
+    return word if word in ("select", "insert", "update", "delete") else "other"
+
+
+def instrument_engine(engine) -> None:
+    """Время каждого SQL-запроса engine (события cursor execute), счёт — в текущий HTTP-запрос."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["metrics_started"].pop()
+        elapsed = time.perf_counter() - started
+        DB_QUERY_SECONDS.observe(elapsed, statement=_statement_kind(statement))
+        current = _request_queries.get()
+        if current is not None:
+            current[0] += 1
+            current[1] += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        # запрос упал — after_cursor_execute не будет, снимаем отметку начала
+        conn = context.connection
+        if conn is not None and conn.info.get("metrics_started"):
+            conn.info["metrics_started"].pop()
+
+
+def instrument_sessions(session_factory) -> None:
+    """Время commit сессий фабрики: от before_commit (до flush) до after_commit."""
+
+    @event.listens_for(session_factory, "before_commit")
+    def _before(session):
+        session.info["metrics_commit_started"] = time.perf_counter()
+
+    @event.listens_for(session_factory, "after_commit")
+    def _after(session):
+        started = session.info.pop("metrics_commit_started", None)
+        if started is not None:
+            DB_COMMIT_SECONDS.observe(time.perf_counter() - started)
+
+    @event.listens_for(session_factory, "after_rollback")
+    def _rollback(session):
+        session.info.pop("metrics_commit_started", None)
+
+
+@contextmanager
+def track_queries() -> Iterator[list]:
+    """[число запросов, секунды] SQL-запросов, выполненных внутри блока (в том числе в threadpool)."""
+    current = [0, 0.0]
+    token = _request_queries.set(current)
+    try:
+        yield current
+    finally:
+        _request_queries.reset(token)
+
+
+# ---- HTTP-порт метрик для процессов без веб-сервера (воркер) ----
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port: int, addr: str = "0.0.0.0") -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((addr, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
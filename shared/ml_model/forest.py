@@ -0,0 +1,158 @@
+from typing import List, Optional
+
+import numpy as np
+
+# столько строк обходим за раз, чтобы промежуточные массивы (строки x деревья) не разрастались
+CHUNK_ROWS = 4096
+
+
+class CompiledForest:
+    """
+    Ансамбль деревьев sklearn, разложенный в плоские массивы узлов.
+
+    Все деревья лежат подряд: feature/threshold/left/right/value индексируются
+    глобальным номером узла, roots — номера корней. У листьев left == right ==
+    сам узел, поэтому обход — это max_depth векторных шагов для всех строк и
+    всех деревьев сразу, без ветвлений на Python. value хранит уже
+    нормированные вероятности классов (или значение регрессии) в листе.
+    """
+
+    def __init__(
+        self,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        left: np.ndarray,
+        right: np.ndarray,
+        value: np.ndarray,
+        roots: np.ndarray,
+        max_depth: int,
+        n_features: int,
+        classes: Optional[np.ndarray],
+    ):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        # Для обхода узел k хранится под индексом 2k: в ячейке 2k+go_right лежит
+        # (удвоенный) номер потомка, так что шаг — это три take без арифметики над индексами.
+        self._feature2 = np.repeat(feature, 2)
+        self._threshold2 = np.repeat(threshold, 2)
+        self._children2 = np.stack([left, right], axis=1).ravel() * 2
+        self.roots = roots
+        self.max_depth = max_depth
+        self.n_features = n_features
+        self.classes = classes
+
+    @property
+    def is_classifier(self) -> bool:
+        return self.classes is not None
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.feature, self.threshold, self.left, self.right, self.value, self.roots,
+                  self._feature2, self._threshold2, self._children2)
+        return sum(a.nbytes for a in arrays)
+
+    @classmethod
+    def from_sklearn(cls, model) -> "CompiledForest":
+        estimators = list(getattr(model, "estimators_", [model]))
+        classes = getattr(model, "classes_", None)
+        if classes is not None and np.ndim(classes) != 1:
+            raise ValueError("multi-output classifiers are not supported")
+
+        features: List[np.ndarray] = []
+        thresholds: List[np.ndarray] = []
+        lefts: List[np.ndarray] = []
+        rights: List[np.ndarray] = []
+        values: List[np.ndarray] = []
+        roots: List[int] = []
+        offset, max_depth = 0, 0
+        for est in estimators:
+            tree = est.tree_
+            n = tree.node_count
+            own = np.arange(n, dtype=np.int64)
+            is_leaf = tree.children_left == -1
+
+            features.append(np.where(is_leaf, 0, tree.feature).astype(np.intp))
+            thresholds.append(tree.threshold.astype(np.float64))
+            lefts.append(np.where(is_leaf, own, tree.children_left).astype(np.intp) + offset)
+            rights.append(np.where(is_leaf, own, tree.children_right).astype(np.intp) + offset)
+
+            value = tree.value[:, 0, :].astype(np.float64)
+            if classes is not None:
+                # как DecisionTreeClassifier.predict_proba: доли классов в листе
+                totals = value.sum(axis=1, keepdims=True)
+                totals[totals == 0.0] = 1.0
+                value = value / totals
+            values.append(value)
+
+            roots.append(offset)
+            offset += n
+            max_depth = max(max_depth, int(tree.max_depth))
+
+        return cls(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            left=np.concatenate(lefts),
+            right=np.concatenate(rights),
+            value=np.concatenate(values),
+            roots=np.asarray(roots, dtype=np.intp),
+            max_depth=max_depth,
+            n_features=int(getattr(model, "n_features_in_", 0)),
+            classes=np.asarray(classes) if classes is not None else None,
+        )
+
+    def _leaves(self, X: np.ndarray) -> np.ndarray:
+        """Номера листьев, shape (n_rows, n_trees)."""
+        # sklearn сравнивает признаки, приведённые к float32, с порогами float64
+        X32 = np.ascontiguousarray(X, dtype=np.float32).astype(np.float64)
+        n_rows, n_trees = X32.shape[0], self.roots.shape[0]
+        flat_x = X32.ravel()
+        nodes2 = np.tile(self.roots * 2, n_rows)
+        if n_rows == 1:
+            for _ in range(self.max_depth):
+                go_right = flat_x.take(self._feature2.take(nodes2)) > self._threshold2.take(nodes2)
+                nodes2 = self._children2.take(nodes2 + go_right)
+        else:
+            # смещение строки в плоском X для каждой пары (строка, дерево)
+            row_base = np.repeat(np.arange(n_rows, dtype=np.intp) * X32.shape[1], n_trees)
+            for _ in range(self.max_depth):
+                go_right = flat_x.take(row_base + self._feature2.take(nodes2)) > self._threshold2.take(nodes2)
+                nodes2 = self._children2.take(nodes2 + go_right)
+        return (nodes2 // 2).reshape(n_rows, n_trees)
+
+    def predict_proba(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        out = np.empty((X.shape[0], self.value.shape[1]), dtype=np.float64)
+        for start in range(0, X.shape[0], CHUNK_ROWS):
+            chunk = X[start:start + CHUNK_ROWS]
+            out[start:start + chunk.shape[0]] = self.value[self._leaves(chunk)].mean(axis=1)
+        return out
+
+    def predict(self, X) -> np.ndarray:
+        proba = self.predict_proba(X)
+        if self.is_classifier:
+            return self.classes[np.argmax(proba, axis=1)]
+        return proba[:, 0]
+
+
+def compile_model(model) -> Optional[CompiledForest]:
+    """
+    CompiledForest для одиночных деревьев и лесов sklearn (RandomForest, ExtraTrees),
+    None — для остальных моделей. У AdaBoost, Bagging и GradientBoosting тоже есть
+    estimators_, но их predict — не среднее по листьям (веса, подмножества признаков,
+    сумма шагов), поэтому они скорятся самим sklearn.
+    """
+    try:
+        from sklearn.ensemble._forest import BaseForest
+        from sklearn.tree import BaseDecisionTree
+    except ImportError:
+        return None
+    if not isinstance(model, (BaseForest, BaseDecisionTree)):
+        return None
+    if getattr(model, "n_outputs_", 1) != 1:
+        return None
+    return CompiledForest.from_sklearn(model)
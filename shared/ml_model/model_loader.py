@@ -1,9 +1,19 @@
-import pickle
 import os
+import threading
+
+from shared.ml_model.registry import ModelArtifact, read_artifact
 
 MODEL_PATH = os.getenv("MODEL_PATH", "shared/ml_model/heart_failure.pkl")
 
+_cached: ModelArtifact | None = None
+_lock = threading.Lock()
+
+
 def load_model():
-    with open(MODEL_PATH, "rb") as f:
-        model = pickle.load(f)
-    return model
+    """Модель из MODEL_PATH; повторно файл читается только если изменился на диске."""
+    global _cached
+    with _lock:
+        st = os.stat(MODEL_PATH)
+        if _cached is None or _cached.path != MODEL_PATH or (_cached.mtime, _cached.file_size) != (st.st_mtime, st.st_size):
+            _cached = read_artifact(None, MODEL_PATH)
+        return _cached.model
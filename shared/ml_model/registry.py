@@ -0,0 +1,257 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from shared.ml_model.forest import compile_model
+from shared.log import get_logger
+
+log = get_logger("registry")
+
+MODEL_CACHE_MAX_BYTES = int(os.getenv("MODEL_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# как часто (сек) сверять файл артефакта и путь в ml_models
+MODEL_RELOAD_CHECK_INTERVAL = float(os.getenv("MODEL_RELOAD_CHECK_INTERVAL", "5"))
+
+
+class ModelLoadError(Exception):
+    pass
+
+
+class ModelArtifact:
+    """Загруженный артефакт модели и то, что нужно, чтобы его скорить."""
+
+    def __init__(self, model_id: Optional[int], path: str, model, version: str, mtime: float, file_size: int):
+        self.model_id = model_id
+        self.path = path
+        self.model = model
+        self.version = version
+        self.mtime = mtime
+        self.file_size = file_size
+        self.loaded_at = time.time()
+        self.feature_names = self._feature_names(model)
+        # деревья/леса sklearn скорятся через плоские массивы узлов, а не predict_proba
+        self.engine = compile_model(model)
+        self.size_bytes = file_size + (self.engine.nbytes if self.engine is not None else 0)
+
+    @staticmethod
+    def _feature_names(model) -> List[str]:
+        names = getattr(model, "feature_names_in_", None)
+        if names is not None:
+            return [str(n) for n in names]
+        n_features = int(getattr(model, "n_features_in_", 0))
+        return [f"feature{i + 1}" for i in range(n_features)]
+
+    def rows_to_matrix(self, rows: List[Dict[str, float]]) -> np.ndarray:
+        matrix = np.array([[row.get(name, 0.0) for name in self.feature_names] for row in rows], dtype=np.float64)
+        return matrix.reshape(len(rows), len(self.feature_names))
+
+    def predict_matrix(self, matrix: np.ndarray) -> np.ndarray:
+        """Для классификаторов — вероятность положительного класса, иначе predict."""
+        if self.engine is not None:
+            proba = self.engine.predict_proba(matrix)
+            return proba[:, -1] if self.engine.is_classifier else proba[:, 0]
+        if hasattr(self.model, "predict_proba"):
+            return self.model.predict_proba(matrix)[:, -1]
+        return np.asarray(self.model.predict(matrix), dtype=np.float64)
+
+
+class _Entry:
+    def __init__(
+        self, path: Optional[str], artifact: Optional[ModelArtifact], checked_at: float, error: Optional[str] = None
+    ):
+        self.path = path
+        self.artifact = artifact
+        self.checked_at = checked_at
+        # загрузка упала, а прежнего артефакта нет — до следующей проверки get() сразу поднимает ошибку
+        self.error = error
+
+
+def read_artifact(model_id: Optional[int], path: str) -> ModelArtifact:
+    try:
+        st = os.stat(path)
+        with open(path, "rb") as f:
+            raw = f.read()
+        model = pickle.loads(raw)
+    except Exception as e:
+        raise ModelLoadError(f"cannot load model {model_id} from {path}: {e}") from e
+    version = hashlib.sha256(raw).hexdigest()[:16]
+    return ModelArtifact(model_id, path, model, version, st.st_mtime, len(raw))
+
+
+def db_artifact_path(model_id: int) -> Optional[str]:
+    """Путь к артефакту из ml_models.artifact_path (None — у модели нет артефакта)."""
+    from shared.db import SessionLocal
+    from shared.models.ml_model import MLModel
+
+    db = SessionLocal()
+    try:
+        row = db.query(MLModel.artifact_path).filter(MLModel.id == model_id).first()
+        return row[0] if row and row[0] else None
+    finally:
+        db.close()
+
+
+class ModelRegistry:
+    """
+    ml_models.id -> загруженный артефакт.
+
+    Артефакты грузятся лениво и живут в LRU с бюджетом по памяти (размер
+    pickle-файла плюс скомпилированные массивы леса как оценка). Раз в check_interval для модели сверяются путь
+    в БД и mtime/размер файла; при изменении файл перечитывается, и если
+    sha256 другой — артефакт подменяется (hot reload) и вызываются слушатели.
+    """
+
+    def __init__(
+        self,
+        resolver: Callable[[int], Optional[str]] = db_artifact_path,
+        max_bytes: int = MODEL_CACHE_MAX_BYTES,
+        check_interval: float = MODEL_RELOAD_CHECK_INTERVAL,
+    ):
+        self._resolver = resolver
+        self._max_bytes = max_bytes
+        self._check_interval = check_interval
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._loading: Dict[int, threading.Lock] = {}
+        self._listeners: List[Callable[[int, Optional[ModelArtifact]], None]] = []
+        self._stats = {"hits": 0, "misses": 0, "loads": 0, "reloads": 0, "evictions": 0, "load_errors": 0}
+
+    def add_reload_listener(self, callback: Callable[[int, Optional[ModelArtifact]], None]) -> None:
+        self._listeners.append(callback)
+
+    def get(self, model_id: int) -> Optional[ModelArtifact]:
+        with self._lock:
+            entry = self._fresh(model_id, time.monotonic())
+            if entry is not None:
+                self._stats["hits"] += 1
+                return self._result(entry)
+            self._stats["misses"] += 1
+            loading = self._loading.setdefault(model_id, threading.Lock())
+        # Чтение файла и unpickle — без общего lock: медленная загрузка одной модели
+        # не держит остальные. Одну модель грузит один поток, прочие ждут его результат.
+        with loading:
+            with self._lock:
+                entry = self._fresh(model_id, time.monotonic())
+                if entry is not None:
+                    return self._result(entry)
+                entry = self._entries.get(model_id)
+            return self._refresh(model_id, entry)
+
+    def warm(self, model_ids: Iterable[int]) -> None:
+        for model_id in model_ids:
+            try:
+                artifact = self.get(model_id)
+                if artifact is not None:
+                    log.info("warmed model", model_id=model_id, path=artifact.path, version=artifact.version)
+            except ModelLoadError as e:
+                log.warning("warmup failed", error=str(e))
+
+    def stats(self) -> dict:
+        with self._lock:
+            data = dict(self._stats)
+            data["models"] = sum(1 for e in self._entries.values() if e.artifact is not None)
+            data["bytes"] = self._used_bytes()
+            data["max_bytes"] = self._max_bytes
+        return data
+
+    def _fresh(self, model_id: int, now: float) -> Optional[_Entry]:
+        entry = self._entries.get(model_id)
+        if entry is not None and now - entry.checked_at < self._check_interval:
+            self._entries.move_to_end(model_id)
+            return entry
+        return None
+
+    @staticmethod
+    def _result(entry: _Entry) -> Optional[ModelArtifact]:
+        if entry.error is not None:
+            raise ModelLoadError(entry.error)
+        return entry.artifact
+
+    def _refresh(self, model_id: int, entry: Optional[_Entry]) -> Optional[ModelArtifact]:
+        """Вызывается под lock загрузки модели, но не под общим lock реестра."""
+        path = self._resolver(model_id)
+        old = entry.artifact if entry is not None else None
+
+        try:
+            if path is None:
+                artifact = None
+            elif old is not None and old.path == path and self._unchanged(old):
+                artifact = old
+            else:
+                artifact = read_artifact(model_id, path)
+                with self._lock:
+                    self._stats["loads"] += 1
+                if old is not None and old.version == artifact.version:
+                    # файл тронули, но содержимое то же — оставляем загруженный объект
+                    old.mtime, old.file_size = artifact.mtime, artifact.file_size
+                    artifact = old
+                elif old is not None:
+                    with self._lock:
+                        self._stats["reloads"] += 1
+        except ModelLoadError as e:
+            # битый артефакт не роняет рабочую модель: отдаём прежнюю версию,
+            # следующая попытка — через check_interval, а не на каждом вызове
+            log.warning("model reload failed", model_id=model_id, error=str(e), serving=old.version if old else None)
+            with self._lock:
+                self._stats["load_errors"] += 1
+                if old is None:
+                    self._entries[model_id] = _Entry(path, None, time.monotonic(), error=str(e))
+                    raise
+                self._entries[model_id] = _Entry(entry.path, old, time.monotonic())
+                self._entries.move_to_end(model_id)
+            return old
+
+        with self._lock:
+            self._entries[model_id] = _Entry(path, artifact, time.monotonic())
+            self._entries.move_to_end(model_id)
+            if artifact is not old:
+                self._evict(keep=model_id)
+        if artifact is not old:
+            for callback in self._listeners:
+                callback(model_id, artifact)
+        return artifact
+
+    @staticmethod
+    def _unchanged(artifact: ModelArtifact) -> bool:
+        try:
+            st = os.stat(artifact.path)
+        except OSError:
+            return True  # файл пропал — продолжаем отдавать загруженную версию
+        return st.st_mtime == artifact.mtime and st.st_size == artifact.file_size
+
+    def _used_bytes(self) -> int:
+        return sum(e.artifact.size_bytes for e in self._entries.values() if e.artifact is not None)
+
+    def _evict(self, keep: int) -> None:
+        while self._used_bytes() > self._max_bytes:
+            victim = next((mid for mid, e in self._entries.items() if mid != keep and e.artifact is not None), None)
+            if victim is None:
+                return
+            del self._entries[victim]
+            self._stats["evictions"] += 1
+
+
+_default_registry: Optional[ModelRegistry] = None
+_default_lock = threading.Lock()
+
+
+def get_registry() -> ModelRegistry:
+    global _default_registry
+    if _default_registry is None:
+        with _default_lock:
+            if _default_registry is None:
+                _default_registry = ModelRegistry()
+    return _default_registry
+
+
+def parse_warmup(value: str) -> Tuple[bool, List[int]]:
+    """MODEL_WARMUP: "all" или список id через запятую."""
+    value = (value or "").strip()
+    if value.lower() == "all":
+        return True, []
+    return False, [int(s) for s in value.split(",") if s.strip()]
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float
+from sqlalchemy import Boolean, Column, Integer, String, Float, false
 from shared.db import Base
 
 class MLModel(Base):
@@ -8,3 +8,7 @@ class MLModel(Base):
     name = Column(String, nullable=False)
     description = Column(String)
     price = Column(Float, nullable=False)
+    # путь к pickle-артефакту; NULL — модель считается линейной формулой воркера
+    artifact_path = Column(String, nullable=True)
+    # дешёвая модель: /predict считает её прямо в запросе (быстрый путь), без очереди
+    is_cheap = Column(Boolean, nullable=False, server_default=false())
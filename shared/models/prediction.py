@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Float, func
+from sqlalchemy import Index, Column, Integer, String, ForeignKey, DateTime, Float, func
 from shared.db import Base
 
 class Prediction(Base):
@@ -9,4 +9,8 @@ class Prediction(Base):
     model_id = Column(Integer, nullable=False)
     prediction = Column(String, nullable=False)
     cost = Column(Float, nullable=False, default=0.0)
+    task_id = Column(String(36), nullable=True, index=True)  # tasks.id; NULL у старых записей
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+# история пользователя читается страницами в порядке (created_at DESC, id DESC)
+Index("ix_predictions_user_created_id", Prediction.user_id, Prediction.created_at.desc(), Prediction.id.desc())
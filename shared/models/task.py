@@ -0,0 +1,35 @@
+from sqlalchemy import Index, Column, Integer, Float, String, ForeignKey, DateTime, func
+from shared.db import Base
+
+TASK_QUEUED = "queued"
+TASK_RUNNING = "running"
+TASK_DONE = "done"
+TASK_FAILED = "failed"
+
+# резерв средств под задачу: held -> captured (списан воркером) или released (ошибка/истёк)
+HOLD_HELD = "held"
+HOLD_CAPTURED = "captured"
+HOLD_RELEASED = "released"
+
+class Task(Base):
+    __tablename__ = "tasks"
+
+    id = Column(String(36), primary_key=True)  # uuid4, передаётся в сообщении очереди
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    model_id = Column(Integer, nullable=False)
+    status = Column(String, nullable=False, default=TASK_QUEUED)  # queued/running/done/failed
+    n_rows = Column(Integer, nullable=False, default=1)
+    prediction_id = Column(Integer, nullable=True)  # первая строка predictions этой задачи
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    idempotency_key = Column(String(255), nullable=True)  # заголовок Idempotency-Key клиента
+    hold_amount = Column(Float, nullable=True)  # зарезервировано в users.reserved при постановке
+    hold_state = Column(String(16), nullable=True)  # held/captured/released; NULL — без резерва
+    hold_expires_at = Column(DateTime(timezone=True), nullable=True)
+
+# повтор запроса с тем же ключом возвращает уже созданную задачу (NULL-ключи не конфликтуют)
+Index("uq_tasks_user_idempotency_key", Task.user_id, Task.idempotency_key, unique=True)
+# sweeper ищет просроченные резервы
+Index("ix_tasks_hold_state_expires", Task.hold_state, Task.hold_expires_at)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Float, String, ForeignKey, DateTime, func
+from sqlalchemy import Index, Column, Integer, Float, String, ForeignKey, DateTime, func
 from shared.db import Base
 
 class Transaction(Base):
@@ -8,4 +8,10 @@ class Transaction(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     amount = Column(Float, nullable=False)
     type = Column(String, nullable=False)  # "deposit" or "withdraw"
+    task_id = Column(String(36), nullable=True)  # списание за задачу tasks.id
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+# история пользователя читается страницами в порядке (created_at DESC, id DESC)
+Index("ix_transactions_user_created_id", Transaction.user_id, Transaction.created_at.desc(), Transaction.id.desc())
+# не больше одного списания на задачу: повторная доставка сообщения не спишет кредиты дважды
+Index("uq_transactions_task_id", Transaction.task_id, unique=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float
+from sqlalchemy import Column, Integer, String, Float, text
 from shared.db import Base
 
 class User(Base):
@@ -9,3 +9,5 @@ class User(Base):
     email = Column(String, unique=True, index=True)
     password_hash = Column(String, nullable=False)
     balance = Column(Float, default=0.0)
+    # сумма hold'ов задач в очереди: доступно для новых задач balance - reserved
+    reserved = Column(Float, nullable=False, default=0.0, server_default=text("0"))
@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Integer, Float, ForeignKey, DateTime, func, text
+from shared.db import Base
+
+class UserSummary(Base):
+    """Агрегаты истории пользователя для дашборда; обновляются инкрементально вместе с записью истории."""
+    __tablename__ = "user_summaries"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    predictions_count = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    predictions_cost = Column(Float, nullable=False, default=0.0, server_default=text("0"))
+    deposits_count = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    deposits_total = Column(Float, nullable=False, default=0.0, server_default=text("0"))
+    withdrawals_count = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    withdrawals_total = Column(Float, nullable=False, default=0.0, server_default=text("0"))
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,22 @@
+import json
+from typing import Iterable
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# канал Postgres LISTEN/NOTIFY: воркер сообщает о новых предсказаниях, приложение раздаёт их по SSE
+PREDICTIONS_CHANNEL = "predictions_ready"
+
+
+def notify_users(db: Session, user_ids: Iterable[int]) -> None:
+    """
+    pg_notify в текущей транзакции: слушатели получат уведомление только после commit
+    (и не получат при rollback). На других СУБД — ничего не делает.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    for user_id in sorted(set(user_ids)):
+        db.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": PREDICTIONS_CHANNEL, "payload": json.dumps({"user_id": int(user_id)})},
+        )
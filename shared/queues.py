@@ -0,0 +1,21 @@
+import os
+from typing import Dict
+
+# интерактивная полоса остаётся в QUEUE_NAME: уже накопленные сообщения обработаются как раньше
+QUEUE_NAME = os.getenv("QUEUE_NAME", "ml_tasks")
+QUEUE_BATCH_NAME = os.getenv("QUEUE_BATCH_NAME", f"{QUEUE_NAME}.batch")
+
+LANE_INTERACTIVE = "interactive"
+LANE_BATCH = "batch"
+LANE_QUEUES: Dict[str, str] = {LANE_INTERACTIVE: QUEUE_NAME, LANE_BATCH: QUEUE_BATCH_NAME}
+
+# пакеты не длиннее стольких строк считаются интерактивными (дашборд, одиночные /predict)
+INTERACTIVE_MAX_ROWS = int(os.getenv("LANE_INTERACTIVE_MAX_ROWS", "10"))
+
+# заголовки, которые ставит паблишер: время постановки (мс, epoch) и владелец задачи
+ENQUEUED_AT_HEADER = "x-enqueued-at"
+USER_HEADER = "x-user-id"
+
+
+def lane_for_rows(n_rows: int) -> str:
+    return LANE_INTERACTIVE if n_rows <= INTERACTIVE_MAX_ROWS else LANE_BATCH
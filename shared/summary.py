@@ -0,0 +1,113 @@
+from typing import Dict, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from shared.db import SessionLocal
+from shared.log import get_logger
+from shared.models.prediction import Prediction
+from shared.models.transaction import Transaction
+from shared.models.user import User
+from shared.models.user_summary import UserSummary
+
+log = get_logger("summary")
+
+# тип транзакции -> (колонка числа, колонка суммы) в user_summaries
+TRANSACTION_COLUMNS = {
+    "deposit": ("deposits_count", "deposits_total"),
+    "withdraw": ("withdrawals_count", "withdrawals_total"),
+}
+
+
+def _add(db: Session, rows: Dict[int, Dict[str, float]]) -> None:
+    """user_id -> {колонка: прибавка}; строка сводки создаётся, если её ещё нет."""
+    if not rows:
+        return
+    insert = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    columns = sorted({c for deltas in rows.values() for c in deltas})
+    # порядок user_id — как у списаний в ledger, чтобы воркеры не ждали друг друга по кругу
+    stmt = insert(UserSummary).values(
+        [{"user_id": user_id, **{c: rows[user_id].get(c, 0) for c in columns}} for user_id in sorted(rows)]
+    )
+    set_ = {c: getattr(UserSummary, c) + getattr(stmt.excluded, c) for c in columns}
+    set_["updated_at"] = func.now()
+    db.execute(stmt.on_conflict_do_update(index_elements=["user_id"], set_=set_))
+
+
+def record_transactions(db: Session, user_id: int, type: str, count: int, total: float) -> None:
+    count_column, total_column = TRANSACTION_COLUMNS[type]
+    _add(db, {user_id: {count_column: count, total_column: total}})
+
+
+def record_predictions(db: Session, per_user: Dict[int, Tuple[int, float]]) -> None:
+    """user_id -> (число новых предсказаний, их суммарная стоимость); в транзакции вставки предсказаний."""
+    _add(db, {user_id: {"predictions_count": n, "predictions_cost": cost} for user_id, (n, cost) in per_user.items() if n})
+
+
+def get_summary(db: Session, user_id: int) -> UserSummary:
+    """Сводка пользователя; у пользователя без истории — нулевая (в БД не пишется)."""
+    summary = db.get(UserSummary, user_id)
+    if summary is None:
+        summary = UserSummary(
+            user_id=user_id,
+            predictions_count=0,
+            predictions_cost=0.0,
+            deposits_count=0,
+            deposits_total=0.0,
+            withdrawals_count=0,
+            withdrawals_total=0.0,
+        )
+    return summary
+
+
+def backfill_summaries(db: Session) -> int:
+    """
+    Строит сводку по всей истории для пользователей, у которых её ещё нет
+    (таблица появилась после них), одним INSERT ... SELECT. Дальше сводка
+    только инкрементируется; уже существующую строку не трогаем, поэтому
+    backfill должен пройти раньше первой инкрементальной записи (ensure_summaries).
+    """
+    def tx_agg(type: str, agg):
+        return select(agg).where(Transaction.user_id == User.id, Transaction.type == type).scalar_subquery()
+
+    insert = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    source = select(
+        User.id,
+        select(func.count(Prediction.id)).where(Prediction.user_id == User.id).scalar_subquery(),
+        select(func.coalesce(func.sum(Prediction.cost), 0.0)).where(Prediction.user_id == User.id).scalar_subquery(),
+        tx_agg("deposit", func.count(Transaction.id)),
+        tx_agg("deposit", func.coalesce(func.sum(Transaction.amount), 0.0)),
+        tx_agg("withdraw", func.count(Transaction.id)),
+        tx_agg("withdraw", func.coalesce(func.sum(Transaction.amount), 0.0)),
+    ).where(~select(UserSummary.user_id).where(UserSummary.user_id == User.id).exists())
+    stmt = insert(UserSummary).from_select(
+        [
+            "user_id",
+            "predictions_count",
+            "predictions_cost",
+            "deposits_count",
+            "deposits_total",
+            "withdrawals_count",
+            "withdrawals_total",
+        ],
+        source,
+    )
+    return db.execute(stmt.on_conflict_do_nothing(index_elements=["user_id"])).rowcount
+
+
+def ensure_summaries() -> None:
+    """
+    Сводки для пользователей, созданных до появления таблицы. Вызывает каждый
+    процесс, пишущий в историю, до первой записи: init_db, API при импорте,
+    воркер до начала потребления.
+    """
+    db = SessionLocal()
+    try:
+        created = backfill_summaries(db)
+        db.commit()
+        if created:
+            log.info("built summaries", users=created)
+    finally:
+        db.close()
@@ -0,0 +1,123 @@
+"""
+Просмотр и повторная отправка dead-letter сообщений.
+
+    python -m worker.dlq list [--limit 20]
+    python -m worker.dlq --lane batch replay [--limit N]
+"""
+import argparse
+import os
+import time
+from typing import List, Optional
+
+import pika
+
+from shared.queues import ENQUEUED_AT_HEADER, LANE_QUEUES, QUEUE_NAME
+from worker.retry import ATTEMPT_HEADER, ERROR_HEADER, REPLAY_HEADER, SOURCE_HEADER, dead_letter_queue_name
+
+RABBIT_HOST = os.getenv("RABBIT_HOST", "rabbitmq")
+RABBIT_USER = os.getenv("RABBIT_USER", "guest")
+RABBIT_PASSWORD = os.getenv("RABBIT_PASSWORD", "guest")
+
+
+def _connect() -> pika.BlockingConnection:
+    creds = pika.PlainCredentials(RABBIT_USER, RABBIT_PASSWORD)
+    return pika.BlockingConnection(pika.ConnectionParameters(host=RABBIT_HOST, credentials=creds))
+
+
+def _dead_count(channel, dlq: str) -> int:
+    return channel.queue_declare(queue=dlq, durable=True, passive=True).method.message_count
+
+
+def list_dead(queue: str, limit: int) -> None:
+    dlq = dead_letter_queue_name(queue)
+    conn = _connect()
+    try:
+        ch = conn.channel()
+        print(f"{dlq}: {_dead_count(ch, dlq)} messages")
+        last_tag: Optional[int] = None
+        for i in range(limit):
+            method, properties, body = ch.basic_get(dlq, auto_ack=False)
+            if method is None:
+                break
+            last_tag = method.delivery_tag
+            headers = properties.headers or {}
+            print(
+                f"#{i + 1} attempts={headers.get(ATTEMPT_HEADER, 1)} source={headers.get(SOURCE_HEADER, queue)}\n"
+                f"   error: {headers.get(ERROR_HEADER)}\n"
+                f"   body:  {body[:300].decode('utf-8', 'replace')}"
+            )
+        if last_tag is not None:
+            # только посмотрели — возвращаем всё на место
+            ch.basic_nack(delivery_tag=last_tag, multiple=True, requeue=True)
+    finally:
+        conn.close()
+
+
+def replay_headers(headers: Optional[dict], now: Optional[float] = None) -> dict:
+    """Заголовки сообщения из DLQ без служебных заголовков повторов и DLQ."""
+    dropped = (ATTEMPT_HEADER, ERROR_HEADER, SOURCE_HEADER, "x-dead-at", "x-death")
+    out = {k: v for k, v in (headers or {}).items() if k not in dropped}
+    out[ENQUEUED_AT_HEADER] = int((time.time() if now is None else now) * 1000)
+    out[REPLAY_HEADER] = 1
+    return out
+
+
+def replay_dead(queue: str, limit: Optional[int]) -> None:
+    """
+    Возвращает сообщения в исходную очередь со сброшенным счётчиком попыток.
+    Заголовки паблишера (владелец задачи) сохраняются, время постановки — новое;
+    флаг replay разрешает воркеру заново выполнить задачу, помеченную failed.
+    """
+    dlq = dead_letter_queue_name(queue)
+    conn = _connect()
+    try:
+        ch = conn.channel()
+        ch.confirm_delivery()
+        # не больше, чем лежало на момент запуска: повторно упавшие не зациклятся
+        total = _dead_count(ch, dlq)
+        if limit is not None:
+            total = min(total, limit)
+        replayed = 0
+        for _ in range(total):
+            method, properties, body = ch.basic_get(dlq, auto_ack=False)
+            if method is None:
+                break
+            headers = replay_headers(properties.headers)
+            target = (properties.headers or {}).get(SOURCE_HEADER, queue)
+            ch.basic_publish(
+                exchange="",
+                routing_key=target,
+                body=body,
+                properties=pika.BasicProperties(
+                    delivery_mode=2,
+                    content_type=properties.content_type or "application/json",
+                    headers=headers,
+                ),
+            )
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+            replayed += 1
+        print(f"replayed {replayed} messages from {dlq}")
+    finally:
+        conn.close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Dead-letter очередь задач ML")
+    parser.add_argument("--queue", default=QUEUE_NAME, help="рабочая очередь (DLQ — <queue>.dead)")
+    parser.add_argument("--lane", choices=list(LANE_QUEUES), help="вместо --queue: очередь полосы")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_list = sub.add_parser("list", help="показать сообщения, не забирая их")
+    p_list.add_argument("--limit", type=int, default=20)
+    p_replay = sub.add_parser("replay", help="вернуть сообщения в рабочую очередь")
+    p_replay.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args(argv)
+    queue = LANE_QUEUES[args.lane] if args.lane else args.queue
+
+    if args.command == "list":
+        list_dead(queue, args.limit)
+    else:
+        replay_dead(queue, args.limit)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Hashable, List, Optional, Tuple
+
+from shared.metrics import registry
+from shared.queues import ENQUEUED_AT_HEADER, LANE_BATCH, LANE_INTERACTIVE, USER_HEADER
+
+
+def parse_lane_weights(raw: str) -> Dict[str, int]:
+    """"interactive:4,batch:1" -> {"interactive": 4, "batch": 1}; неизвестные полосы и веса < 1 игнорируются."""
+    weights = {LANE_INTERACTIVE: 4, LANE_BATCH: 1}
+    for part in raw.split(","):
+        name, _, value = part.partition(":")
+        name = name.strip()
+        if name in weights:
+            try:
+                weights[name] = max(1, int(value))
+            except ValueError:
+                pass
+    return weights
+
+
+# доля обработки каждой полосы, пока в обеих есть сообщения
+LANE_WEIGHTS = parse_lane_weights(os.getenv("WORKER_LANE_WEIGHTS", "interactive:4,batch:1"))
+
+QUEUE_WAIT_SECONDS = registry.histogram(
+    "ml_queue_wait_seconds", "Ожидание задачи от публикации до выбора в пачку (заголовок x-enqueued-at)", ["lane"]
+)
+
+
+def _header(properties, name: str) -> Any:
+    headers = (properties.headers if properties is not None else None) or {}
+    return headers.get(name)
+
+
+class LaneBuffer:
+    """Полученные, но ещё не обработанные сообщения одной полосы; пользователи чередуются по кругу."""
+
+    def __init__(self) -> None:
+        self._users: "OrderedDict[Hashable, Deque[Any]]" = OrderedDict()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def push(self, user: Hashable, item: Any) -> None:
+        self._users.setdefault(user, deque()).append(item)
+        self._size += 1
+
+    def pop(self) -> Any:
+        user, items = next(iter(self._users.items()))
+        item = items.popleft()
+        if items:
+            self._users.move_to_end(user)
+        else:
+            del self._users[user]
+        self._size -= 1
+        return item
+
+
+class LaneScheduler:
+    """
+    Weighted fair выбор между полосами (smooth weighted round-robin, как в nginx):
+    при весах 4:1 и занятых обеих полосах на каждые четыре интерактивных
+    сообщения приходится одно из batch-полосы, пустая полоса свою долю не копит.
+    Внутри полосы сообщения разных пользователей чередуются, поэтому один
+    пользователь с сотней задач не стоит перед всеми остальными.
+    """
+
+    def __init__(self, weights: Dict[str, int] = LANE_WEIGHTS):
+        self.weights = dict(weights)
+        self._buffers = {lane: LaneBuffer() for lane in self.weights}
+        self._current = {lane: 0 for lane in self.weights}
+        self._stats = {lane: {"received": 0, "processed": 0, "timed": 0, "wait_total": 0.0, "wait_max": 0.0} for lane in self.weights}
+
+    def __len__(self) -> int:
+        return sum(len(b) for b in self._buffers.values())
+
+    def push(self, lane: str, item: Any, properties=None) -> None:
+        """item — что угодно, properties — свойства AMQP-сообщения (заголовки паблишера)."""
+        user = _header(properties, USER_HEADER)
+        self._buffers[lane].push(user, (item, _header(properties, ENQUEUED_AT_HEADER)))
+        self._stats[lane]["received"] += 1
+
+    def _next_lane(self) -> Optional[str]:
+        ready = [lane for lane, buf in self._buffers.items() if len(buf)]
+        if not ready:
+            return None
+        for lane in ready:
+            self._current[lane] += self.weights[lane]
+        chosen = max(ready, key=lambda lane: self._current[lane])
+        self._current[chosen] -= sum(self.weights[lane] for lane in ready)
+        return chosen
+
+    def next_batch(self, size: int, now: Optional[float] = None) -> List[Tuple[str, Any]]:
+        now = time.time() if now is None else now
+        batch: List[Tuple[str, Any]] = []
+        while len(batch) < size:
+            lane = self._next_lane()
+            if lane is None:
+                break
+            item, enqueued_at = self._buffers[lane].pop()
+            self._observe(lane, enqueued_at, now)
+            batch.append((lane, item))
+        return batch
+
+    def _observe(self, lane: str, enqueued_at: Any, now: float) -> None:
+        st = self._stats[lane]
+        st["processed"] += 1
+        try:
+            wait = max(0.0, now - int(enqueued_at) / 1000.0)
+        except (TypeError, ValueError):
+            # сообщения без заголовка (старый паблишер, replay из DLQ) в статистику ожидания не попадают
+            return
+        QUEUE_WAIT_SECONDS.observe(wait, lane=lane)
+        st["timed"] += 1
+        st["wait_total"] += wait
+        st["wait_max"] = max(st["wait_max"], wait)
+
+    def stats(self, reset: bool = False) -> Dict[str, dict]:
+        """По полосам: сколько в буфере, получено/обработано и ожидание в очереди (сек) за период."""
+        data = {}
+        for lane, st in self._stats.items():
+            data[lane] = {
+                "buffered": len(self._buffers[lane]),
+                "received": st["received"],
+                "processed": st["processed"],
+                "wait_avg": round(st["wait_total"] / st["timed"], 3) if st["timed"] else None,
+                "wait_max": round(st["wait_max"], 3),
+            }
+            if reset:
+                st.update(received=0, processed=0, timed=0, wait_total=0.0, wait_max=0.0)
+        return data
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Column, DateTime, Float, Integer, String, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from shared.db import Base
+
+# 0 — кэш выключен
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "100000"))
+# 1 — второй уровень в таблице prediction_cache (общий для всех воркеров, только Postgres)
+RESULT_CACHE_SHARED = os.getenv("RESULT_CACHE_SHARED", "0") == "1"
+
+
+class PredictionCacheEntry(Base):
+    __tablename__ = "prediction_cache"
+
+    key = Column(String(64), primary_key=True)  # sha256(model_id, version, признаки)
+    model_id = Column(Integer, nullable=False, index=True)
+    version = Column(String, nullable=False)
+    value = Column(Float, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+def canonical_features(row: Dict[str, float]) -> Tuple[Tuple[str, float], ...]:
+    """Порядок ключей и int/float не влияют на ключ; нечисловое значение — ValueError/TypeError, как при скоринге."""
+    return tuple(sorted((str(k), float(v)) for k, v in row.items()))
+
+
+class ResultCache:
+    """
+    Результаты скоринга по ключу (model_id, версия модели, признаки).
+
+    Версия — sha256 артефакта из реестра (или хэш настроек линейной формулы),
+    поэтому после hot reload старые записи просто перестают совпадать;
+    invalidate(model_id) вызывается из слушателя реестра и освобождает память.
+    Первый уровень — LRU в процессе, второй (shared=True) — таблица в Postgres.
+    """
+
+    def __init__(self, maxsize: int = RESULT_CACHE_SIZE, shared: bool = RESULT_CACHE_SHARED):
+        self.maxsize = maxsize
+        self.shared = shared
+        self._data: "OrderedDict[Hashable, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "shared_hits": 0, "misses": 0, "invalidations": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def lookup(
+        self, db: Optional[Session], model_id: int, version: str, rows: Sequence[Dict[str, float]]
+    ) -> Tuple[List[Optional[float]], List[Hashable]]:
+        """Значения из кэша (None — промах) и ключи строк для последующего store()."""
+        keys = [(model_id, version, canonical_features(row)) for row in rows]
+        values: List[Optional[float]] = []
+        with self._lock:
+            for key in keys:
+                value = self._data.get(key)
+                if value is not None:
+                    self._data.move_to_end(key)
+                values.append(value)
+        local_hits = sum(v is not None for v in values)
+
+        shared_hits = 0
+        if self.shared and db is not None and local_hits < len(keys):
+            missing = {self._digest(keys[i]): i for i, v in enumerate(values) if v is None}
+            found = db.execute(
+                select(PredictionCacheEntry.key, PredictionCacheEntry.value).where(PredictionCacheEntry.key.in_(list(missing)))
+            ).all()
+            for digest, value in found:
+                values[missing[digest]] = value
+            shared_hits = len(found)
+            self._remember({keys[missing[d]]: v for d, v in found})
+
+        with self._lock:
+            self._stats["hits"] += local_hits
+            self._stats["shared_hits"] += shared_hits
+            self._stats["misses"] += len(keys) - local_hits - shared_hits
+        return values, keys
+
+    def store(self, db: Optional[Session], keys: Sequence[Hashable], values: Sequence[float]) -> None:
+        items = dict(zip(keys, values))
+        if not items:
+            return
+        self._remember(items)
+        if self.shared and db is not None:
+            # в транзакции задачи; ON CONFLICT — другой воркер мог посчитать то же самое.
+            # Строки идут по возрастанию ключа: два воркера с пересекающимися пачками
+            # берут блокировки PK в одном порядке и не ловят deadlock друг на друге
+            rows = {}
+            for k, v in items.items():
+                digest = self._digest(k)
+                rows[digest] = {"key": digest, "model_id": k[0], "version": k[1], "value": float(v)}
+            db.execute(
+                pg_insert(PredictionCacheEntry)
+                .values([rows[d] for d in sorted(rows)])
+                .on_conflict_do_nothing(index_elements=["key"])
+            )
+
+    def invalidate(self, model_id: int) -> None:
+        with self._lock:
+            stale = [k for k in self._data if k[0] == model_id]
+            for k in stale:
+                del self._data[k]
+            self._stats["invalidations"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "size": len(self._data), "maxsize": self.maxsize, "shared": self.shared}
+
+    def _remember(self, items: Dict[Hashable, float]) -> None:
+        with self._lock:
+            for key, value in items.items():
+                self._data[key] = float(value)
+                self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    @staticmethod
+    def _digest(key: Tuple[int, str, tuple]) -> str:
+        return hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()
+
+
+def ensure_shared_table(engine) -> bool:
+    """Создаёт prediction_cache; shared-уровень работает только на Postgres."""
+    if engine.dialect.name != "postgresql":
+        return False
+    PredictionCacheEntry.__table__.create(bind=engine, checkfirst=True)
+    return True
@@ -0,0 +1,103 @@
+import os
+import time
+from typing import List
+
+import pika
+
+# сколько раз пробуем обработать сообщение, прежде чем отправить его в dead-letter очередь
+RETRY_MAX_ATTEMPTS = max(1, int(os.getenv("WORKER_RETRY_MAX_ATTEMPTS", "5")))
+# задержка перед n-й повторной попыткой: base * 2**(n-1) секунд
+RETRY_BASE_DELAY = float(os.getenv("WORKER_RETRY_BASE_DELAY", "2"))
+
+ATTEMPT_HEADER = "x-attempt"
+ERROR_HEADER = "x-last-error"
+SOURCE_HEADER = "x-source-queue"
+# ставит replay из DLQ: только такому сообщению воркер разрешает заново выполнить задачу в статусе failed
+REPLAY_HEADER = "x-replay"
+
+
+def retry_delays() -> List[float]:
+    return [RETRY_BASE_DELAY * 2 ** i for i in range(RETRY_MAX_ATTEMPTS - 1)]
+
+
+def retry_queue_name(queue: str, level: int) -> str:
+    return f"{queue}.retry.{level}"
+
+
+def dead_letter_queue_name(queue: str) -> str:
+    return f"{queue}.dead"
+
+
+def declare_topology(channel, queue: str) -> None:
+    """
+    Для рабочей очереди queue: по очереди ожидания на каждую ступень backoff
+    (TTL на уровне очереди, по истечении сообщение dead-letter'ом через
+    default exchange возвращается в queue) и финальная queue.dead.
+    У каждой ступени один TTL, поэтому сообщения в ней не ждут друг друга.
+    """
+    for level, delay in enumerate(retry_delays()):
+        channel.queue_declare(
+            queue=retry_queue_name(queue, level),
+            durable=True,
+            arguments={
+                "x-message-ttl": int(delay * 1000),
+                "x-dead-letter-exchange": "",
+                "x-dead-letter-routing-key": queue,
+            },
+        )
+    channel.queue_declare(queue=dead_letter_queue_name(queue), durable=True)
+
+
+def attempt_of(properties) -> int:
+    """Номер текущей попытки (первая доставка — 1)."""
+    headers = (properties.headers if properties is not None else None) or {}
+    try:
+        return max(1, int(headers.get(ATTEMPT_HEADER, 1)))
+    except (TypeError, ValueError):
+        return 1
+
+
+def is_replay(properties) -> bool:
+    headers = (properties.headers if properties is not None else None) or {}
+    return bool(headers.get(REPLAY_HEADER))
+
+
+def _properties(properties, **headers) -> pika.BasicProperties:
+    merged = dict((properties.headers if properties is not None else None) or {})
+    merged.update(headers)
+    return pika.BasicProperties(
+        delivery_mode=2,
+        content_type=getattr(properties, "content_type", None) or "application/json",
+        headers=merged,
+    )
+
+
+def dead_letter(channel, queue: str, properties, body: bytes, error: str) -> None:
+    channel.basic_publish(
+        exchange="",
+        routing_key=dead_letter_queue_name(queue),
+        body=body,
+        properties=_properties(
+            properties,
+            **{ERROR_HEADER: error[:500], SOURCE_HEADER: queue, "x-dead-at": int(time.time())},
+        ),
+    )
+
+
+def schedule_retry(channel, queue: str, properties, body: bytes, error: str) -> str:
+    """
+    Публикует копию сообщения в очередь ожидания следующей ступени или, если
+    попытки кончились, в dead-letter очередь. Оригинал подтверждает вызывающий.
+    Возвращает "retry" или "dead".
+    """
+    attempt = attempt_of(properties)
+    if attempt >= RETRY_MAX_ATTEMPTS:
+        dead_letter(channel, queue, properties, body, error)
+        return "dead"
+    channel.basic_publish(
+        exchange="",
+        routing_key=retry_queue_name(queue, attempt - 1),
+        body=body,
+        properties=_properties(properties, **{ATTEMPT_HEADER: attempt + 1, ERROR_HEADER: error[:500]}),
+    )
+    return "retry"
@@ -0,0 +1,117 @@
+import argparse
+import multiprocessing as mp
+import os
+import signal
+import time
+from typing import Dict, List, Optional
+
+from shared.log import get_logger, setup_logging
+from worker.worker import main as consumer_main
+
+log = get_logger("supervisor")
+
+# сколько процессов-потребителей запускать и сколько ждать их дренажа при остановке
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "1"))
+WORKER_DRAIN_TIMEOUT = float(os.getenv("WORKER_DRAIN_TIMEOUT", "30"))
+RESTART_BACKOFF_MAX = 30.0
+# воркер, проработавший столько секунд, считается стабильным: счётчик падений слота сбрасывается
+RESTART_STABLE_SECONDS = float(os.getenv("WORKER_RESTART_STABLE_SECONDS", "60"))
+
+
+class Supervisor:
+    """
+    Держит N процессов-потребителей (spawn — у каждого свой engine и пул
+    соединений к БД), перезапускает упавшие и по SIGTERM/SIGINT пересылает
+    сигнал детям и ждёт, пока они дообработают текущие сообщения.
+    """
+
+    def __init__(self, concurrency: int, drain_timeout: float = WORKER_DRAIN_TIMEOUT):
+        self.concurrency = max(1, concurrency)
+        self.drain_timeout = drain_timeout
+        self._ctx = mp.get_context("spawn")
+        self._procs: Dict[int, mp.Process] = {}
+        self._restarts: Dict[int, int] = {}
+        self._next_start: Dict[int, float] = {}
+        self._started_at: Dict[int, float] = {}
+        self._stopping = False
+        self._signal: Optional[int] = None
+
+    def _spawn(self, slot: int) -> None:
+        proc = self._ctx.Process(target=consumer_main, args=(slot,), name=f"ml-worker-{slot}", daemon=False)
+        proc.start()
+        self._procs[slot] = proc
+        self._started_at[slot] = time.monotonic()
+        log.info("started worker", slot=slot, worker_pid=proc.pid)
+
+    def _on_signal(self, signum, frame) -> None:
+        # без логирования: сигнал может прервать поток, держащий lock очереди логов
+        if self._stopping:
+            return
+        self._stopping = True
+        self._signal = signum
+        for proc in self._procs.values():
+            if proc.is_alive():
+                os.kill(proc.pid, signal.SIGTERM)
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self._on_signal)
+        signal.signal(signal.SIGINT, self._on_signal)
+        for slot in range(self.concurrency):
+            self._spawn(slot)
+
+        while not self._stopping:
+            time.sleep(0.5)
+            now = time.monotonic()
+            for slot, proc in list(self._procs.items()):
+                if proc.is_alive() or self._stopping:
+                    continue
+                if slot not in self._next_start:
+                    delay = self._restart_delay(slot, now)
+                    self._next_start[slot] = now + delay
+                    log.warning("worker exited", slot=slot, exitcode=proc.exitcode, restart_in=delay)
+                elif now >= self._next_start[slot]:
+                    del self._next_start[slot]
+                    self._spawn(slot)
+
+        log.info("signal received, draining workers", signal=self._signal, workers=len(self._procs))
+        self._drain()
+
+    def _restart_delay(self, slot: int, now: float) -> float:
+        """Backoff перед перезапуском упавшего слота; после стабильной работы — снова с короткой задержки."""
+        if now - self._started_at.get(slot, now) >= RESTART_STABLE_SECONDS:
+            self._restarts[slot] = 0
+        restarts = self._restarts.get(slot, 0) + 1
+        self._restarts[slot] = restarts
+        return min(RESTART_BACKOFF_MAX, 2 ** min(restarts, 5))
+
+    def _drain(self) -> None:
+        deadline = time.monotonic() + self.drain_timeout
+        for proc in self._procs.values():
+            proc.join(timeout=max(0.0, deadline - time.monotonic()))
+        for proc in self._procs.values():
+            if proc.is_alive():
+                log.warning("worker did not drain in time, killing", worker_pid=proc.pid)
+                proc.kill()
+                proc.join()
+        log.info("all workers stopped")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Пул процессов-воркеров ML-задач")
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        default=WORKER_CONCURRENCY,
+        help="число процессов-потребителей (WORKER_CONCURRENCY, 0 — по числу ядер)",
+    )
+    args = parser.parse_args(argv)
+    concurrency = args.concurrency or os.cpu_count() or 1
+    setup_logging()
+
+    time.sleep(int(os.getenv("WORKER_STARTUP_DELAY", "2")))
+    Supervisor(concurrency).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,53 @@
+import hashlib
 import json
 import os
+import signal
 import time
-from typing import Tuple, Dict
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Tuple, Dict, List, Optional
 
+import numpy as np
 import pika
 from pika.exceptions import AMQPConnectionError
+from sqlalchemy import bindparam, event, func, insert, select, update
 from sqlalchemy.orm import Session
 
-from shared.db import SessionLocal
+from shared.db import SessionLocal, engine, sync_schema
+from shared.ledger import capture, release_holds, sweep_expired_holds
+from shared.log import get_logger, setup_logging
+from shared.metrics import hit_ratio, registry as metrics_registry, start_http_server, stats_samples
+from shared.ml_model.registry import get_registry, parse_warmup
+from shared.models.ml_model import MLModel
 from shared.models.prediction import Prediction
 from shared.models.user import User
-from shared.models.transaction import Transaction
+from shared.models.task import Task, TASK_RUNNING, TASK_DONE, TASK_FAILED
+from shared.notify import notify_users
+from shared.summary import ensure_summaries, record_predictions
+from shared.queues import LANE_QUEUES, QUEUE_NAME
+from worker.lanes import LaneScheduler
+from worker.result_cache import ResultCache, ensure_shared_table
+from worker.retry import attempt_of, dead_letter, declare_topology, is_replay, schedule_retry
+
+log = get_logger("worker")
 
 RABBIT_HOST = os.getenv("RABBIT_HOST", "rabbitmq")
 RABBIT_USER = os.getenv("RABBIT_USER", "guest")
 RABBIT_PASSWORD = os.getenv("RABBIT_PASSWORD", "guest")
-QUEUE_NAME = os.getenv("QUEUE_NAME", "ml_tasks")
+
+# микробатчинг: 1 — обработка по одному сообщению (как раньше)
+BATCH_SIZE = max(1, int(os.getenv("WORKER_BATCH_SIZE", "1")))
+BATCH_MAX_WAIT = float(os.getenv("WORKER_BATCH_MAX_WAIT", "0.05"))
+# сколько неподтверждённых сообщений держит каждая полоса: из них планировщик чередует
+# пользователей, поэтому окно больше пачки (при prefetch = 1 выбирать было бы не из чего)
+LANE_PREFETCH = max(1, int(os.getenv("WORKER_LANE_PREFETCH", "8")))
+PREFETCH = max(BATCH_SIZE, LANE_PREFETCH)
+# как часто печатать статистику полос (ожидание в очереди, обработано); 0 — не печатать
+LANE_STATS_INTERVAL = float(os.getenv("WORKER_LANE_STATS_INTERVAL", "60"))
+# как часто снимать просроченные резервы средств (сек); 0 — не снимать в этом процессе
+HOLD_SWEEP_INTERVAL = float(os.getenv("WORKER_HOLD_SWEEP_INTERVAL", "60"))
+# HTTP-порт /metrics процесса-воркера: слот N супервизора слушает порт + N; 0 — не поднимать
+METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9100"))
 
 FEATURE_ORDER = [s.strip() for s in os.getenv("FEATURE_ORDER", "feature1,feature2,feature3").split(",") if s.strip()]
 _WEIGHTS = [s.strip() for s in os.getenv("WEIGHTS", "0.7,0.2,0.1").split(",") if s.strip()]
@@ -30,6 +62,22 @@ if len(WEIGHTS) < len(FEATURE_ORDER):
 elif len(WEIGHTS) > len(FEATURE_ORDER):
     WEIGHTS = WEIGHTS[: len(FEATURE_ORDER)]
 
+WEIGHTS_VECTOR = np.asarray(WEIGHTS, dtype=np.float64)
+# «версия» линейной формулы для ключей кэша результатов: меняется вместе с настройками
+LINEAR_VERSION = "linear-" + hashlib.sha256(json.dumps([FEATURE_ORDER, WEIGHTS, BIAS]).encode("utf-8")).hexdigest()[:16]
+
+result_cache = ResultCache()
+
+SCORE_SECONDS = metrics_registry.histogram(
+    "ml_model_score_duration_seconds", "Скоринг строк моделью (только промахи кэша результатов)", ["model"]
+)
+SCORED_ROWS = metrics_registry.counter("ml_model_scored_rows", "Строк посчитано моделью", ["model"])
+TASK_SECONDS = metrics_registry.histogram("ml_task_duration_seconds", "Обработка задачи или пачки задач", ["kind"])
+STAGE_SECONDS = metrics_registry.histogram(
+    "ml_task_stage_duration_seconds", "Стадии обработки: score, capture (списание), write, commit", ["stage"]
+)
+TASKS_FINISHED = metrics_registry.counter("ml_tasks_finished", "Задачи, завершённые воркером", ["status"])
+
 
 def split_valid_invalid(records: Dict) -> Tuple[Dict, Dict]:
     valid, invalid = {}, {}
@@ -48,42 +96,338 @@ def linear_predict(valid_input: Dict[str, float]) -> float:
     return total
 
 
-def handle_task(db: Session, task: dict):
+def rows_to_matrix(rows: List[Dict[str, float]]) -> np.ndarray:
+    """Строки признаков -> матрица (n_rows, len(FEATURE_ORDER)), отсутствующие признаки = 0."""
+    matrix = np.array([[row.get(name, 0.0) for name in FEATURE_ORDER] for row in rows], dtype=np.float64)
+    return matrix.reshape(len(rows), len(FEATURE_ORDER))
+
+
+def linear_predict_matrix(matrix: np.ndarray) -> np.ndarray:
+    return matrix @ WEIGHTS_VECTOR + BIAS
+
+
+def linear_predict_many(valid_inputs: List[Dict[str, float]]) -> List[float]:
+    if not valid_inputs:
+        return []
+    return linear_predict_matrix(rows_to_matrix(valid_inputs)).tolist()
+
+
+def _compute(artifact, rows: List[Dict[str, float]]) -> List[float]:
+    if artifact is None:
+        return linear_predict_many(rows)
+    return artifact.predict_matrix(artifact.rows_to_matrix(rows)).tolist()
+
+
+def _compute_timed(model_id: int, artifact, rows: List[Dict[str, float]]) -> List[float]:
+    with SCORE_SECONDS.time(model=model_id):
+        values = _compute(artifact, rows)
+    SCORED_ROWS.inc(len(rows), model=model_id)
+    return values
+
+
+def score_rows(model_id: int, rows: List[Dict[str, float]], db: Optional[Session] = None) -> List[float]:
+    """
+    Скоринг строк моделью model_id: артефакт из реестра или линейная формула по умолчанию.
+    Повторяющиеся строки берутся из кэша результатов, считаются только промахи.
+    """
+    if not rows:
+        return []
+    artifact = get_registry().get(model_id)
+    if not result_cache.enabled:
+        return _compute_timed(model_id, artifact, rows)
+
+    version = artifact.version if artifact is not None else LINEAR_VERSION
+    values, keys = result_cache.lookup(db, model_id, version, rows)
+    missing = [i for i, v in enumerate(values) if v is None]
+    if missing:
+        computed = _compute_timed(model_id, artifact, [rows[i] for i in missing])
+        for i, value in zip(missing, computed):
+            values[i] = value
+        result_cache.store(db, [keys[i] for i in missing], computed)
+    return values
+
+
+def task_rows(task: dict) -> List[Dict[str, float]]:
+    """Строки признаков задачи: одна для обычной задачи, много — для пакетной."""
+    if "rows" in task:
+        # строки пакета уже провалидированы API, матрица строится без поэлементных проверок
+        return task["rows"]
+    valid, invalid = split_valid_invalid(task["input_data"])
+    if not valid:
+        log.task("task skipped: no valid features after validation", task.get("task_id"), invalid=invalid)
+        return []
+    return [valid]
+
+
+def drop_processed(db: Session, tasks: List[dict]) -> List[dict]:
+    """
+    Убирает задачи, которые уже завершены (повторная доставка после сбоя до ack,
+    дубликат в очереди) — их сообщения просто подтверждаются. Задача в статусе
+    failed выполняется заново только из replay dead-letter очереди (флаг replay):
+    иначе API, уже ответивший клиенту ошибкой (таймаут подтверждения публикации),
+    получил бы списание за задачу, которую считает неудавшейся. Гонку двух
+    воркеров закрывает уникальный индекс transactions.task_id: второй commit
+    упадёт, пачка вернётся в очередь и при повторе отсеется здесь.
+    """
+    ids = {t["task_id"] for t in tasks if t.get("task_id")}
+    status = {}
+    if ids:
+        status = dict(
+            db.query(Task.id, Task.status).filter(Task.id.in_(ids), Task.status.in_([TASK_DONE, TASK_FAILED]))
+        )
+    fresh, seen = [], set()
+    for task in tasks:
+        task_id = task.get("task_id")
+        finished = status.get(task_id) == TASK_DONE or (status.get(task_id) == TASK_FAILED and not task.get("replay"))
+        if task_id and (finished or task_id in seen):
+            log.task("duplicate: task already finished, ack without scoring", task_id, status=status.get(task_id))
+            continue
+        if task_id:
+            seen.add(task_id)
+        fresh.append(task)
+    return fresh
+
+
+def mark_running(db: Session, tasks: List[dict]) -> None:
+    """queued -> running одним UPDATE и отдельным commit, чтобы статус был виден сразу."""
+    ids = [t["task_id"] for t in tasks if t.get("task_id")]
+    if not ids:
+        return
+    db.execute(
+        update(Task)
+        .where(Task.id.in_(ids), Task.status != TASK_DONE)
+        .values(status=TASK_RUNNING, started_at=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def finish_tasks(db: Session, outcomes: Dict[Optional[str], Optional[str]]) -> None:
+    """
+    task_id -> текст ошибки (None — успех). Одним executemany в текущей
+    транзакции; prediction_id берётся подзапросом по predictions.task_id.
+    У неудачных задач снимается резерв средств.
+    """
+    params = [
+        {
+            "_id": task_id,
+            "_status": TASK_FAILED if error else TASK_DONE,
+            "_error": error[:500] if error else None,
+            "_finished": datetime.now(timezone.utc),
+        }
+        for task_id, error in outcomes.items()
+        if task_id
+    ]
+    if not params:
+        return
+    # резерв средств неудачной задачи больше не нужен
+    release_holds(db, [p["_id"] for p in params if p["_error"]])
+    finished = db.info.setdefault("tasks_finished", defaultdict(int))
+    for p in params:
+        finished[p["_status"]] += 1
+    first_prediction = select(func.min(Prediction.id)).where(Prediction.task_id == Task.id).scalar_subquery()
+    db.execute(
+        update(Task)
+        .where(Task.id == bindparam("_id"))
+        .values(
+            status=bindparam("_status"),
+            error=bindparam("_error"),
+            finished_at=bindparam("_finished"),
+            prediction_id=first_prediction,
+        )
+        .execution_options(synchronize_session=False),
+        params,
+    )
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _count_finished(session) -> None:
+    # метрика — только по закоммиченным статусам: пачка, откатившаяся и обработанная заново, не учитывается дважды
+    for status, n in session.info.pop("tasks_finished", {}).items():
+        TASKS_FINISHED.inc(n, status=status)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _drop_finished(session) -> None:
+    session.info.pop("tasks_finished", None)
+
+
+def _skip_task(db: Session, task: dict, reason: str) -> None:
+    log.warning("task skipped", task_id=task.get("task_id"), reason=reason)
+    finish_tasks(db, {task.get("task_id"): reason})
+    db.commit()
+
+
+def handle_task(db: Session, task: dict, values: Optional[List[float]] = None):
+    """
+    values — уже посчитанный результат (быстрый путь API): скоринг пропускается,
+    и без отдельного commit статуса running задача пишется одной транзакцией.
+    """
+    if "rows" in task:
+        # пакетная задача: одна транзакция списания на price * n_rows
+        handle_batch(db, [task])
+        return
+
+    started = time.perf_counter()
+    if not drop_processed(db, [task]):
+        return
+    task_id = task.get("task_id")
     user_id = int(task["user_id"])
     model_id = int(task["model_id"])
     input_data = task["input_data"]
     price = float(task["price"])
 
-    print(f"[worker] task: user_id={user_id} model_id={model_id} price={price} input={input_data}")
+    log.task("task received", task_id, user_id=user_id, model_id=model_id, price=price, input=input_data)
+    if values is None:
+        mark_running(db, [task])
 
-    user: User | None = (
-        db.query(User)
-        .filter(User.id == user_id)
-        .with_for_update(read=False)
-        .first()
-    )
-    if not user:
-        print(f"[worker] skip: user {user_id} not found")
+    valid, invalid = split_valid_invalid(input_data)
+    if not valid:
+        _skip_task(db, task, f"no valid features after validation. invalid={invalid}")
         return
 
-    if user.balance < price:
-        print(f"[worker] skip: insufficient balance (balance={user.balance}, price={price})")
+    # скоринг до списания: строка пользователя блокируется только условным UPDATE в конце
+    if values is None:
+        with STAGE_SECONDS.time(stage="score"):
+            values = score_rows(model_id, [valid], db)
+    pred_value = f"{values[0]:.4f}"
+
+    with STAGE_SECONDS.time(stage="capture"):
+        (paid,), balance = capture(db, user_id, [(price, task_id)])
+    if not paid:
+        _skip_task(db, task, _debit_failure(db, user_id, price))
         return
+    with STAGE_SECONDS.time(stage="write"):
+        db.add(Prediction(user_id=user_id, model_id=model_id, prediction=pred_value, cost=price, task_id=task_id))
+        record_predictions(db, {user_id: (1, price)})
+        db.flush()
+        finish_tasks(db, {task_id: None})
+        notify_users(db, [user_id])
+    with STAGE_SECONDS.time(stage="commit"):
+        db.commit()
+    TASK_SECONDS.observe(time.perf_counter() - started, kind="single")
 
-    valid, invalid = split_valid_invalid(input_data)
-    if not valid:
-        print(f"[worker] skip: no valid features after validation. invalid={invalid}")
+    log.task("task done", task_id, prediction=pred_value, withdrawn=price, balance=balance)
+
+
+def _debit_failure(db: Session, user_id: int, cost: float) -> str:
+    row = db.execute(select(User.balance).where(User.id == user_id)).first()
+    if row is None:
+        return f"user {user_id} not found"
+    return f"insufficient balance (balance={row.balance}, price={cost})"
+
+
+def handle_batch(db: Session, tasks: List[dict]) -> None:
+    """
+    Обрабатывает пачку задач в одной транзакции: все строки всех задач
+    скорятся одним матричным умножением без блокировок, затем на каждого
+    пользователя — одно условное списание (shared.ledger), предсказания —
+    одним bulk INSERT, в конце один commit.
+    Пакетная задача (rows) списывается целиком: price * число строк.
+    """
+    started = time.perf_counter()
+    tasks = drop_processed(db, tasks)
+    if not tasks:
         return
+    mark_running(db, tasks)
+    by_user: Dict[int, List[dict]] = defaultdict(list)
+    for task in tasks:
+        by_user[int(task["user_id"])].append(task)
 
-    y = linear_predict(valid)
-    pred_value = f"{y:.4f}"
+    # валидация и скоринг всех задач пачки разом: одна матрица на модель, без блокировок
+    spans = []
+    outcomes: Dict[Optional[str], Optional[str]] = {}
+    rows_by_model: Dict[int, List[Dict[str, float]]] = defaultdict(list)
+    for task in tasks:
+        rows = task_rows(task)
+        if rows:
+            model_rows = rows_by_model[int(task["model_id"])]
+            spans.append((task, len(model_rows), len(model_rows) + len(rows)))
+            model_rows.extend(rows)
+        else:
+            outcomes[task.get("task_id")] = "no valid features after validation"
+    values_by_model: Dict[int, List[float]] = {}
+    stage_started = time.perf_counter()
+    for model_id, model_rows in rows_by_model.items():
+        try:
+            values_by_model[model_id] = score_rows(model_id, model_rows, db)
+        except (TypeError, ValueError):
+            # в пакете нашлись нечисловые значения — чистим строки и считаем заново
+            model_rows = [split_valid_invalid(row)[0] for row in model_rows]
+            values_by_model[model_id] = score_rows(model_id, model_rows, db)
+    STAGE_SECONDS.observe(time.perf_counter() - stage_started, stage="score")
 
-    user.balance -= price
-    db.add(Transaction(user_id=user_id, amount=price, type="withdraw"))
-    db.add(Prediction(user_id=user_id, model_id=model_id, prediction=pred_value, cost=price))
-    db.commit()
+    spans_by_user: Dict[int, List[tuple]] = defaultdict(list)
+    for span in spans:
+        spans_by_user[int(span[0]["user_id"])].append(span)
 
-    print(f"[worker] done: prediction={pred_value}, withdrawn={price}, new_balance={user.balance}")
+    # списания — условными UPDATE в порядке user_id (без взаимных блокировок воркеров),
+    # сразу перед вставкой предсказаний и commit; резервы задач снимаются тем же UPDATE
+    paid: List[tuple] = []
+    stage_started = time.perf_counter()
+    for user_id in sorted(spans_by_user):
+        user_spans = spans_by_user[user_id]
+        charges = [(float(task["price"]) * (end - start), task.get("task_id")) for task, start, end in user_spans]
+        flags, _ = capture(db, user_id, charges)
+        for span, (cost, task_id), ok in zip(user_spans, charges, flags):
+            if ok:
+                paid.append(span)
+            else:
+                outcomes[task_id] = _debit_failure(db, user_id, cost)
+                log.warning("task skipped", task_id=task_id, reason=outcomes[task_id])
+    STAGE_SECONDS.observe(time.perf_counter() - stage_started, stage="capture")
+
+    stage_started = time.perf_counter()
+    pred_rows = []
+    per_user: Dict[int, Tuple[int, float]] = {}
+    for task, start, end in paid:
+        model_id = int(task["model_id"])
+        price = float(task["price"])
+        user_id = int(task["user_id"])
+        n, cost = per_user.get(user_id, (0, 0.0))
+        per_user[user_id] = (n + end - start, cost + price * (end - start))
+        outcomes[task.get("task_id")] = None
+        pred_rows.extend(
+            {"user_id": user_id, "model_id": model_id, "prediction": f"{y:.4f}", "cost": price, "task_id": task.get("task_id")}
+            for y in values_by_model[model_id][start:end]
+        )
+    if pred_rows:
+        db.execute(insert(Prediction), pred_rows)
+        record_predictions(db, per_user)
+        notify_users(db, {int(task["user_id"]) for task, _, _ in paid})
+    finish_tasks(db, outcomes)
+    STAGE_SECONDS.observe(time.perf_counter() - stage_started, stage="write")
+    with STAGE_SECONDS.time(stage="commit"):
+        db.commit()
+    TASK_SECONDS.observe(time.perf_counter() - started, kind="batch")
+
+    # пачка — одна строка лога на все её задачи; выборка — по первой задаче
+    log.task(
+        "batch done", tasks[0].get("task_id"), tasks=len(tasks), predictions=len(pred_rows), users=len(by_user),
+        elapsed_ms=round((time.perf_counter() - started) * 1000, 2),
+    )
+
+
+def _prepare_database() -> None:
+    """
+    Схема и сводки по прошлой истории до первой записи этого процесса: строку
+    user_summaries, созданную инкрементом раньше backfill, он пропускает, и прошлая
+    история в ней так и не учлась бы. API делает то же при старте; параллельный
+    с ним CREATE TABLE может упасть — тогда повторяем.
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        if _stop_requested:
+            raise SystemExit(0)
+        try:
+            sync_schema()
+            ensure_summaries()
+            return
+        except Exception as e:
+            wait = min(10, attempt * 2)
+            log.warning("database not ready, retrying", error=repr(e), retry_in=wait)
+            time.sleep(wait)
 
 
 def _open_channel_with_retry():
@@ -97,46 +441,272 @@ def _open_channel_with_retry():
     attempt = 0
     while True:
         attempt += 1
+        if _stop_requested:
+            raise SystemExit(0)
         try:
-            print(f"[*] connecting to RabbitMQ {RABBIT_HOST} (attempt {attempt})")
+            log.info("connecting to RabbitMQ", host=RABBIT_HOST, attempt=attempt)
             conn = pika.BlockingConnection(params)
             ch = conn.channel()
-            ch.queue_declare(queue=QUEUE_NAME, durable=True)
-            print(f"[*] connected, listening on queue '{QUEUE_NAME}'")
+            for queue in LANE_QUEUES.values():
+                ch.queue_declare(queue=queue, durable=True)
+                declare_topology(ch, queue)
+            # публикации в очереди повторов/DLQ подтверждаются брокером до ack оригинала
+            ch.confirm_delivery()
+            log.info("connected", queues=list(LANE_QUEUES.values()))
             return ch, conn
         except AMQPConnectionError as e:
             wait = min(10, attempt * 2)
-            print(f"[!] AMQPConnectionError: {e}. retry in {wait}s")
+            log.warning("AMQPConnectionError, retrying", error=str(e), retry_in=wait)
             time.sleep(wait)
 
 
-def main():
-    print(f"[*] Worker boot. host={RABBIT_HOST} queue={QUEUE_NAME} user={RABBIT_USER}")
-    channel, connection = _open_channel_with_retry()
+def _parse(channel, queue: str, properties, body: bytes) -> Optional[dict]:
+    """JSON задачи; битое сообщение сразу уходит в dead-letter очередь — повтор ему не поможет."""
+    try:
+        task = json.loads(body.decode("utf-8"))
+    except Exception as e:
+        log.error("bad message, dead-lettered", queue=queue, error=str(e))
+        dead_letter(channel, queue, properties, body, f"bad message: {e!r}")
+        return None
+    if isinstance(task, dict) and is_replay(properties):
+        task["replay"] = True
+    return task
 
-    def callback(ch, method, properties, body):
-        try:
-            task = json.loads(body.decode("utf-8"))
-        except Exception as e:
-            print(f"[worker] bad message: {e}")
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-            return
 
+def _handle_one(channel, queue: str, method, properties, body: bytes, task: dict) -> None:
+    """
+    Ошибка не возвращает сообщение в голову очереди: копия уходит в очередь
+    ожидания со следующей задержкой (или в DLQ), оригинал подтверждается.
+    """
+    db = SessionLocal()
+    try:
+        handle_task(db, task)
+    except Exception as e:
+        db.rollback()
+        outcome = schedule_retry(channel, queue, properties, body, repr(e))
+        log.error("task error", task_id=task.get("task_id"), error=repr(e), attempt=attempt_of(properties), outcome=outcome)
+        if outcome == "dead" and task.get("task_id"):
+            try:
+                finish_tasks(db, {task["task_id"]: f"dead-lettered after {attempt_of(properties)} attempts: {e!r}"})
+                db.commit()
+            except Exception as status_error:
+                db.rollback()
+                log.error("cannot mark task failed", task_id=task["task_id"], error=repr(status_error))
+    finally:
+        db.close()
+    channel.basic_ack(delivery_tag=method.delivery_tag)
+
+
+def _process_batch(channel, batch: List[Tuple]) -> None:
+    """batch — (queue, method, properties, body); сообщения разных полос обрабатываются одной транзакцией."""
+    parsed = [
+        (queue, method, properties, body, _parse(channel, queue, properties, body))
+        for queue, method, properties, body in batch
+    ]
+    tasks = [task for *_, task in parsed if task is not None]
+
+    db = SessionLocal()
+    try:
+        if tasks:
+            handle_batch(db, tasks)
+        failed = None
+    except Exception as e:
+        db.rollback()
+        failed = e
+    finally:
+        db.close()
+
+    if failed is None:
+        # пачка собрана из разных полос вперемешку — ack по одному, а не multiple
+        for _, method, *_ in batch:
+            channel.basic_ack(delivery_tag=method.delivery_tag)
+        return
+    # одно «ядовитое» сообщение не должно валить всю пачку: обрабатываем по одному
+    log.warning("batch error, processing messages one by one", error=repr(failed), messages=len(batch))
+    for queue, method, properties, body, task in parsed:
+        if task is None:
+            channel.basic_ack(delivery_tag=method.delivery_tag)
+        else:
+            _handle_one(channel, queue, method, properties, body, task)
+
+
+def process_tasks(tasks: List[dict]) -> None:
+    """
+    Обработка без брокера (транспорты memory и inline в процессе API): тот же
+    handle_task/handle_batch, что и у воркера. Очередей повторов здесь нет —
+    задача, упавшая и при обработке по одной, сразу помечается failed.
+    """
+    db = SessionLocal()
+    try:
+        if len(tasks) > 1:
+            try:
+                handle_batch(db, tasks)
+                return
+            except Exception as e:
+                db.rollback()
+                log.warning("batch error, processing tasks one by one", error=repr(e), tasks=len(tasks))
+        for task in tasks:
+            try:
+                handle_task(db, task)
+            except Exception as e:
+                db.rollback()
+                log.error("task failed", task_id=task.get("task_id"), error=repr(e))
+                try:
+                    finish_tasks(db, {task.get("task_id"): f"failed: {e!r}"})
+                    db.commit()
+                except Exception as status_error:
+                    db.rollback()
+                    log.error("cannot mark task failed", task_id=task.get("task_id"), error=repr(status_error))
+    finally:
+        db.close()
+
+
+def callback(ch, method, properties, body, queue: str = QUEUE_NAME):
+    task = _parse(ch, queue, properties, body)
+    if task is None:
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+        return
+    _handle_one(ch, queue, method, properties, body, task)
+
+
+# выставляется по SIGTERM/SIGINT: воркер дообрабатывает текущее сообщение/пачку и выходит
+_stop_requested = False
+
+
+def request_stop(signum=None, frame=None) -> None:
+    # без логирования: сигнал может прервать поток, держащий lock очереди логов
+    global _stop_requested
+    _stop_requested = True
+
+
+def sweep_holds() -> None:
+    db = SessionLocal()
+    try:
+        released = sweep_expired_holds(db)
+        db.commit()
+        if released:
+            log.info("released expired balance holds", released=released)
+    except Exception as e:
+        db.rollback()
+        log.error("hold sweep failed", error=repr(e))
+    finally:
+        db.close()
+
+
+def _consume_lanes(channel, connection) -> None:
+    """
+    Каждая полоса — свой consumer со своим prefetch, поэтому batch-бэкфилл не
+    занимает окно интерактивной полосы. Полученные сообщения ждут в буферах
+    планировщика (до PREFETCH на полосу); пачка до BATCH_SIZE собирается weighted fair,
+    ждём не дольше BATCH_MAX_WAIT.
+    """
+    scheduler = LaneScheduler()
+    for lane, queue in LANE_QUEUES.items():
+        channel.basic_consume(
+            queue,
+            on_message_callback=lambda ch, method, properties, body, q=queue, lane_name=lane: scheduler.push(
+                lane_name, (q, method, properties, body), properties
+            ),
+        )
+
+    deadline: Optional[float] = None
+    next_report = time.monotonic() + LANE_STATS_INTERVAL
+    next_sweep = time.monotonic()
+    while not _stop_requested:
+        if deadline is not None:
+            timeout = max(0.0, deadline - time.monotonic())
+        else:
+            # в буфере ещё есть сообщения — только забираем новые доставки, не ждём их
+            timeout = 0.0 if len(scheduler) else 1.0
+        connection.process_data_events(time_limit=timeout)
+        now = time.monotonic()
+        if LANE_STATS_INTERVAL > 0 and now >= next_report:
+            log.info("lanes", **scheduler.stats(reset=True))
+            next_report = now + LANE_STATS_INTERVAL
+        if HOLD_SWEEP_INTERVAL > 0 and now >= next_sweep:
+            sweep_holds()
+            next_sweep = now + HOLD_SWEEP_INTERVAL
+        if not len(scheduler):
+            deadline = None
+            continue
+        if deadline is None:
+            deadline = now + BATCH_MAX_WAIT
+        if BATCH_SIZE > 1 and len(scheduler) < BATCH_SIZE and now < deadline:
+            continue
+        batch = [item for _, item in scheduler.next_batch(BATCH_SIZE)]
+        if BATCH_SIZE > 1:
+            _process_batch(channel, batch)
+        else:
+            queue, method, properties, body = batch[0]
+            callback(channel, method, properties, body, queue=queue)
+        deadline = None
+    # полученные, но не обработанные сообщения вернутся в очередь при закрытии соединения
+    log.info("stop requested, draining", buffered=len(scheduler))
+
+
+def _warm_models() -> None:
+    """MODEL_WARMUP=all или "1,2": загрузить артефакты до начала потребления очереди."""
+    warm_all, model_ids = parse_warmup(os.getenv("MODEL_WARMUP", ""))
+    if warm_all:
         db = SessionLocal()
         try:
-            handle_task(db, task)
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-        except Exception as e:
-            print(f"[worker] error: {e}. requeue")
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+            model_ids = [mid for (mid,) in db.query(MLModel.id).filter(MLModel.artifact_path.isnot(None))]
         finally:
             db.close()
+    if model_ids:
+        get_registry().warm(model_ids)
+
+
+def _collect_metrics():
+    """Кэши процесса-воркера (и API, если задачи выполняются в нём — транспорты memory/inline)."""
+    for cache, data in (("model_registry", get_registry().stats()), ("result", result_cache.stats())):
+        yield from stats_samples("ml_cache", data, cache=cache)
+        ratio = hit_ratio(data, hits=("hits", "shared_hits"))
+        if ratio is not None:
+            yield "ml_cache_hit_ratio", {"cache": cache}, ratio
+
+
+metrics_registry.add_collector(_collect_metrics)
+
+
+def _start_metrics_server(slot: int) -> None:
+    if METRICS_PORT <= 0:
+        return
+    try:
+        start_http_server(METRICS_PORT + slot)
+        log.info("metrics server started", port=METRICS_PORT + slot)
+    except OSError as e:
+        log.warning("metrics port unavailable", port=METRICS_PORT + slot, error=str(e))
+
+
+def _setup_result_cache() -> None:
+    # новая версия артефакта — записи старой версии больше не нужны
+    get_registry().add_reload_listener(lambda model_id, artifact: result_cache.invalidate(model_id))
+    if result_cache.shared and not ensure_shared_table(engine):
+        log.warning("RESULT_CACHE_SHARED needs Postgres, using in-process cache only")
+        result_cache.shared = False
 
-    channel.basic_qos(prefetch_count=1)
-    channel.basic_consume(queue=QUEUE_NAME, on_message_callback=callback, auto_ack=False)
+
+def main(slot: int = 0) -> None:
+    """Один процесс-потребитель: свой канал RabbitMQ и свой пул соединений к БД; slot — номер у супервизора."""
+    setup_logging()
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    # пул соединений, унаследованный от родителя, не используем
+    engine.dispose()
+
+    log.info("worker boot", slot=slot, host=RABBIT_HOST, queues=list(LANE_QUEUES.values()), user=RABBIT_USER, batch_size=BATCH_SIZE, prefetch=PREFETCH)
+    _start_metrics_server(slot)
+    _prepare_database()
+    _setup_result_cache()
+    _warm_models()
+    channel, connection = _open_channel_with_retry()
+    # prefetch на каждого consumer'а (global_qos=False), то есть на каждую полосу
+    channel.basic_qos(prefetch_count=PREFETCH)
     try:
-        channel.start_consuming()
-    except KeyboardInterrupt:
+        _consume_lanes(channel, connection)
+    finally:
+        # неподтверждённые prefetch-сообщения вернутся в очередь при закрытии соединения
         try:
             channel.stop_consuming()
         except Exception:
@@ -145,6 +715,7 @@ def main():
             connection.close()
         except Exception:
             pass
+        log.info("worker stopped")
 
 
 if __name__ == "__main__":